@@ -4,52 +4,545 @@ Build all PDFs for the Deep Learning & Transformers textbook.
   1. main_pro.pdf          — full book (standard)
   2. main_pro_memoir.pdf   — full book (memoir class)
   3. Per-chapter PDFs      — chapters/DeepLearningTech-XX-Title.pdf
+
+The full books (BOOK_VARIANTS) and then the chapter PDFs are built
+concurrently (--jobs N, default: CPU count), each in its own directory under
+.chapter_build/ so their aux files never collide. Finished PDFs are moved
+into place atomically.
+
+PDFs whose inputs (as recorded by pdflatex -recorder) are unchanged since
+the last build are skipped; --force rebuilds everything.
+
+With --split, chapter PDFs are instead sliced out of main_pro.pdf (page
+ranges from its PDF outline, via qpdf) behind a generated title page, so
+cross-references keep the numbers from the full book.
+
+Chapter wrappers import the labels of main_pro.aux (xr-hyper), minus the
+chapter's own, so references into other chapters show the full book's
+numbers and links within the chapter stay in the chapter PDF.
+
+Chapter jobs start from a format file with chapter_preamble.tex already
+loaded (dumped once per preamble hash with mylatexformat); --no-format
+compiles the preamble in every job instead.
+
+Before anything is compiled, chapters/*.tex are checked for unbalanced
+braces and \begin/\end pairs (latex_preflight.py); --no-preflight skips it.
+
+Each job's final .log is parsed (errors with file:line, undefined
+references, over/underfull boxes, pages, fonts) and, with the wall and CPU
+time of every pass, written to .chapter_build/build_report.json. Every
+external tool run (pdflatex, qpdf) goes through html-build/tool_runner.py,
+which adds its wall/CPU time and peak RSS to the report; the most expensive
+runs are listed at the end.
+
+TikZ diagrams are typeset once each into .chapter_build/externalized/tikz/
+and every document includes those PDFs instead of its own copy of the
+diagram; --no-externalize typesets them inline again. The PDFs are set in
+main_pro's 11pt Computer Modern, so a document with another class font size
+or font packages (main_pro_memoir.tex: 10pt, lmodern) keeps its diagrams
+inline.
 """
 
 import os
+import re
+import glob
+import hashlib
 import subprocess
 import shutil
 import time
+import argparse
+import json
+import tempfile
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BUILD_DIR = os.path.join(SCRIPT_DIR, ".chapter_build")
 CHAPTERS_DIR = os.path.join(SCRIPT_DIR, "chapters")
 PREAMBLE_FILE = os.path.join(SCRIPT_DIR, "chapter_preamble.tex")
+BUILD_STATE_FILE = os.path.join(SCRIPT_DIR, ".pdf_build_state.json")
+BUILD_REPORT_FILE = os.path.join(BUILD_DIR, "build_report.json")
+# Full-book variants, each built in BUILD_DIR/<name>/ and moved to SCRIPT_DIR
+BOOK_VARIANTS = ["main_pro.tex", "main_pro_memoir.tex"]
+BOOK_AUX = os.path.join(BUILD_DIR, "main_pro", "main_pro.aux")
+FORMATS_DIR = os.path.join(BUILD_DIR, "formats")
 
-os.makedirs(BUILD_DIR, exist_ok=True)
+# Copies of chapters/*.tex with their diagrams replaced by \includegraphics
+# of one PDF per diagram; both directories go first on TEXINPUTS
+EXTERNALIZED_DIR = os.path.join(BUILD_DIR, "externalized")
+TIKZ_PDF_DIR = os.path.join(EXTERNALIZED_DIR, "tikz")
 
+# Diagram extraction and the standalone preamble are shared with the HTML build
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "html-build"))
+from convert_to_html import (TIKZ_STANDALONE_PREAMBLE, extract_tikz_diagrams, pdflatex_version,
+                             tikz_pdflatex_command, tikz_preamble_format)
+from latex_preflight import check_sources
+from tool_runner import run_tool, cpu_seconds, top_runs, tool_runs, usage_by_stage, describe_run, format_run
+
+# main_pro's font size and no border, so a diagram drops into the page as if inline
+TIKZ_PDF_PREAMBLE = TIKZ_STANDALONE_PREAMBLE.replace(
+    r"\documentclass[tikz,border=2pt]{standalone}", r"\documentclass[11pt,tikz,border=0pt]{standalone}", 1)
+
+# Packages that change the text font or its encoding; a document loading any
+# of them (or set in another size) doesn't match TIKZ_PDF_PREAMBLE's 11pt
+# Computer Modern, and keeps its diagrams inline
+FONT_PACKAGES = {"fontenc", "lmodern", "times", "mathptmx", "newtxtext", "palatino", "mathpazo",
+                 "tgpagella", "tgtermes", "libertine", "charter", "fourier", "kpfonts", "fontspec"}
+
+# Files one pdflatex pass writes and the next one reads back
+RERUN_FILE_EXTENSIONS = (".aux", ".toc", ".out", ".lof", ".lot", ".loa")
+MAX_PASSES = 4
+
+# Log messages LaTeX and its packages print when another pass is needed
+RERUN_LOG_RE = re.compile(r"Rerun to get|Label\(s\) may have changed|Please rerun LaTeX")
+
+# What parse_pdflatex_log picks out of a log; runs use -file-line-error, and
+# max_print_line is raised so that paths and messages are not wrapped
+FILE_LINE_ERROR_RE = re.compile(r"^(.+?\.(?:tex|sty|cls|cfg|def|aux|toc)):(\d+): (.*)$", re.MULTILINE)
+BANG_ERROR_RE = re.compile(r"^! (.*)$(?:[^!]*?^l\.(\d+))?", re.MULTILINE)
+UNDEFINED_RE = re.compile(r"(Reference|Citation) `([^']*)' on page \d+ undefined")
+BAD_BOX_RE = re.compile(r"^(Overfull|Underfull) \\[hv]box", re.MULTILINE)
+OUTPUT_RE = re.compile(r"^Output written on .*? \((\d+) pages?", re.MULTILINE)
+FONT_FILE_RE = re.compile(r"<([^<>\s]+\.(?:pfb|otf|ttf))>")
+
+
+def auxiliary_state(output_dir, jobname):
+    """Hash each file that feeds the next pass: {relative path: sha256}"""
+    paths = [os.path.join(output_dir, jobname + ext) for ext in RERUN_FILE_EXTENSIONS]
+    # \include writes one .aux per included chapter
+    paths += sorted(glob.glob(os.path.join(output_dir, "chapters", "*.aux")))
+    state = {}
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                state[os.path.relpath(path, output_dir)] = hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            pass
+    return state
 
-def build_main_pdf(tex_name):
-    """Compile a main .tex file (twice for TOC/refs). Returns True on success."""
-    tex_path = os.path.join(SCRIPT_DIR, tex_name)
-    pdf_name = tex_name.replace(".tex", ".pdf")
-    if not os.path.exists(tex_path):
-        print(f"  SKIP: {tex_name} not found")
-        return False
 
-    print(f"Building: {pdf_name} ... ", end="", flush=True)
+def log_requests_rerun(output_dir, jobname):
+    """True/False from the log's rerun warnings; None if there is no log"""
+    try:
+        with open(os.path.join(output_dir, jobname + ".log"), "r", errors="replace") as f:
+            return bool(RERUN_LOG_RE.search(f.read()))
+    except FileNotFoundError:
+        return None
 
-    # Remove old PDF so we can detect fresh creation
-    old_pdf = os.path.join(SCRIPT_DIR, pdf_name)
-    if os.path.exists(old_pdf):
-        os.remove(old_pdf)
 
-    for _ in range(2):
-        subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", tex_path],
+def build_preamble_format(preamble, prefix):
+    """Dump a pdflatex format with the preamble loaded; return its name or None.
+
+    The format is named after a hash of the preamble, so editing the preamble
+    makes a new one. Documents compiled with -fmt=<name> skip their own
+    preamble (mylatexformat gobbles everything up to \\begin{document}, or
+    up to \\endofdump for packages that can't be dumped).
+    """
+    name = f"{prefix}-{hashlib.sha256(preamble.encode('utf-8')).hexdigest()[:16]}"
+    if os.path.exists(os.path.join(FORMATS_DIR, name + ".fmt")):
+        return name
+
+    os.makedirs(FORMATS_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=FORMATS_DIR) as tmpdir:
+        source = os.path.join(tmpdir, name + ".tex")
+        with open(source, "w") as f:
+            f.write(preamble + "\n\\begin{document}\n\\end{document}\n")
+        run_tool(
+            ["pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+             f"-output-directory={tmpdir}", "&pdflatex", "mylatexformat.ltx", source],
+            {"stage": "format", "format": name},
             cwd=SCRIPT_DIR,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
+        built = os.path.join(tmpdir, name + ".fmt")
+        if not os.path.exists(built):
+            return None
+        os.replace(built, os.path.join(FORMATS_DIR, name + ".fmt"))
 
-    if os.path.exists(old_pdf):
-        size_mb = os.path.getsize(old_pdf) / (1024 * 1024)
-        print(f"OK ({size_mb:.1f} MB)")
-        return True
-    else:
-        print(f"FAILED (check {tex_name.replace('.tex', '.log')})")
+    # Formats of earlier preambles with this prefix are never used again; each
+    # preamble variant (with or without xr-hyper) has its own prefix
+    for old in glob.glob(os.path.join(FORMATS_DIR, f"{prefix}-*.fmt")):
+        if re.fullmatch(rf"{re.escape(prefix)}-[0-9a-f]{{16}}\.fmt", os.path.basename(old)) \
+                and os.path.basename(old) != name + ".fmt":
+            os.remove(old)
+    return name
+
+
+def tikz_pdf_key(tikz_code):
+    """Content address of an externalized diagram: its code, the preamble and pdflatex"""
+    h = hashlib.sha256()
+    for part in (TIKZ_PDF_PREAMBLE, tikz_code, pdflatex_version() or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def compile_tikz_pdf(tikz_code, key, fmt=None):
+    """Typeset one diagram into TIKZ_PDF_DIR/<key>.pdf. Returns True on success.
+
+    A failed diagram leaves <key>.failed (the end of its log) behind, so later
+    builds keep it inline without trying again until its key changes.
+    """
+    with tempfile.TemporaryDirectory(dir=TIKZ_PDF_DIR) as tmpdir:
+        with open(os.path.join(tmpdir, "diagram.tex"), "w") as f:
+            f.write(TIKZ_PDF_PREAMBLE + "\\begin{document}\n" + tikz_code + "\n\\end{document}\n")
+        command, env = tikz_pdflatex_command("diagram.tex", fmt)
+        try:
+            run_tool(command, {"stage": "tikz-pdf", "diagram": key[:12]}, cwd=tmpdir, env=env,
+                     capture_output=True, timeout=120)
+        except subprocess.TimeoutExpired:
+            pass
+        built = os.path.join(tmpdir, "diagram.pdf")
+        if os.path.exists(built):
+            os.replace(built, os.path.join(TIKZ_PDF_DIR, key + ".pdf"))
+            return True
+        try:
+            with open(os.path.join(tmpdir, "diagram.log"), "r", errors="replace") as f:
+                log_tail = f.read().splitlines()[-20:]
+        except FileNotFoundError:
+            log_tail = ["pdflatex wrote no log"]
+        with open(os.path.join(TIKZ_PDF_DIR, key + ".failed"), "w") as f:
+            f.write("\n".join(log_tail) + "\n")
         return False
 
+
+def write_if_changed(path, text):
+    """Atomically replace path with text unless it already holds exactly that"""
+    try:
+        with open(path, "r") as f:
+            if f.read() == text:
+                return
+    except FileNotFoundError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def externalize_tikz(jobs=1, retry_failed=False):
+    """Compile every chapter diagram once and write the externalized chapter copies.
+
+    Diagrams whose PDF is current are not compiled again; one that fails
+    stays inline in its chapter. Returns (compiled, cached, failed) counts.
+    """
+    chapters_out = os.path.join(EXTERNALIZED_DIR, "chapters")
+    os.makedirs(chapters_out, exist_ok=True)
+    os.makedirs(TIKZ_PDF_DIR, exist_ok=True)
+
+    sources = {}
+    diagrams = {}
+    for path in sorted(glob.glob(os.path.join(CHAPTERS_DIR, "*.tex"))):
+        name = os.path.basename(path)
+        with open(path, "r") as f:
+            sources[name] = f.read()
+        for tikz_code, _ in extract_tikz_diagrams(sources[name], name):
+            diagrams.setdefault(tikz_code, tikz_pdf_key(tikz_code))
+
+    if retry_failed:
+        for marker in glob.glob(os.path.join(TIKZ_PDF_DIR, "*.failed")):
+            os.remove(marker)
+    todo = {code: key for code, key in diagrams.items()
+            if not os.path.exists(os.path.join(TIKZ_PDF_DIR, key + ".pdf"))
+            and not os.path.exists(os.path.join(TIKZ_PDF_DIR, key + ".failed"))}
+    compiled = 0
+    if todo:
+        fmt = tikz_preamble_format(TIKZ_PDF_PREAMBLE)
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            compiled = sum(pool.map(lambda item: compile_tikz_pdf(item[0], item[1], fmt), todo.items()))
+
+    # Chapters with at least one externalized diagram get a copy; the rest
+    # (and copies left by an earlier build) must not shadow the originals
+    for name, text in sources.items():
+        copy_path = os.path.join(chapters_out, name)
+        externalized = text
+        for tikz_code, key in diagrams.items():
+            if tikz_code in externalized and os.path.exists(os.path.join(TIKZ_PDF_DIR, key + ".pdf")):
+                externalized = externalized.replace(tikz_code, f"\\includegraphics{{{key}.pdf}}")
+        if externalized != text:
+            write_if_changed(copy_path, externalized)
+        elif os.path.exists(copy_path):
+            os.remove(copy_path)
+    for copy_path in glob.glob(os.path.join(chapters_out, "*.tex")):
+        if os.path.basename(copy_path) not in sources:
+            os.remove(copy_path)
+
+    # Diagrams no chapter uses any more
+    keys = set(diagrams.values())
+    for path in glob.glob(os.path.join(TIKZ_PDF_DIR, "*.pdf")) + glob.glob(os.path.join(TIKZ_PDF_DIR, "*.failed")):
+        if os.path.splitext(os.path.basename(path))[0] not in keys:
+            os.remove(path)
+
+    failed = sum(1 for key in diagrams.values() if not os.path.exists(os.path.join(TIKZ_PDF_DIR, key + ".pdf")))
+    return compiled, len(diagrams) - len(todo), failed
+
+
+def document_font(preamble):
+    """(class font size, sorted font packages) a document's text is set in"""
+    match = re.search(r"^\\documentclass(?:\[([^\]]*)\])?", preamble, re.MULTILINE)
+    options = [option.strip() for option in (match.group(1) or "").split(",")] if match else []
+    size = next((option for option in options if re.fullmatch(r"\d+pt", option)), "10pt")
+    packages = set()
+    for names in re.findall(r"^\\usepackage(?:\[[^\]]*\])?\{([^}]*)\}", preamble, re.MULTILINE):
+        packages.update(name.strip() for name in names.split(","))
+    return size, sorted(packages & FONT_PACKAGES)
+
+
+def matches_externalized_font(preamble):
+    """True if the externalized diagram PDFs are set in this document's font and size"""
+    return document_font(preamble) == document_font(TIKZ_PDF_PREAMBLE)
+
+
+def uses_externalized(entry):
+    """True if a build state entry's inputs include externalized copies or diagram PDFs"""
+    prefix = os.path.relpath(EXTERNALIZED_DIR, SCRIPT_DIR) + os.sep
+    return bool(entry) and any(path.startswith(prefix) for path in entry["inputs"])
+
+
+def texinputs_with(*dirs):
+    """TEXINPUTS that searches dirs first, then the usual path"""
+    # Trailing separator (from an unset TEXINPUTS): then the default search path
+    return os.pathsep.join(list(dirs) + [os.environ.get("TEXINPUTS", "")])
+
+
+def publish_pdf(built_pdf, final_pdf, attempts=5):
+    """Move a finished PDF into place atomically; return None or an error message.
+
+    Readers of final_pdf see either the previous PDF or the new one, never a
+    partial file. A viewer holding the old file open (which blocks replacing
+    it on Windows) gets a few retries before the build reports it.
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_pdf), suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(built_pdf, tmp_path)
+    except OSError as error:
+        return f"could not write {os.path.basename(final_pdf)}: {error.strerror}"
+    for attempt in range(attempts):
+        try:
+            os.replace(tmp_path, final_pdf)
+            return None
+        except PermissionError as error:
+            if attempt == attempts - 1:
+                os.remove(tmp_path)
+                return f"could not replace {os.path.basename(final_pdf)}: {error.strerror}"
+            time.sleep(0.5)
+
+
+def parse_pdflatex_log(log_path):
+    """Structured summary of a pdflatex .log, or None if there is no log.
+
+    {"errors": [{"file", "line", "message"}], "undefined_references": [...],
+     "undefined_citations": [...], "overfull_boxes": n, "underfull_boxes": n,
+     "pages": n or None, "fonts": [...]}
+    """
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            log = f.read()
+    except FileNotFoundError:
+        return None
+    errors = [{"file": path, "line": int(line), "message": message.strip()}
+              for path, line, message in FILE_LINE_ERROR_RE.findall(log)]
+    # Errors -file-line-error can't place (fatal ones, errors in the format)
+    errors += [{"file": None, "line": int(line) if line else None, "message": message.strip()}
+               for message, line in BANG_ERROR_RE.findall(log)]
+    undefined = {"Reference": set(), "Citation": set()}
+    for kind, name in UNDEFINED_RE.findall(log):
+        undefined[kind].add(name)
+    boxes = BAD_BOX_RE.findall(log)
+    pages = OUTPUT_RE.search(log)
+    return {
+        "errors": errors,
+        "undefined_references": sorted(undefined["Reference"]),
+        "undefined_citations": sorted(undefined["Citation"]),
+        "overfull_boxes": boxes.count("Overfull"),
+        "underfull_boxes": boxes.count("Underfull"),
+        "pages": int(pages.group(1)) if pages else None,
+        "fonts": sorted({os.path.basename(path) for path in FONT_FILE_RE.findall(log)}),
+    }
+
+
+def job_report(output_dir, jobname, reasons, timings):
+    """Report entry for one built document: its passes and what its final log says"""
+    passes = [{"reason": reason, "wall_seconds": round(wall, 3),
+               "cpu_seconds": None if cpu is None else round(cpu, 3)}
+              for reason, (wall, cpu) in zip(reasons, timings)]
+    return {"passes": passes, "log": parse_pdflatex_log(os.path.join(output_dir, jobname + ".log"))}
+
+
+def run_pdflatex(tex_path, output_dir, jobname, max_passes=MAX_PASSES, fmt=None, texinputs=None,
+                 timings=None, tags=None):
+    """Run pdflatex until its .aux/.toc/.out files stop changing.
+
+    A pass whose auxiliary files come out identical to the ones it read saw
+    final cross-references, so that is the last pass. LaTeX checks the labels
+    of the .aux files itself at the end of a pass and asks for a rerun when
+    they changed, so a changed .aux alone doesn't force one. With .aux files
+    left by an earlier build, or labels imported from main_pro.aux, one pass
+    is usually enough. fmt names a
+    format from build_preamble_format to start from; texinputs, if given,
+    replaces TEXINPUTS. Returns one reason per
+    pass run, e.g. ["no auxiliary files yet", "changed: x.aux"]; if timings
+    is a list, (wall, CPU) seconds of each pass are appended to it. tags
+    label the passes in the tool usage records.
+    """
+    command = ["pdflatex", "-interaction=nonstopmode", "-recorder", "-file-line-error"]
+    # Unwrapped log lines, for parse_pdflatex_log
+    env = dict(os.environ, max_print_line="10000")
+    if fmt:
+        command.append(f"-fmt={fmt}")
+        # Trailing separator: search FORMATS_DIR, then the default format path
+        env["TEXFORMATS"] = FORMATS_DIR + os.pathsep + os.environ.get("TEXFORMATS", "")
+    if texinputs is not None:
+        env["TEXINPUTS"] = texinputs
+    if output_dir != SCRIPT_DIR:
+        command.append(f"-output-directory={output_dir}")
+    command.append(tex_path)
+
+    before = auxiliary_state(output_dir, jobname)
+    reasons = ["starting from the last build's auxiliary files" if before else "no auxiliary files yet"]
+    while True:
+        # pdflatex often returns non-zero on warnings, so callers check for the PDF instead
+        result = run_tool(command, dict(tags or {}, document=jobname, run=len(reasons)),
+                          cwd=SCRIPT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if timings is not None:
+            timings.append((result.usage["wall_seconds"], cpu_seconds(result.usage)))
+        after = auxiliary_state(output_dir, jobname)
+        changed = sorted(name for name in before.keys() | after.keys() if before.get(name) != after.get(name))
+        rerun_requested = log_requests_rerun(output_dir, jobname)
+        if rerun_requested is False:
+            changed = [name for name in changed if not name.endswith(".aux")]
+        if not changed and not rerun_requested:
+            return reasons
+        if len(reasons) >= max_passes:
+            reasons.append(f"still changing after {max_passes} passes, giving up")
+            return reasons
+        if changed:
+            shown = ", ".join(changed[:3]) + (f" (+{len(changed) - 3} more)" if len(changed) > 3 else "")
+            reasons.append(f"changed: {shown}")
+        else:
+            reasons.append("log asks for a rerun")
+        before = after
+
+
+def recorded_inputs(fls_path):
+    """Files a pdflatex run read, from its -recorder .fls file.
+
+    Files the run also wrote (.aux, .toc, ...) are left out: they are
+    products of the build, not inputs to it.
+    """
+    pwd = SCRIPT_DIR
+    inputs = set()
+    outputs = set()
+    with open(fls_path, "r", errors="replace") as f:
+        for line in f:
+            kind, _, path = line.rstrip("\n").partition(" ")
+            if kind == "PWD":
+                pwd = path
+            elif kind == "INPUT":
+                inputs.add(os.path.normpath(os.path.join(pwd, path)))
+            elif kind == "OUTPUT":
+                outputs.add(os.path.normpath(os.path.join(pwd, path)))
+    return sorted(inputs - outputs)
+
+
+def input_fingerprint(path):
+    """sha256 of a project file; size and mtime of a TeX distribution file"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not path.startswith(SCRIPT_DIR + os.sep):
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def record_build(output_dir, jobname, pdf_path):
+    """State entry for a finished build: the PDF it produced and its inputs"""
+    inputs = {}
+    for path in recorded_inputs(os.path.join(output_dir, jobname + ".fls")):
+        key = os.path.relpath(path, SCRIPT_DIR) if path.startswith(SCRIPT_DIR + os.sep) else path
+        inputs[key] = input_fingerprint(path)
+    return {"pdf": os.path.relpath(pdf_path, SCRIPT_DIR), "inputs": inputs}
+
+
+def is_up_to_date(entry):
+    """True if the entry's PDF exists and none of its recorded inputs changed"""
+    if not entry or not os.path.exists(os.path.join(SCRIPT_DIR, entry["pdf"])):
+        return False
+    return all(input_fingerprint(os.path.join(SCRIPT_DIR, path)) == fingerprint
+               for path, fingerprint in entry["inputs"].items())
+
+
+def load_build_state():
+    """Return {job: state entry} from the last build, or {}"""
+    try:
+        with open(BUILD_STATE_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_build_state(state):
+    fd, tmp_path = tempfile.mkstemp(dir=SCRIPT_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, BUILD_STATE_FILE)
+
+
+def describe_passes(reasons):
+    """Pass count for the log line, e.g. "2 passes" """
+    passes = sum(1 for reason in reasons if not reason.startswith("still changing"))
+    return f"{passes} pass{'es' if passes != 1 else ''}"
+
+
+def build_main_pdf(tex_name, max_passes=MAX_PASSES, entry=None, texinputs=None):
+    """Compile a full-book .tex file in BUILD_DIR/<name>/ until its TOC/refs are stable.
+
+    entry is the book's build state from the last run (None to force a
+    build); texinputs is passed on to run_pdflatex. Runs on a worker thread,
+    so it returns its status instead of printing: (pdf_name, ok, seconds,
+    message, pass reasons, new state entry, report entry or None if skipped).
+    """
+    jobname = tex_name[:-len(".tex")]
+    pdf_name = jobname + ".pdf"
+    started = time.perf_counter()
+    tex_path = os.path.join(SCRIPT_DIR, tex_name)
+    if not os.path.exists(tex_path):
+        return pdf_name, False, 0.0, f"SKIP ({tex_name} not found)", [], None, None
+
+    final_pdf = os.path.join(SCRIPT_DIR, pdf_name)
+    if is_up_to_date(entry):
+        return pdf_name, True, time.perf_counter() - started, "up to date (skipped)", [], entry, None
+
+    # \include writes chapters/*.aux under the output directory, which must exist
+    job_dir = os.path.join(BUILD_DIR, jobname)
+    os.makedirs(os.path.join(job_dir, "chapters"), exist_ok=True)
+
+    # Remove the PDF of an earlier run so we can detect fresh creation
+    built_pdf = os.path.join(job_dir, pdf_name)
+    if os.path.exists(built_pdf):
+        os.remove(built_pdf)
+
+    timings = []
+    reasons = run_pdflatex(tex_path, job_dir, jobname, max_passes, texinputs=texinputs, timings=timings,
+                           tags={"stage": "book"})
+    report = job_report(job_dir, jobname, reasons, timings)
+
+    seconds = time.perf_counter() - started
+    if not os.path.exists(built_pdf):
+        return pdf_name, False, seconds, f"FAILED (see {job_dir}/{jobname}.log)", reasons, None, report
+    error = publish_pdf(built_pdf, final_pdf)
+    if error:
+        message = f"FAILED ({error}; built PDF left in {job_dir})"
+        return pdf_name, False, seconds, message, reasons, None, report
+    size_mb = os.path.getsize(final_pdf) / (1024 * 1024)
+    entry = record_build(job_dir, jobname, final_pdf)
+    message = f"OK ({size_mb:.1f} MB, {describe_passes(reasons)})"
+    return pdf_name, True, seconds, message, reasons, entry, report
+
 CHAPTERS = [
     ("chapter01_linear_algebra",         "01-Linear-Algebra"),
     ("chapter02_calculus_optimization",   "02-Calculus-and-Optimization"),
@@ -87,44 +580,80 @@ CHAPTERS = [
     ("chapter34_dsl_agents",              "34-DSL-and-Agents"),
 ]
 
-# ── Step 1: Build full-book PDFs ─────────────────────────────────────────
-print("=" * 64)
-print("  FULL BOOK PDFs")
-print("=" * 64)
 
-main_ok = build_main_pdf("main_pro.tex")
-memoir_ok = build_main_pdf("main_pro_memoir.tex")
+def with_external_labels(preamble):
+    """Load xr-hyper right after \\documentclass (it must come before hyperref).
 
-# ── Step 2: Build per-chapter PDFs ──────────────────────────────────────
-print()
-print("=" * 64)
-print("  INDIVIDUAL CHAPTER PDFs")
-print("=" * 64)
+    Returns None if the preamble has no \\documentclass line.
+    """
+    match = re.search(r"^\\documentclass.*$", preamble, re.MULTILINE)
+    if not match:
+        return None
+    return preamble[:match.end()] + "\n\\usepackage{xr-hyper}" + preamble[match.end():]
 
-# Read the shared preamble
-with open(PREAMBLE_FILE, "r") as f:
-    preamble = f.read()
 
-total = 0
-success = 0
-fail = 0
+def write_book_labels(basename, path):
+    """Write the \\newlabel lines of main_pro.aux, minus the chapter's own, to path.
 
-for basename, title in CHAPTERS:
-    tex_path = os.path.join(CHAPTERS_DIR, f"{basename}.tex")
-    if not os.path.exists(tex_path):
-        print(f"  SKIP: {basename}.tex not found")
-        continue
+    main_pro \\include's every chapter, so a chapter's labels are in its own
+    chapters/<basename>.aux of the book build. Importing them as well would
+    define each of them twice, and on a first pass turn the chapter's links
+    to itself into links into main_pro.pdf. The file is only rewritten when
+    its content changes.
+    """
+    book_dir = os.path.dirname(BOOK_AUX)
+    own_aux = os.path.join("chapters", basename + ".aux")
+    labels = []
+
+    def collect(aux_path):
+        try:
+            with open(aux_path, "r", errors="replace") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            match = re.match(r"\\@input\{(.+)\}", line)
+            if match:
+                if os.path.normpath(match.group(1)) != own_aux:
+                    collect(os.path.join(book_dir, match.group(1)))
+            elif line.startswith("\\newlabel{"):
+                labels.append(line)
 
+    collect(BOOK_AUX)
+    text = "".join(labels)
+    try:
+        with open(path, "r") as f:
+            if f.read() == text:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def build_chapter_pdf(basename, title, preamble, max_passes=MAX_PASSES, entry=None, fmt=None,
+                      external_labels=False, texinputs=None):
+    """Build one standalone chapter PDF in its own job directory.
+
+    entry is the chapter's build state from the last run (None to force a
+    build); fmt is the preamble format to start from, if any. With
+    external_labels, preamble comes from with_external_labels and the labels
+    of main_pro.aux are imported. texinputs is passed on to run_pdflatex. Runs
+    on a worker thread, so it returns its status instead of printing, shaped
+    like build_main_pdf's.
+    """
     chap_num = title.split("-")[0]           # e.g. "01"
     chap_counter = int(chap_num) - 1
     pretty_title = title.split("-", 1)[1].replace("-", " ")
     pdf_name = f"DeepLearningTech-{title}.pdf"
-    total += 1
+    started = time.perf_counter()
 
-    print(f"Building: {pdf_name} ... ", end="", flush=True)
+    # One output directory per chapter, so concurrent jobs never share aux files
+    job_dir = os.path.join(BUILD_DIR, basename)
+    os.makedirs(job_dir, exist_ok=True)
 
     # Create standalone wrapper .tex
-    wrapper_path = os.path.join(BUILD_DIR, f"standalone_{basename}.tex")
+    wrapper_path = os.path.join(job_dir, f"standalone_{basename}.tex")
     doc_body = f"""
 \\title{{Deep Learning and Transformers\\\\\\large Chapter {chap_num}: {pretty_title}}}
 \\author{{[Author Names]}}
@@ -136,37 +665,449 @@ for basename, title in CHAPTERS:
 \\input{{chapters/{basename}}}
 \\end{{document}}
 """
+    if external_labels:
+        # After the dump point: the labels must come from the current main_pro.aux,
+        # not from the format. Cross-chapter links point into the full book.
+        labels_path = os.path.join(job_dir, "book_labels.aux")
+        write_book_labels(basename, labels_path)
+        labels_name = os.path.relpath(labels_path, SCRIPT_DIR)[:-len(".aux")]
+        doc_body = f"""\\csname endofdump\\endcsname
+\\externaldocument{{{labels_name}}}[../main_pro.pdf]
+""" + doc_body
     with open(wrapper_path, "w") as f:
         f.write(preamble + "\n" + doc_body)
 
-    # Compile twice (for cross-references)
-    # pdflatex often returns non-zero on warnings, so we check for the PDF instead
-    for _ in range(2):
-        subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode",
-             f"-output-directory={BUILD_DIR}", wrapper_path],
-            cwd=SCRIPT_DIR,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+    if is_up_to_date(entry):
+        return pdf_name, True, time.perf_counter() - started, "up to date (skipped)", [], entry, None
 
-    built_pdf = os.path.join(BUILD_DIR, f"standalone_{basename}.pdf")
+    # Remove the PDF of an earlier run so we can detect fresh creation
+    built_pdf = os.path.join(job_dir, f"standalone_{basename}.pdf")
     if os.path.exists(built_pdf):
-        shutil.copy2(built_pdf, os.path.join(CHAPTERS_DIR, pdf_name))
-        print("OK")
-        success += 1
+        os.remove(built_pdf)
+
+    # Compile until cross-references are stable
+    timings = []
+    reasons = run_pdflatex(wrapper_path, job_dir, f"standalone_{basename}", max_passes, fmt, texinputs,
+                           timings, {"stage": "chapter", "chapter": basename})
+    report = job_report(job_dir, f"standalone_{basename}", reasons, timings)
+
+    seconds = time.perf_counter() - started
+    if not os.path.exists(built_pdf):
+        message = f"FAILED (see {job_dir}/standalone_{basename}.log)"
+        return pdf_name, False, seconds, message, reasons, None, report
+    final_pdf = os.path.join(CHAPTERS_DIR, pdf_name)
+    error = publish_pdf(built_pdf, final_pdf)
+    if error:
+        return pdf_name, False, seconds, f"FAILED ({error})", reasons, None, report
+    entry = record_build(job_dir, f"standalone_{basename}", final_pdf)
+    return pdf_name, True, seconds, f"OK ({describe_passes(reasons)})", reasons, entry, report
+
+
+def book_outline(pdf_path):
+    """Flattened outline of a PDF as [(depth, title, dest, page)], pages counted from 1"""
+    result = run_tool(["qpdf", "--json", "--json-key=outlines", pdf_path], {"stage": "split"},
+                      capture_output=True, text=True)
+    # qpdf exits with 3 when it only had warnings
+    if result.returncode not in (0, 3):
+        return None
+    entries = []
+
+    def walk(items, depth):
+        for item in items:
+            dest = item.get("dest")
+            # qpdf's JSON v2 prefixes strings with "u:" (or "b:" for raw bytes)
+            if isinstance(dest, str) and dest[:2] in ("u:", "b:"):
+                dest = dest[2:]
+            entries.append((depth, item.get("title", ""), dest, item.get("destpageposfrom1")))
+            walk(item.get("kids", []), depth + 1)
+
+    walk(json.loads(result.stdout).get("outlines", []), 0)
+    return entries
+
+
+def chapter_page_ranges(entries, page_count):
+    """{chapter number: (first page, last page)} from the book's outline.
+
+    A chapter's bookmark points at hyperref's "chapter.<number>" anchor (or,
+    with bookmarksnumbered, is titled "<number> <title>"). It ends before the
+    next bookmark at the same or a higher level (next chapter, part, index).
+    """
+    ranges = {}
+    for i, (depth, title, dest, page) in enumerate(entries):
+        match = (re.fullmatch(r"chapter\.(\d+)", dest) if isinstance(dest, str) else None) \
+            or re.match(r"(\d+)\s", title)
+        if not match or page is None or int(match.group(1)) in ranges:
+            continue
+        last = page_count
+        for later_depth, _, _, later_page in entries[i + 1:]:
+            if later_depth <= depth and later_page and later_page > page:
+                last = later_page - 1
+                break
+        ranges[int(match.group(1))] = (page, last)
+    return ranges
+
+
+def build_title_pages(chapters, split_dir):
+    """Typeset one title page per chapter in a single pdflatex run.
+
+    Page k of the returned PDF is the title page of chapters[k - 1]; returns
+    None if pdflatex failed.
+    """
+    pages = []
+    for basename, title in chapters:
+        chap_num = title.split("-")[0]
+        pretty_title = title.split("-", 1)[1].replace("-", " ")
+        pages.append(f"""\\begin{{titlepage}}
+\\centering
+\\vspace*{{0.3\\textheight}}
+{{\\Huge Deep Learning and Transformers\\par}}
+\\vspace{{1em}}
+{{\\Large Chapter {chap_num}: {pretty_title}\\par}}
+\\vspace{{3em}}
+{{\\large [Author Names]\\par}}
+\\vspace{{1em}}
+{{\\large 2026\\par}}
+\\end{{titlepage}}
+""")
+    tex_path = os.path.join(split_dir, "title_pages.tex")
+    with open(tex_path, "w") as f:
+        f.write("\\documentclass[11pt,a4paper]{article}\n\\begin{document}\n"
+                + "".join(pages) + "\\end{document}\n")
+    pdf_path = os.path.join(split_dir, "title_pages.pdf")
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
+    run_tool(
+        ["pdflatex", "-interaction=nonstopmode", f"-output-directory={split_dir}", tex_path],
+        {"stage": "split", "document": "title_pages"},
+        cwd=SCRIPT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return pdf_path if os.path.exists(pdf_path) else None
+
+
+def split_chapter_pdfs(chapters, book_pdf):
+    """Slice each chapter's pages out of the full-book PDF behind a title page.
+
+    Returns results shaped like build_chapter_pdf's, in chapter order.
+    """
+    def failed(message):
+        print(f"  {message}")
+        return [(f"DeepLearningTech-{title}.pdf", False, 0.0, "FAILED", [], None, None)
+                for _, title in chapters]
+
+    if not shutil.which("qpdf"):
+        return failed("--split needs qpdf: brew install qpdf")
+    if not os.path.exists(book_pdf):
+        return failed(f"{os.path.basename(book_pdf)} was not built")
+
+    result = run_tool(["qpdf", "--show-npages", book_pdf], {"stage": "split"}, capture_output=True, text=True)
+    entries = book_outline(book_pdf)
+    if not result.stdout.strip().isdigit() or entries is None:
+        return failed(f"qpdf could not read {os.path.basename(book_pdf)}")
+    ranges = chapter_page_ranges(entries, int(result.stdout))
+
+    split_dir = os.path.join(BUILD_DIR, "split")
+    os.makedirs(split_dir, exist_ok=True)
+    title_pdf = build_title_pages(chapters, split_dir)
+    if title_pdf is None:
+        return failed(f"Title pages failed to compile (see {split_dir}/title_pages.log)")
+
+    results = []
+    for index, (basename, title) in enumerate(chapters, 1):
+        pdf_name = f"DeepLearningTech-{title}.pdf"
+        started = time.perf_counter()
+        chapter_range = ranges.get(int(title.split("-")[0]))
+        if chapter_range is None:
+            results.append((pdf_name, False, 0.0, "FAILED (chapter not in the book's outline)", [], None, None))
+            continue
+        first, last = chapter_range
+        tmp_path = os.path.join(split_dir, pdf_name)
+        result = run_tool(
+            ["qpdf", "--empty", "--pages", title_pdf, str(index), book_pdf, f"{first}-{last}",
+             "--", tmp_path],
+            {"stage": "split", "chapter": basename},
+            capture_output=True, text=True,
+        )
+        if result.returncode in (0, 3) and os.path.exists(tmp_path):
+            os.replace(tmp_path, os.path.join(CHAPTERS_DIR, pdf_name))
+            message = f"OK (pages {first}-{last})"
+            results.append((pdf_name, True, time.perf_counter() - started, message, [], None, None))
+        else:
+            last_line = (result.stderr.strip().splitlines() or ["qpdf failed"])[-1]
+            message = f"FAILED ({last_line})"
+            results.append((pdf_name, False, time.perf_counter() - started, message, [], None, None))
+    return results
+
+
+def report_cpu_seconds(report):
+    """Total CPU time of a report entry's passes, or None if unknown"""
+    cpu = [p["cpu_seconds"] for p in report["passes"]] if report else []
+    return sum(cpu) if cpu and None not in cpu else None
+
+
+def print_timing_table(results, wall_time, jobs):
+    """Print how long each chapter PDF took, slowest first, with what its log says."""
+    print()
+    print(f"  {'Chapter PDF':<56} {'Time':>8} {'CPU':>8} {'Passes':>6} {'Errors':>6} {'Undef':>5} {'Boxes':>5}")
+    rule = f"  {'-' * 56} {'-' * 8} {'-' * 8} {'-' * 6} {'-' * 6} {'-' * 5} {'-' * 5}"
+    print(rule)
+    for pdf_name, ok, seconds, _, reasons, _, report in sorted(results, key=lambda r: -r[2]):
+        passes = describe_passes(reasons).split()[0]
+        cpu = report_cpu_seconds(report)
+        cpu = "-" if cpu is None else f"{cpu:.1f}s"
+        log = report["log"] if report else None
+        if log:
+            errors = len(log["errors"])
+            undefined = len(log["undefined_references"]) + len(log["undefined_citations"])
+            boxes = log["overfull_boxes"] + log["underfull_boxes"]
+        else:
+            errors = undefined = boxes = "-"
+        print(f"  {pdf_name:<56} {seconds:>7.1f}s {cpu:>8} {passes:>6} {errors:>6} {undefined:>5} {boxes:>5}"
+              f"{'' if ok else '  FAILED'}")
+    print(rule)
+    serial_time = sum(r[2] for r in results)
+    speedup = serial_time / wall_time if wall_time > 0 else 1.0
+    print(f"  Wall time {wall_time:.1f}s on {jobs} worker(s) "
+          f"(serial {serial_time:.1f}s, speedup {speedup:.1f}x)")
+
+
+def print_top_tool_runs(limit=5):
+    """Print the external tool runs that cost the most CPU time this build."""
+    runs = top_runs(limit)
+    if not runs:
+        return
+    print()
+    print(f"  Most expensive tool runs (all {len(tool_runs())} in {os.path.basename(BUILD_REPORT_FILE)}):")
+    for record in runs:
+        print(f"    {describe_run(record)}: {format_run(record)}")
+
+
+def write_build_report(results):
+    """Write BUILD_REPORT_FILE for the documents built this run; return the totals"""
+    documents = {}
+    totals = {"documents": 0, "passes": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "errors": 0,
+              "undefined_references": 0, "undefined_citations": 0, "overfull_boxes": 0, "underfull_boxes": 0}
+    for pdf_name, ok, seconds, message, _, _, report in results:
+        if report is None:
+            continue
+        documents[pdf_name] = dict(report, ok=ok, seconds=round(seconds, 3), message=message)
+        totals["documents"] += 1
+        totals["passes"] += len(report["passes"])
+        totals["wall_seconds"] += seconds
+        totals["cpu_seconds"] += report_cpu_seconds(report) or 0.0
+        log = report["log"] or {}
+        totals["errors"] += len(log.get("errors", []))
+        for key in ("undefined_references", "undefined_citations"):
+            totals[key] += len(log.get(key, []))
+        for key in ("overfull_boxes", "underfull_boxes"):
+            totals[key] += log.get(key, 0)
+    totals["wall_seconds"] = round(totals["wall_seconds"], 3)
+    totals["cpu_seconds"] = round(totals["cpu_seconds"], 3)
+    fd, tmp_path = tempfile.mkstemp(dir=BUILD_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "totals": totals, "documents": documents,
+                   "tool_stages": usage_by_stage(), "tool_runs": tool_runs()},
+                  f, indent=2, sort_keys=True)
+    os.replace(tmp_path, BUILD_REPORT_FILE)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the full-book and per-chapter PDFs")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="number of chapter PDFs built concurrently (default: CPU count)")
+    parser.add_argument("--max-passes", type=int, default=MAX_PASSES,
+                        help=f"most pdflatex passes per document (default: {MAX_PASSES})")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every PDF, even if its inputs are unchanged")
+    parser.add_argument("--no-format", action="store_true",
+                        help="don't precompile chapter_preamble.tex into a format file")
+    parser.add_argument("--split", action="store_true",
+                        help="slice chapter PDFs out of main_pro.pdf instead of compiling each one")
+    parser.add_argument("--no-externalize", action="store_true",
+                        help="typeset TikZ diagrams inline in every document instead of once each")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="don't check chapters/*.tex for unbalanced braces and environments first")
+    args = parser.parse_args(argv)
+
+    # pdflatex output goes to DEVNULL, so catch broken sources before the long runs
+    if not args.no_preflight:
+        print("Pre-flight check of chapters/*.tex ... ", end="", flush=True)
+        sources = {}
+        for path in sorted(glob.glob(os.path.join(CHAPTERS_DIR, "*.tex"))):
+            with open(path, "r") as f:
+                sources[os.path.relpath(path, SCRIPT_DIR)] = f.read()
+        errors, _ = check_sources(sources)
+        if errors:
+            print(f"FAILED ({len(errors)} error(s))")
+            for message in errors:
+                print(f"  {message}")
+            return 1
+        print(f"OK ({len(sources)} files)")
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    state = {} if args.force else load_build_state()
+
+    search_dirs = []
+    if args.no_externalize:
+        # Recorded inputs may name the copies; removing them makes those PDFs rebuild
+        shutil.rmtree(EXTERNALIZED_DIR, ignore_errors=True)
     else:
-        print(f"FAILED (see {BUILD_DIR}/standalone_{basename}.log)")
-        fail += 1
-
-print(f"\nDone: {success}/{total} chapter PDFs succeeded, {fail} failed")
-print()
-print("=" * 64)
-print("  SUMMARY")
-print("=" * 64)
-print(f"  main_pro.pdf:         {'OK' if main_ok else 'FAILED'}")
-print(f"  main_pro_memoir.pdf:  {'OK' if memoir_ok else 'FAILED'}")
-print(f"  Chapter PDFs:         {success}/{total}")
-print(f"  Output:               {CHAPTERS_DIR}/")
-print(f"  Clean build files:    rm -rf {BUILD_DIR}")
-print("=" * 64)
+        print("Externalizing TikZ diagrams ... ", end="", flush=True)
+        compiled, cached, failed = externalize_tikz(args.jobs, retry_failed=args.force)
+        print(f"OK ({compiled} compiled, {cached} up to date, {failed} left inline)")
+        search_dirs = [EXTERNALIZED_DIR, TIKZ_PDF_DIR]
+
+    # ── Step 1: Build full-book PDFs ─────────────────────────────────────────
+    print("=" * 64)
+    print("  FULL BOOK PDFs")
+    print("=" * 64)
+
+    # Variants set in another font or size keep their diagrams inline
+    book_inputs = {}
+    for tex_name in BOOK_VARIANTS:
+        entry = state.get(tex_name)
+        book_inputs[tex_name] = (entry, texinputs_with(*search_dirs) if search_dirs else None)
+        tex_path = os.path.join(SCRIPT_DIR, tex_name)
+        if search_dirs and os.path.exists(tex_path):
+            with open(tex_path, "r") as f:
+                preamble = f.read().split("\\begin{document}", 1)[0]
+            if not matches_externalized_font(preamble):
+                size, packages = document_font(preamble)
+                print(f"{tex_name}: {', '.join([size] + packages)} - typesetting its diagrams inline")
+                # A PDF built from the externalized copies is out of date
+                book_inputs[tex_name] = (None if uses_externalized(entry) else entry, None)
+    book_jobs = max(1, min(args.jobs, len(BOOK_VARIANTS)))
+    print(f"Building {len(BOOK_VARIANTS)} full-book PDFs on {book_jobs} worker(s)...")
+    books = {}
+    book_results = []
+    with ThreadPoolExecutor(max_workers=book_jobs) as pool:
+        futures = [pool.submit(build_main_pdf, tex_name, args.max_passes, *book_inputs[tex_name])
+                   for tex_name in BOOK_VARIANTS]
+        for future, tex_name in zip(futures, BOOK_VARIANTS):
+            result = future.result()
+            pdf_name, ok, seconds, message, reasons, entry, report = result
+            print(f"Building: {pdf_name} ... {message}")
+            for number, reason in enumerate(reasons, 1):
+                print(f"    pass {number}: {reason}")
+            book_results.append(result)
+            books[pdf_name] = ok
+            if entry:
+                state[tex_name] = entry
+            else:
+                state.pop(tex_name, None)
+            save_build_state(state)
+
+    # ── Step 2: Build per-chapter PDFs ──────────────────────────────────────
+    print()
+    print("=" * 64)
+    print("  INDIVIDUAL CHAPTER PDFs")
+    print("=" * 64)
+
+    chapters = []
+    for basename, title in CHAPTERS:
+        if not os.path.exists(os.path.join(CHAPTERS_DIR, f"{basename}.tex")):
+            print(f"  SKIP: {basename}.tex not found")
+            continue
+        chapters.append((basename, title))
+
+    if args.split:
+        print(f"Splitting {len(chapters)} chapter PDFs out of main_pro.pdf...")
+        started = time.perf_counter()
+        results = split_chapter_pdfs(chapters, os.path.join(SCRIPT_DIR, "main_pro.pdf"))
+        for pdf_name, _, _, message, _, _, _ in results:
+            print(f"Splitting: {pdf_name} ... {message}")
+        print(f"  Split in {time.perf_counter() - started:.1f}s")
+        print_summary(books, results, write_build_report(book_results))
+        return exit_status(books, results)
+
+    # Read the shared preamble
+    with open(PREAMBLE_FILE, "r") as f:
+        preamble = f.read()
+
+    chapter_state = {basename: state.get(f"chapter:{basename}") for basename, _ in chapters}
+    if search_dirs and not matches_externalized_font(preamble):
+        size, packages = document_font(preamble)
+        print(f"{os.path.basename(PREAMBLE_FILE)}: {', '.join([size] + packages)} - "
+              f"typesetting chapter diagrams inline")
+        search_dirs = []
+        chapter_state = {basename: None if uses_externalized(entry) else entry
+                         for basename, entry in chapter_state.items()}
+
+    # Resolve references into other chapters from the full-book build
+    external_labels = False
+    if os.path.exists(BOOK_AUX) and with_external_labels(preamble):
+        preamble = with_external_labels(preamble)
+        external_labels = True
+        print(f"Importing cross-chapter labels from {os.path.basename(BOOK_AUX)}")
+    texinputs = texinputs_with(*search_dirs) if search_dirs else None
+
+    fmt = None
+    if not args.no_format:
+        print("Preparing preamble format ... ", end="", flush=True)
+        fmt = build_preamble_format(preamble, "chapter-xr" if external_labels else "chapter")
+        print(f"OK ({fmt}.fmt)" if fmt else "FAILED (compiling the preamble in every job)")
+
+    jobs = max(1, min(args.jobs, len(chapters)))
+    print(f"Building {len(chapters)} chapter PDFs on {jobs} worker(s)...")
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(build_chapter_pdf, basename, title, preamble, args.max_passes,
+                               chapter_state[basename], fmt, external_labels, texinputs)
+                   for basename, title in chapters]
+        # Report in chapter order, whatever order the jobs finish in
+        for future, (basename, _) in zip(futures, chapters):
+            result = future.result()
+            pdf_name, ok, seconds, message, reasons, entry, _ = result
+            print(f"Building: {pdf_name} ... {message}")
+            for number, reason in enumerate(reasons, 1):
+                print(f"    pass {number}: {reason}")
+            results.append(result)
+            if entry:
+                state[f"chapter:{basename}"] = entry
+            else:
+                state.pop(f"chapter:{basename}", None)
+            save_build_state(state)
+    wall_time = time.perf_counter() - started
+
+    if results:
+        print_timing_table(results, wall_time, jobs)
+    print_top_tool_runs()
+    print_summary(books, results, write_build_report(book_results + results))
+    return exit_status(books, results)
+
+
+def exit_status(books, results):
+    """1 if any full-book or chapter PDF failed, else 0"""
+    if all(books.values()) and all(ok for _, ok, *_ in results):
+        return 0
+    return 1
+
+
+def print_summary(books, results, totals):
+    total = len(results)
+    success = sum(1 for _, ok, *_ in results if ok)
+    fail = total - success
+    print(f"\nDone: {success}/{total} chapter PDFs succeeded, {fail} failed")
+    print()
+    print("=" * 64)
+    print("  SUMMARY")
+    print("=" * 64)
+    for pdf_name, ok in books.items():
+        print(f"  {pdf_name + ':':<22}{'OK' if ok else 'FAILED'}")
+    print(f"  Chapter PDFs:         {success}/{total}")
+    print(f"  pdflatex:             {totals['passes']} passes in {totals['documents']} documents, "
+          f"{totals['cpu_seconds']:.1f}s CPU")
+    print(f"  Logs:                 {totals['errors']} errors, "
+          f"{totals['undefined_references'] + totals['undefined_citations']} undefined refs/cites, "
+          f"{totals['overfull_boxes']} overfull + {totals['underfull_boxes']} underfull boxes")
+    print(f"  Report:               {BUILD_REPORT_FILE}")
+    print(f"  Output:               {CHAPTERS_DIR}/")
+    print(f"  Clean build files:    rm -rf {BUILD_DIR}")
+    print("=" * 64)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
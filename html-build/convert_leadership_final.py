@@ -4,12 +4,16 @@ Convert Leadership Book with full LaTeX support
 Handles: tcolorbox, fbox, parbox, and all standard environments
 """
 
+import os
 import sys
 import re
+import argparse
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
-from convert_to_html import read_latex_file, process_tikz_diagrams
+from convert_to_html import (read_latex_file, process_tikz_diagrams, render_tikz_diagrams, add_tikz_render_args,
+                             publish_output, preflight_check, report_tool_usage)
+from latex_preflight import LEADERSHIP_ENVIRONMENTS
 
 CHAPTERS = [
     ("preface", "Preface"),
@@ -134,19 +138,42 @@ def convert_latex_to_html_enhanced(latex_content):
     
     return html_content
 
-def create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter, output_dir):
-    """Create HTML file with full template"""
+def diagrams_output_dirs():
+    """Output locations for rendered leadership-book diagrams"""
+    project_root = Path(__file__).parent.parent
+    return [project_root / "nodejs-version/public/chapters/diagrams"]
+
+def collect_tikz_sources():
+    """Return (chapter_file, latex_content, output_dirs) for every chapter, for render_tikz_diagrams"""
+    project_root = Path(__file__).parent.parent
+    sources = []
+    for chapter_file, _ in CHAPTERS:
+        latex_content = read_latex_file(project_root / "leadership-book/chapters" / f"{chapter_file}.tex")
+        if latex_content:
+            sources.append((chapter_file, latex_content, diagrams_output_dirs()))
+    return sources
+
+def preflight_leadership(sources):
+    """Pre-flight check of the sources from collect_tikz_sources; False if there are errors"""
+    return preflight_check({f"leadership-book/chapters/{chapter_file}.tex": latex_content
+                            for chapter_file, latex_content, _ in sources},
+                           LEADERSHIP_ENVIRONMENTS)
+
+def create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter, output_dir,
+                        rendered_diagrams=None, latex_content=None):
+    """Create HTML file with full template (reads the .tex unless latex_content is given)"""
     project_root = Path(__file__).parent.parent
     latex_path = project_root / "leadership-book/chapters" / f"{chapter_file}.tex"
     
-    latex_content = read_latex_file(latex_path)
+    if latex_content is None:
+        latex_content = read_latex_file(latex_path)
     if not latex_content:
         print(f"   ⚠️  Could not read {latex_path}")
         return
     
     # Process diagrams
-    diagrams_output_dirs = [project_root / "nodejs-version/public/chapters/diagrams"]
-    latex_content = process_tikz_diagrams(latex_content, chapter_file, diagrams_output_dirs)
+    latex_content = process_tikz_diagrams(latex_content, chapter_file, diagrams_output_dirs(),
+                                          rendered_diagrams)
     
     # Convert to HTML with enhanced support
     html_content = convert_latex_to_html_enhanced(latex_content)
@@ -221,17 +248,16 @@ def create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter,
 </body>
 </html>"""
     
-    output_path = output_dir / f"{chapter_file}.html"
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(full_html)
-    print(f"   ✓ {chapter_file}.html")
+    written = publish_output(full_html, [output_dir / f"{chapter_file}.html"])
+    print(f"   ✓ {chapter_file}.html" + ("" if written else " (unchanged)"))
 
-def main():
-    print("=" * 70)
-    print("Converting Leadership Book with FULL LaTeX support")
-    print("=" * 70)
-    
+def convert_chapters(rendered_diagrams=None, sources=None):
+    """Convert every leadership chapter, using diagrams from render_tikz_diagrams when given.
+
+    sources is the list from collect_tikz_sources, so chapters already read
+    for rendering are not read again.
+    """
+    chapter_sources = {chapter_file: latex_content for chapter_file, latex_content, _ in sources or []}
     project_root = Path(__file__).parent.parent
     output_dir = project_root / "nodejs-version/public/chapters/leadership"
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -245,7 +271,31 @@ def main():
     for i, (chapter_file, chapter_title) in enumerate(CHAPTERS):
         prev_chapter = CHAPTERS[i-1] if i > 0 else None
         next_chapter = CHAPTERS[i+1] if i < len(CHAPTERS)-1 else None
-        create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter, output_dir)
+        create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter, output_dir,
+                            rendered_diagrams, chapter_sources.get(chapter_file))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the leadership book chapters to HTML")
+    add_tikz_render_args(parser)
+    args = parser.parse_args(argv)
+    
+    print("=" * 70)
+    print("Converting Leadership Book with FULL LaTeX support")
+    print("=" * 70)
+    
+    sources = collect_tikz_sources()
+    if not args.no_preflight:
+        print(f"\n🔎 Pre-flight check of the LaTeX sources...")
+        if not preflight_leadership(sources):
+            return 1
+    
+    # Render all diagrams up front on one worker pool
+    print(f"\n🎨 Rendering TikZ diagrams ({args.jobs} worker(s))...")
+    rendered_diagrams = render_tikz_diagrams(sources, jobs=args.jobs, batch=args.batch,
+                                             retry_failed=args.retry_failed)
+    
+    convert_chapters(rendered_diagrams, sources)
+    report_tool_usage()
     
     print("\n" + "=" * 70)
     print("✅ Conversion complete with FULL LaTeX support!")
@@ -258,4 +308,4 @@ def main():
     print("  ✓ TikZ diagrams")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
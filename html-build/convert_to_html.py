@@ -9,8 +9,24 @@ import sys
 import subprocess
 import tempfile
 import hashlib
+import shutil
+import string
+import functools
+import time
+import argparse
+import json
+import io
+import contextlib
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 
+from latex_parser import LAZY_ENVIRONMENTS, LAZY_PROOF_MIN_CHARS, MATH_CLASS, latex_to_html
+from latex_preflight import CONVERTED_ENVIRONMENTS, check_sources
+from math_prerender import MATH_RENDERERS, has_marked_math, prerender_math, renderer_version
+from tool_runner import (run_tool, add_tool_runs, tool_runs, top_runs, usage_by_stage, describe_run, format_run,
+                         write_usage_report)
+
 # Chapter information
 CHAPTERS = [
     ("preface", "Preface"),
@@ -67,41 +83,8 @@ def extract_tikz_diagrams(latex_content, chapter_name):
     
     return diagrams
 
-def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash):
-    """Convert a single TikZ diagram to SVG using pdflatex and pdf2svg or ImageMagick"""
-    
-    # Check if pdflatex is available
-    try:
-        subprocess.run(['pdflatex', '--version'], capture_output=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print(f"   ⚠ pdflatex not found - skipping TikZ conversion")
-        print(f"      Install MacTeX: brew install --cask mactex")
-        return False
-    
-    # Check for pdf2svg or ImageMagick convert
-    has_pdf2svg = False
-    has_imagemagick = False
-    
-    try:
-        subprocess.run(['pdf2svg'], capture_output=True)
-        has_pdf2svg = True
-    except FileNotFoundError:
-        pass
-    
-    try:
-        result = subprocess.run(['convert', '--version'], capture_output=True)
-        if b'ImageMagick' in result.stdout:
-            has_imagemagick = True
-    except FileNotFoundError:
-        pass
-    
-    if not has_pdf2svg and not has_imagemagick:
-        print(f"   ⚠ Neither pdf2svg nor ImageMagick found - skipping TikZ conversion")
-        print(f"      Install with: brew install pdf2svg  OR  brew install imagemagick")
-        return False
-    
-    # Create a standalone LaTeX document with the TikZ code
-    standalone_doc = r'''\documentclass[tikz,border=2pt]{standalone}
+# Preamble shared by every standalone TikZ document
+TIKZ_STANDALONE_PREAMBLE = r'''\documentclass[tikz,border=2pt]{standalone}
 \usepackage{tikz}
 \usepackage{amsmath,amssymb,amsthm,bm}
 \usetikzlibrary{arrows,arrows.meta,positioning,shapes,calc}
@@ -168,7 +151,205 @@ def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash):
 \newcommand{\mY}{\mathbf{Y}}
 \newcommand{\mZ}{\mathbf{Z}}
 
-\begin{document}
+'''
+
+# Persistent SVG cache, keyed by diagram code + preamble + toolchain version
+TIKZ_CACHE_DIR = Path(__file__).parent / ".tikz_cache"
+
+# Maximum number of diagrams compiled together in batch mode
+TIKZ_BATCH_SIZE = 20
+
+# Negative cache: diagrams that failed to compile, one JSON file per cache key
+# so that concurrent builds never rewrite each other's records
+TIKZ_FAILURES_DIR = TIKZ_CACHE_DIR / "failures"
+
+# pdflatex formats with TIKZ_STANDALONE_PREAMBLE preloaded, one per preamble hash
+TIKZ_FORMATS_DIR = TIKZ_CACHE_DIR / "formats"
+
+# Cost of every external tool run (pdflatex, pdf2svg, convert) of the last build
+TOOL_USAGE_FILE = Path(__file__).parent / ".tool_usage.json"
+
+@functools.lru_cache(maxsize=None)
+def pdflatex_version():
+    """First line of `pdflatex --version`, or None when pdflatex is missing"""
+    try:
+        result = run_tool(['pdflatex', '--version'], {'stage': 'detect'}, capture_output=True, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    return result.stdout.decode('utf-8', errors='ignore').split('\n')[0].strip()
+
+@functools.lru_cache(maxsize=None)
+def detect_tikz_toolchain():
+    """Detect pdflatex and an SVG converter once per run; return a dict or None"""
+    if pdflatex_version() is None:
+        print(f"   ⚠ pdflatex not found - skipping TikZ conversion")
+        print(f"      Install MacTeX: brew install --cask mactex")
+        return None
+    
+    # Prefer pdf2svg, fall back to ImageMagick convert
+    try:
+        result = run_tool(['pdf2svg'], {'stage': 'detect'}, capture_output=True)
+        # pdf2svg has no --version flag; its usage banner is the best fingerprint
+        usage = (result.stdout + result.stderr).decode('utf-8', errors='ignore').strip()
+        return {
+            'pdflatex': pdflatex_version(),
+            'converter': 'pdf2svg',
+            'converter_version': usage.split('\n')[0] if usage else 'pdf2svg',
+        }
+    except FileNotFoundError:
+        pass
+    
+    try:
+        result = run_tool(['convert', '--version'], {'stage': 'detect'}, capture_output=True)
+        if b'ImageMagick' in result.stdout:
+            return {
+                'pdflatex': pdflatex_version(),
+                'converter': 'imagemagick',
+                'converter_version': result.stdout.decode('utf-8', errors='ignore').split('\n')[0].strip(),
+            }
+    except FileNotFoundError:
+        pass
+    
+    print(f"   ⚠ Neither pdf2svg nor ImageMagick found - skipping TikZ conversion")
+    print(f"      Install with: brew install pdf2svg  OR  brew install imagemagick")
+    return None
+
+@functools.lru_cache(maxsize=None)
+def tikz_preamble_format(preamble=TIKZ_STANDALONE_PREAMBLE):
+    """Name of a pdflatex format with a TikZ preamble loaded, or None.
+    
+    The format is dumped with mylatexformat once per preamble and pdflatex
+    version, and checked by compiling a trivial diagram with it. Documents
+    compiled with it skip their preamble, so diagrams don't reload TikZ.
+    """
+    version = pdflatex_version()
+    if version is None:
+        return None
+    name = "tikz-" + _sha256_text(preamble, version)[:16]
+    if (TIKZ_FORMATS_DIR / f"{name}.fmt").exists():
+        return name
+    
+    TIKZ_FORMATS_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=TIKZ_FORMATS_DIR) as tmpdir:
+        tmpdir = Path(tmpdir)
+        with open(tmpdir / f"{name}.tex", 'w', encoding='utf-8') as f:
+            f.write(preamble + "\\begin{document}\n\\end{document}\n")
+        with open(tmpdir / "check.tex", 'w', encoding='utf-8') as f:
+            f.write(preamble + "\\begin{document}\n"
+                    "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}\n\\end{document}\n")
+        try:
+            run_tool(['pdflatex', '-ini', '-interaction=nonstopmode', f'-jobname={name}',
+                      '&pdflatex', 'mylatexformat.ltx', f'{name}.tex'],
+                     {'stage': 'tikz-format', 'format': name}, cwd=tmpdir, capture_output=True, timeout=120)
+            command, env = tikz_pdflatex_command('check.tex', name, tmpdir)
+            run_tool(command, {'stage': 'tikz-format', 'format': name}, cwd=tmpdir, env=env,
+                     capture_output=True, timeout=30)
+        except subprocess.TimeoutExpired:
+            pass
+        if not (tmpdir / f"{name}.fmt").exists() or not (tmpdir / "check.pdf").exists():
+            print(f"   ⚠ Could not precompile the TikZ preamble - loading it for every diagram")
+            return None
+        os.replace(tmpdir / f"{name}.fmt", TIKZ_FORMATS_DIR / f"{name}.fmt")
+    return name
+
+def tikz_pdflatex_command(tex_name, fmt=None, formats_dir=TIKZ_FORMATS_DIR):
+    """pdflatex command line and environment for a standalone TikZ document"""
+    command = ['pdflatex', '-interaction=nonstopmode', '-halt-on-error']
+    env = None
+    if fmt:
+        command.append(f'-fmt={fmt}')
+        # Trailing separator: search formats_dir, then the default format path
+        env = dict(os.environ, TEXFORMATS=f"{formats_dir}{os.pathsep}{os.environ.get('TEXFORMATS', '')}")
+    return command + [tex_name], env
+
+def tikz_cache_key(tikz_code, toolchain):
+    """Content address for a diagram: independent of the chapter it appears in"""
+    h = hashlib.sha256()
+    for part in (TIKZ_STANDALONE_PREAMBLE, tikz_code, toolchain['pdflatex'],
+                 toolchain['converter'], toolchain['converter_version']):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def store_in_tikz_cache(svg_file, cache_key):
+    """Copy a freshly rendered SVG into the cache (atomic, safe for concurrent builds)"""
+    TIKZ_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cached = TIKZ_CACHE_DIR / f"{cache_key}.svg"
+    fd, tmp_path = tempfile.mkstemp(dir=TIKZ_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    shutil.copyfile(svg_file, tmp_path)
+    os.replace(tmp_path, cached)
+    return cached
+
+def load_tikz_failures():
+    """Return the recorded TikZ failures: {cache_key: {chapter, diagram_hash, error, timestamp}}"""
+    failures = {}
+    if not TIKZ_FAILURES_DIR.is_dir():
+        return failures
+    for record_file in TIKZ_FAILURES_DIR.glob('*.json'):
+        try:
+            with open(record_file, 'r', encoding='utf-8') as f:
+                failures[record_file.stem] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Removed or half-written by a concurrent build
+            continue
+    return failures
+
+def load_tikz_failure(cache_key):
+    """Return the failure record for one diagram, or None"""
+    try:
+        with open(TIKZ_FAILURES_DIR / f"{cache_key}.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def record_tikz_failure(cache_key, chapter_name, diagram_hash, error_output):
+    """Remember that a diagram failed so later builds skip it until its key changes"""
+    if isinstance(error_output, bytes):
+        error_output = error_output.decode('utf-8', errors='ignore')
+    error_tail = [line.rstrip() for line in error_output.split('\n') if line.strip()][-10:]
+    record = {
+        'chapter': chapter_name,
+        'diagram_hash': diagram_hash,
+        'error': error_tail,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    TIKZ_FAILURES_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TIKZ_FAILURES_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, TIKZ_FAILURES_DIR / f"{cache_key}.json")
+
+def clear_tikz_failure(cache_key):
+    """Forget a failure once the diagram renders successfully"""
+    try:
+        os.remove(TIKZ_FAILURES_DIR / f"{cache_key}.json")
+    except FileNotFoundError:
+        pass
+
+def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash, retry_failed=False):
+    """Convert a single TikZ diagram to SVG using pdflatex and pdf2svg or ImageMagick"""
+    
+    toolchain = detect_tikz_toolchain()
+    if toolchain is None:
+        return False
+    
+    # Reuse a previously rendered SVG when the diagram, preamble and tools are unchanged
+    cache_key = tikz_cache_key(tikz_code, toolchain)
+    cached = TIKZ_CACHE_DIR / f"{cache_key}.svg"
+    if cached.exists():
+        shutil.copyfile(cached, output_path)
+        return True
+    
+    # Don't retry a diagram that already failed with this exact source and preamble
+    if not retry_failed:
+        failure = load_tikz_failure(cache_key)
+        if failure:
+            print(f"   ⚠ Skipping TikZ diagram {diagram_hash} (failed on {failure['timestamp']}; use --retry-failed)")
+            return False
+    
+    # Create a standalone LaTeX document with the TikZ code
+    standalone_doc = TIKZ_STANDALONE_PREAMBLE + r'''\begin{document}
 ''' + tikz_code + r'''
 \end{document}
 '''
@@ -183,11 +364,15 @@ def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash):
         with open(tex_file, 'w', encoding='utf-8') as f:
             f.write(standalone_doc)
         
+        tags = {'chapter': chapter_name, 'diagram': diagram_hash}
         try:
             # Compile to PDF
-            result = subprocess.run(
-                ['pdflatex', '-interaction=nonstopmode', '-halt-on-error', tex_file.name],
+            command, env = tikz_pdflatex_command(tex_file.name, tikz_preamble_format())
+            result = run_tool(
+                command,
+                dict(tags, stage='tikz-pdf'),
                 cwd=tmpdir,
+                env=env,
                 capture_output=True,
                 timeout=30
             )
@@ -201,19 +386,23 @@ def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash):
                     for line in error_lines[-5:]:
                         if line.strip():
                             print(f"      {line.strip()}")
+                # pdflatex reports TeX errors on stdout
+                record_tikz_failure(cache_key, chapter_name, diagram_hash, result.stdout + result.stderr)
                 return False
             
             # Convert PDF to SVG using available tool
-            if has_pdf2svg:
-                result = subprocess.run(
+            if toolchain['converter'] == 'pdf2svg':
+                result = run_tool(
                     ['pdf2svg', pdf_file.name, output_path.name],
+                    dict(tags, stage='tikz-svg'),
                     cwd=tmpdir,
                     capture_output=True,
                     timeout=30
                 )
             else:  # Use ImageMagick
-                result = subprocess.run(
+                result = run_tool(
                     ['convert', '-density', '300', pdf_file.name, output_path.name],
+                    dict(tags, stage='tikz-svg'),
                     cwd=tmpdir,
                     capture_output=True,
                     timeout=30
@@ -221,25 +410,243 @@ def convert_tikz_to_svg(tikz_code, output_path, chapter_name, diagram_hash):
             
             if result.returncode != 0:
                 print(f"   ⚠ Failed to convert PDF to SVG for {diagram_hash}")
+                record_tikz_failure(cache_key, chapter_name, diagram_hash, result.stdout + result.stderr)
                 return False
             
             # Move the SVG to the output directory
             svg_file = tmpdir / output_path.name
             if svg_file.exists():
-                svg_file.rename(output_path)
+                store_in_tikz_cache(svg_file, cache_key)
+                clear_tikz_failure(cache_key)
+                shutil.move(str(svg_file), output_path)
                 return True
             else:
                 return False
                 
-        except subprocess.TimeoutExpired:
+        except subprocess.TimeoutExpired as e:
             print(f"   ⚠ Timeout while processing TikZ diagram {diagram_hash}")
+            record_tikz_failure(cache_key, chapter_name, diagram_hash,
+                                (e.output or b'') + f"\nTimed out after {e.timeout}s".encode())
             return False
         except Exception as e:
             print(f"   ⚠ Error processing TikZ diagram {diagram_hash}: {e}")
             return False
 
-def process_tikz_diagrams(latex_content, chapter_name, output_dirs):
-    """Extract and convert all TikZ diagrams in the content, return modified content"""
+def convert_tikz_batch_to_svg(tikz_codes, output_paths, batch_name):
+    """Convert several TikZ diagrams with a single pdflatex run.
+    
+    Every tikzpicture becomes one page of a multi-page standalone document, so
+    TeX startup and the preamble are paid once per batch. The pages are then
+    split into one SVG per diagram. Returns False on any failure so the caller
+    can fall back to compiling the diagrams one at a time.
+    """
+    toolchain = detect_tikz_toolchain()
+    if toolchain is None:
+        return False
+    
+    standalone_doc = TIKZ_STANDALONE_PREAMBLE + r'''\begin{document}
+''' + '\n\n'.join(tikz_codes) + r'''
+\end{document}
+'''
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        tex_file = tmpdir / "batch.tex"
+        pdf_file = tmpdir / "batch.pdf"
+        
+        with open(tex_file, 'w', encoding='utf-8') as f:
+            f.write(standalone_doc)
+        
+        # Same per-diagram budget as convert_tikz_to_svg
+        timeout = 30 * len(tikz_codes)
+        
+        tags = {'chapter': batch_name, 'diagrams': len(tikz_codes)}
+        try:
+            command, env = tikz_pdflatex_command(tex_file.name, tikz_preamble_format())
+            result = run_tool(
+                command,
+                dict(tags, stage='tikz-pdf'),
+                cwd=tmpdir,
+                env=env,
+                capture_output=True,
+                timeout=timeout
+            )
+            if result.returncode != 0 or not pdf_file.exists():
+                return False
+            
+            # Split the pages into page-1.svg, page-2.svg, ...
+            if toolchain['converter'] == 'pdf2svg':
+                result = run_tool(
+                    ['pdf2svg', pdf_file.name, 'page-%d.svg', 'all'],
+                    dict(tags, stage='tikz-svg'),
+                    cwd=tmpdir,
+                    capture_output=True,
+                    timeout=timeout
+                )
+            else:  # Use ImageMagick
+                result = run_tool(
+                    ['convert', '-density', '300', pdf_file.name, '-scene', '1', 'page-%d.svg'],
+                    dict(tags, stage='tikz-svg'),
+                    cwd=tmpdir,
+                    capture_output=True,
+                    timeout=timeout
+                )
+            if result.returncode != 0:
+                return False
+            
+            # One page per diagram, no more and no less
+            pages = [tmpdir / f"page-{i}.svg" for i in range(1, len(tikz_codes) + 1)]
+            if not all(page.exists() for page in pages) or (tmpdir / f"page-{len(pages) + 1}.svg").exists():
+                print(f"   ⚠ TikZ batch for {batch_name} produced an unexpected page count")
+                return False
+            
+            for tikz_code, page, output_path in zip(tikz_codes, pages, output_paths):
+                cache_key = tikz_cache_key(tikz_code, toolchain)
+                store_in_tikz_cache(page, cache_key)
+                clear_tikz_failure(cache_key)
+                shutil.move(str(page), output_path)
+            return True
+        
+        except subprocess.TimeoutExpired:
+            print(f"   ⚠ Timeout while processing TikZ batch for {batch_name}")
+            return False
+        except Exception as e:
+            print(f"   ⚠ Error processing TikZ batch for {batch_name}: {e}")
+            return False
+
+def plan_tikz_render_units(requests, batch, retry_failed=False):
+    """Split the diagrams into units of work for the render pool.
+    
+    Without batching every diagram is its own unit. With batching, diagrams
+    that are not cached yet are grouped per chapter, up to TIKZ_BATCH_SIZE
+    diagrams per pdflatex run; cache hits and known failures stay single.
+    """
+    if not batch:
+        return [[tikz_code] for tikz_code in requests]
+    
+    toolchain = detect_tikz_toolchain()
+    failures = {} if retry_failed else load_tikz_failures()
+    units = []
+    pending = {}
+    for tikz_code, users in requests.items():
+        cache_key = tikz_cache_key(tikz_code, toolchain)
+        if (TIKZ_CACHE_DIR / f"{cache_key}.svg").exists() or cache_key in failures:
+            units.append([tikz_code])
+        else:
+            pending.setdefault(users[0][0], []).append(tikz_code)
+    
+    for chapter_codes in pending.values():
+        for i in range(0, len(chapter_codes), TIKZ_BATCH_SIZE):
+            units.append(chapter_codes[i:i + TIKZ_BATCH_SIZE])
+    return units
+
+def render_tikz_diagrams(sources, jobs=1, batch=False, retry_failed=False):
+    """Render every TikZ diagram from all sources on a shared worker pool.
+    
+    sources is a list of (chapter_name, latex_content, output_dirs) tuples, so
+    one queue can span both books. Identical diagrams are rendered once. With
+    batch=True, uncached diagrams are compiled several per pdflatex run. Diagrams
+    recorded as failing are skipped unless retry_failed is set. Returns
+    {(chapter_name, diagram_hash): svg_filename} for every diagram that succeeded.
+    """
+    # Group requests by diagram code so duplicates are rendered only once
+    requests = {}
+    for chapter_name, latex_content, output_dirs in sources:
+        for tikz_code, diagram_hash in extract_tikz_diagrams(latex_content, chapter_name):
+            requests.setdefault(tikz_code, []).append((chapter_name, diagram_hash, output_dirs))
+    
+    if not requests or detect_tikz_toolchain() is None:
+        return {}
+    
+    units = plan_tikz_render_units(requests, batch, retry_failed)
+    # Dump the preamble format before the workers need it
+    tikz_preamble_format()
+    jobs = max(1, min(jobs, len(units)))
+    rendered = {}
+    
+    with tempfile.TemporaryDirectory() as staging_dir:
+        staged = {tikz_code: Path(staging_dir) / f"diagram{i}.svg" for i, tikz_code in enumerate(requests)}
+        
+        def render_unit(unit):
+            started = time.perf_counter()
+            if len(unit) > 1:
+                batch_name = requests[unit[0]][0][0]
+                if convert_tikz_batch_to_svg(unit, [staged[c] for c in unit], batch_name):
+                    return [(c, True) for c in unit], time.perf_counter() - started
+                # Find the failing diagram(s) by compiling the batch one at a time
+                print(f"   ⚠ TikZ batch for {batch_name} failed - compiling its {len(unit)} diagrams one at a time")
+            results = []
+            for tikz_code in unit:
+                chapter_name, diagram_hash, _ = requests[tikz_code][0]
+                ok = convert_tikz_to_svg(tikz_code, staged[tikz_code], chapter_name, diagram_hash,
+                                         retry_failed)
+                results.append((tikz_code, ok))
+            return results, time.perf_counter() - started
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            unit_results = list(pool.map(render_unit, units))
+        wall_time = time.perf_counter() - started
+        
+        # Hand the SVGs out to every chapter (and output tree) that uses them
+        succeeded = 0
+        for results, _ in unit_results:
+            for tikz_code, ok in results:
+                if not ok:
+                    continue
+                succeeded += 1
+                targets = []
+                for chapter_name, diagram_hash, output_dirs in requests[tikz_code]:
+                    svg_filename = f"{chapter_name}_{diagram_hash}.svg"
+                    targets.extend(output_dir / "diagrams" / svg_filename for output_dir in output_dirs)
+                    rendered[(chapter_name, diagram_hash)] = svg_filename
+                publish_output(staged[tikz_code].read_bytes(), targets)
+    
+    serial_time = sum(duration for _, duration in unit_results)
+    speedup = serial_time / wall_time if wall_time > 0 else 1.0
+    print(f"   ✓ Rendered {succeeded}/{len(requests)} unique TikZ diagram(s) in {len(units)} job(s) "
+          f"on {jobs} worker(s) in {wall_time:.1f}s (serial {serial_time:.1f}s, speedup {speedup:.1f}x)")
+    
+    report_tikz_failures(requests)
+    
+    return rendered
+
+def report_tool_usage(limit=5):
+    """Print what the external tools cost this run, and write TOOL_USAGE_FILE"""
+    stages = usage_by_stage()
+    if not stages:
+        return
+    print(f"\n⏱  External tools ({TOOL_USAGE_FILE.name}):")
+    for stage, totals in sorted(stages.items(), key=lambda item: -item[1]['cpu_seconds']):
+        print(f"   • {stage}: {totals['runs']} run(s), {totals['wall_seconds']:.1f}s wall, "
+              f"{totals['cpu_seconds']:.1f}s CPU, {totals['peak_rss_mb']:.0f} MB peak")
+    print(f"   Top {limit} by CPU time:")
+    for record in top_runs(limit):
+        print(f"   → {describe_run(record)}: {format_run(record)}")
+    write_usage_report(TOOL_USAGE_FILE)
+
+def report_tikz_failures(requests):
+    """Print the recorded failures for the diagrams of this run"""
+    toolchain = detect_tikz_toolchain()
+    failures = load_tikz_failures()
+    # A record next to a cached SVG is stale: the diagram has rendered since
+    keys = [tikz_cache_key(code, toolchain) for code in requests]
+    failed = [failures[key] for key in keys
+              if key in failures and not (TIKZ_CACHE_DIR / f"{key}.svg").exists()]
+    if not failed:
+        return
+    print(f"\n   ⚠ {len(failed)} TikZ diagram(s) failed to compile and were left as LaTeX "
+          f"(details in {TIKZ_FAILURES_DIR}/):")
+    for failure in sorted(failed, key=lambda f: (f['chapter'], f['diagram_hash'])):
+        last_error = failure['error'][-1] if failure['error'] else 'no output'
+        print(f"      • {failure['chapter']} {failure['diagram_hash']} ({failure['timestamp']}): {last_error}")
+
+def process_tikz_diagrams(latex_content, chapter_name, output_dirs, rendered=None):
+    """Replace all TikZ diagrams in the content with SVG placeholders, return modified content.
+    
+    rendered is the result of render_tikz_diagrams(); when omitted the chapter's
+    diagrams are rendered here, one at a time.
+    """
     
     # Extract all TikZ diagrams
     diagrams = extract_tikz_diagrams(latex_content, chapter_name)
@@ -249,42 +656,79 @@ def process_tikz_diagrams(latex_content, chapter_name, output_dirs):
     
     print(f"   → Found {len(diagrams)} TikZ diagram(s)")
     
-    # Create diagrams directory in each output location
-    for output_dir in output_dirs:
-        diagrams_dir = output_dir / "diagrams"
-        diagrams_dir.mkdir(parents=True, exist_ok=True)
+    if rendered is None:
+        rendered = render_tikz_diagrams([(chapter_name, latex_content, output_dirs)])
     
-    # Convert each diagram
     converted_count = 0
     for tikz_code, diagram_hash in diagrams:
-        svg_filename = f"{chapter_name}_{diagram_hash}.svg"
-        
-        # Convert to SVG (use first output dir for conversion)
-        primary_output = output_dirs[0] / "diagrams" / svg_filename
+        svg_filename = rendered.get((chapter_name, diagram_hash))
+        if svg_filename is None:
+            continue
+        converted_count += 1
         
-        if convert_tikz_to_svg(tikz_code, primary_output, chapter_name, diagram_hash):
-            converted_count += 1
-            
-            # Copy to other output directories
-            for output_dir in output_dirs[1:]:
-                dest = output_dir / "diagrams" / svg_filename
-                if primary_output.exists():
-                    import shutil
-                    shutil.copy2(primary_output, dest)
-            
-            # Replace TikZ code with SVG reference in the LaTeX content
-            # Wrap in figure environment if not already
-            svg_html = f'<div class="tikz-diagram"><img src="../diagrams/{svg_filename}" alt="TikZ Diagram" /></div>'
-            
-            # Replace the tikzpicture with a placeholder that will be converted to HTML
-            placeholder = f"%%%TIKZ_SVG:{svg_filename}%%%"
-            latex_content = latex_content.replace(tikz_code, placeholder)
+        # Replace the tikzpicture with a placeholder that will be converted to HTML
+        placeholder = f"%%%TIKZ_SVG:{svg_filename}%%%"
+        latex_content = latex_content.replace(tikz_code, placeholder)
     
     if converted_count > 0:
         print(f"   ✓ Converted {converted_count}/{len(diagrams)} TikZ diagram(s) to SVG")
     
     return latex_content
 
+def _has_bytes(path, data):
+    """True if path exists and holds exactly data"""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def publish_output(data, paths):
+    """Write data (str or bytes) to every path, writing it to disk only once.
+    
+    The content goes to one staging file next to the first target; the other
+    targets get a hardlink to it, or a copy when they are on another
+    filesystem. Each one is then renamed into place, so a reader (e.g. the
+    Node server) never sees a half-written file. Targets that already hold
+    these exact bytes are not touched. Returns the number of paths written.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    changed = [Path(path) for path in paths if not _has_bytes(path, data)]
+    if not changed:
+        return 0
+    
+    staged = []
+    try:
+        for path in changed:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+            if not staged:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.chmod(tmp_path, 0o644)
+            else:
+                os.close(fd)
+                os.remove(tmp_path)
+                try:
+                    os.link(staged[0][0], tmp_path)
+                except OSError:
+                    shutil.copy(staged[0][0], tmp_path)
+            staged.append((tmp_path, path))
+        while staged:
+            tmp_path, path = staged[-1]
+            os.replace(tmp_path, path)
+            staged.pop()
+    finally:
+        for tmp_path, _ in staged:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return len(changed)
+
 def read_latex_file(filepath):
     """Read LaTeX file content"""
     # Handle both relative and absolute paths
@@ -300,454 +744,227 @@ def read_latex_file(filepath):
         print(f"Warning: File not found: {filepath}")
         return None
 
-def convert_latex_to_html(latex_content):
-    """Convert LaTeX content to HTML with preserved math"""
+def convert_latex_to_html(latex_content, fragments=None, lazy=()):
+    """Convert LaTeX content to HTML with preserved math.
+
+    The chapter is lexed and parsed once (see latex_parser.py) and the tree
+    is emitted as HTML, so conversion time grows linearly with chapter size.
+    Algorithm pseudocode is formatted here too, before anything is written.
+    The environments in lazy ('solution', 'proof') go to the fragments list
+    instead, leaving collapsed stubs in the page.
+    """
     if not latex_content:
         return ""
     
-    html = latex_content
-    
-    # Convert TikZ SVG placeholders to HTML img tags
-    html = re.sub(
-        r'%%%TIKZ_SVG:([^%]+)%%%',
-        r'<div class="tikz-diagram"><img src="../diagrams/\1" alt="TikZ Diagram" /></div>',
-        html
-    )
-    
-    # Convert figure environments
-    # Handle figure with caption and label
-    def convert_figure(match):
-        """Convert LaTeX figure environment to HTML"""
-        content = match.group(1)
-        
-        # Extract caption if present - handle nested braces
-        caption = ''
-        caption_start = content.find('\\caption{')
-        if caption_start != -1:
-            # Find matching closing brace
-            brace_count = 0
-            i = caption_start + len('\\caption{')
-            start_pos = i
-            while i < len(content):
-                if content[i] == '{':
-                    brace_count += 1
-                elif content[i] == '}':
-                    if brace_count == 0:
-                        caption = content[start_pos:i]
-                        break
-                    brace_count -= 1
-                i += 1
-        
-        # Remove caption and label commands from content
-        if caption:
-            content = content.replace(f'\\caption{{{caption}}}', '')
-        content = re.sub(r'\\label\{[^}]+\}', '', content)
-        
-        # Remove \centering command
-        content = re.sub(r'\\centering\s*', '', content)
-        
-        # Clean up extra whitespace
-        content = content.strip()
-        
-        # Build HTML figure
-        if caption:
-            return f'<figure>\n{content}\n<figcaption>{caption}</figcaption>\n</figure>'
-        else:
-            return f'<figure>\n{content}\n</figure>'
-    
-    # Match figure environments (with optional positioning like [h], [htbp], etc.)
-    html = re.sub(
-        r'\\begin\{figure\}(?:\[[^\]]*\])?\s*(.*?)\\end\{figure\}',
-        convert_figure,
-        html,
-        flags=re.DOTALL
-    )
-    
-    # Build a label-to-number mapping for exercises
-    label_map = {}
-    exercise_counter = 0
-    
-    # Find all exercise labels and assign numbers
-    exercise_pattern = r'\\begin\{exercise\}.*?\\label\{([^}]+)\}'
-    for match in re.finditer(exercise_pattern, html, re.DOTALL):
-        exercise_counter += 1
-        label = match.group(1)
-        label_map[label] = exercise_counter
-    
-    # Remove LaTeX comments
-    html = re.sub(r'(?<!\\)%.*$', '', html, flags=re.MULTILINE)
-    
-    # Convert tables FIRST - before any other conversions
-    def convert_table_environment(match):
-        """Convert entire table environment including wrapper and tabular"""
-        full_content = match.group(0)
-        
-        # Extract tabular content - need to handle nested braces in column spec
-        # Find \begin{tabular}{ and then match balanced braces
-        start_match = re.search(r'\\begin\{tabular\}\{', full_content)
-        if not start_match:
-            return full_content
-        
-        # Find the matching closing brace for column spec
-        pos = start_match.end()
-        brace_count = 1
-        while pos < len(full_content) and brace_count > 0:
-            if full_content[pos] == '{':
-                brace_count += 1
-            elif full_content[pos] == '}':
-                brace_count -= 1
-            pos += 1
-        
-        if brace_count != 0:
-            return full_content  # Unbalanced braces
-        
-        # Now extract content between column spec end and \end{tabular}
-        content_start = pos
-        end_match = re.search(r'\\end\{tabular\}', full_content[content_start:])
-        if not end_match:
-            return full_content
-        
-        table_content = full_content[content_start:content_start + end_match.start()]
-        
-        # Remove all booktabs and table formatting commands with surrounding whitespace
-        # These can appear on their own lines or inline
-        table_content = re.sub(r'\s*\\toprule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\midrule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\bottomrule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\hline\s*', '\n', table_content)
-        
-        # Split by \\ for rows
-        rows = [r.strip() for r in table_content.split('\\\\') if r.strip()]
-        
-        html_rows = []
-        
-        for i, row in enumerate(rows):
-            row = row.strip()
-            if not row:
-                continue
-            
-            # Skip rows that are just whitespace or booktabs commands
-            if not row or re.match(r'^\\(toprule|midrule|bottomrule|hline)\s*$', row):
-                continue
-            
-            # Split by &
-            cells = [c.strip() for c in row.split('&')]
-            
-            # First row is typically the header
-            if i == 0:
-                html_rows.append('<tr>' + ''.join(f'<th>{cell}</th>' for cell in cells) + '</tr>')
-            else:
-                html_rows.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
-        
-        return '\n<table>\n' + '\n'.join(html_rows) + '\n</table>\n'
-    
-    # Match entire table environment
-    tables_found = len(re.findall(r'\\begin\{table\}.*?\\end\{table\}', html, flags=re.DOTALL))
-    html = re.sub(r'\\begin\{table\}.*?\\end\{table\}', convert_table_environment, html, flags=re.DOTALL)
-    tables_after = html.count('<table>')
+    html, tables_found, tables_after = latex_to_html(latex_content, fragments, lazy)
+    html = fix_algorithm_blocks(html)
+    if fragments:
+        fragments[:] = [(fragment_id, fix_algorithm_blocks(body)) for fragment_id, body in fragments]
     
     if tables_found > 0:
         print(f"  → Converted {tables_found} table environments to {tables_after} HTML tables [v2-FIXED]")
     
-    # Convert chapters and sections
-    # Handle \chapter[short]{long} format - use the long title
-    html = re.sub(r'\\chapter\*?\[([^\]]+)\]\{([^}]+)\}', r'<h1>\2</h1>', html)
-    # Handle \chapter{title} format
-    html = re.sub(r'\\chapter\*?\{([^}]+)\}', r'<h1>\1</h1>', html)
-    
-    # Handle sections with optional short titles
-    html = re.sub(r'\\section\*?\[([^\]]+)\]\{([^}]+)\}', r'<h2>\2</h2>', html)
-    html = re.sub(r'\\section\*?\{([^}]+)\}', r'<h2>\1</h2>', html)
-    
-    html = re.sub(r'\\subsection\*?\[([^\]]+)\]\{([^}]+)\}', r'<h3>\2</h3>', html)
-    html = re.sub(r'\\subsection\*?\{([^}]+)\}', r'<h3>\1</h3>', html)
-    
-    html = re.sub(r'\\subsubsection\*?\[([^\]]+)\]\{([^}]+)\}', r'<h4>\2</h4>', html)
-    html = re.sub(r'\\subsubsection\*?\{([^}]+)\}', r'<h4>\1</h4>', html)
-    
-    # Convert environments - handle both with and without labels
-    html = re.sub(r'\\begin\{definition\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="definition"><strong>Definition:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{definition\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{theorem\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="theorem"><strong>Theorem:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{theorem\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{lemma\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="lemma"><strong>Lemma:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{lemma\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{corollary\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="corollary"><strong>Corollary:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{corollary\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{proposition\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="proposition"><strong>Proposition:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{proposition\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{example\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', r'<div class="example"><strong>Example:</strong> ', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{example\}', r'</div>', html)
-    
-    # Convert exercise environment with numbering
-    exercise_num = 0
-    def format_exercise(match):
-        nonlocal exercise_num
-        exercise_num += 1
-        return f'<div class="exercise" id="exercise-{exercise_num}"><strong>Exercise {exercise_num}:</strong> '
-    
-    html = re.sub(r'\\begin\{exercise\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', format_exercise, html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{exercise\}', r'</div>', html)
-    
-    # Convert solution environment with reference to exercise number
-    def format_solution(match):
-        optional_ref = match.group(2) if match.group(2) else ''
-        
-        # Try to extract exercise reference
-        ref_match = re.search(r'\\ref\{([^}]+)\}', optional_ref)
-        if ref_match:
-            label = ref_match.group(1)
-            if label in label_map:
-                exercise_num = label_map[label]
-                return f'<div class="solution"><strong>Solution to Exercise {exercise_num}:</strong> '
-        
-        # Fallback if no reference found
-        return '<div class="solution"><strong>Solution:</strong> '
-    
-    html = re.sub(r'\\begin\{solution\}(\[([^\]]+)\])?\s*(\\label\{[^}]+\})?', format_solution, html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{solution\}', r'</div>', html)
-    
-    # Convert proof environment
-    def format_proof(match):
-        optional_title = match.group(2) if match.group(2) else ''
-        if optional_title:
-            return f'<div class="proof"><strong>Proof ({optional_title}):</strong> '
-        else:
-            return '<div class="proof"><strong>Proof:</strong> '
-    
-    html = re.sub(r'\\begin\{proof\}(\[([^\]]+)\])?', format_proof, html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{proof\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{keypoint\}', r'<div class="keypoint">', html)
-    html = re.sub(r'\\end\{keypoint\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{implementation\}', r'<div class="implementation">', html)
-    html = re.sub(r'\\end\{implementation\}', r'</div>', html)
-    
-    html = re.sub(r'\\begin\{caution\}', r'<div class="caution">', html)
-    html = re.sub(r'\\end\{caution\}', r'</div>', html)
-    
-    # Convert itemize and enumerate
-    html = re.sub(r'\\begin\{itemize\}', r'<ul>', html)
-    html = re.sub(r'\\end\{itemize\}', r'</ul>', html)
-    html = re.sub(r'\\begin\{enumerate\}', r'<ol>', html)
-    html = re.sub(r'\\end\{enumerate\}', r'</ol>', html)
-    html = re.sub(r'\\item\s+', r'<li>', html)
-    
-    # Convert center environment
-    html = re.sub(r'\\begin\{center\}', r'<div style="text-align: center;">', html)
-    html = re.sub(r'\\end\{center\}', r'</div>', html)
-    
-    # Convert standalone tabular environments (not wrapped in table environment)
-    def convert_standalone_tabular(match):
-        """Convert tabular environments that aren't inside table environments"""
-        full_content = match.group(0)
-        
-        # Find \begin{tabular}{ and then match balanced braces
-        start_match = re.search(r'\\begin\{tabular\}\{', full_content)
-        if not start_match:
-            return full_content
-        
-        # Find the matching closing brace for column spec
-        pos = start_match.end()
-        brace_count = 1
-        while pos < len(full_content) and brace_count > 0:
-            if full_content[pos] == '{':
-                brace_count += 1
-            elif full_content[pos] == '}':
-                brace_count -= 1
-            pos += 1
-        
-        if brace_count != 0:
-            return full_content  # Unbalanced braces
-        
-        # Now extract content between column spec end and \end{tabular}
-        content_start = pos
-        end_match = re.search(r'\\end\{tabular\}', full_content[content_start:])
-        if not end_match:
-            return full_content
-        
-        table_content = full_content[content_start:content_start + end_match.start()]
-        
-        # Remove all booktabs and table formatting commands with surrounding whitespace
-        table_content = re.sub(r'\s*\\toprule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\midrule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\bottomrule\s*', '\n', table_content)
-        table_content = re.sub(r'\s*\\hline\s*', '\n', table_content)
-        
-        # Split by \\ for rows
-        rows = [r.strip() for r in table_content.split('\\\\') if r.strip()]
-        
-        html_rows = []
-        
-        for i, row in enumerate(rows):
-            row = row.strip()
-            if not row:
-                continue
-            
-            # Skip rows that are just whitespace or booktabs commands
-            if not row or re.match(r'^\\(toprule|midrule|bottomrule|hline)\s*$', row):
-                continue
-            
-            # Split by &
-            cells = [c.strip() for c in row.split('&')]
-            
-            # First row is typically the header
-            if i == 0:
-                html_rows.append('<tr>' + ''.join(f'<th>{cell}</th>' for cell in cells) + '</tr>')
-            else:
-                html_rows.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
-        
-        return '\n<table>\n' + '\n'.join(html_rows) + '\n</table>\n'
-    
-    # Convert standalone tabular environments
-    html = re.sub(r'\\begin\{tabular\}\{[^}]+\}.*?\\end\{tabular\}', convert_standalone_tabular, html, flags=re.DOTALL)
-    
-    # Convert text formatting - handle nested braces properly
-    def convert_textbf(match):
-        content = match.group(1)
-        return f'<strong>{content}</strong>'
-    
-    def convert_textit(match):
-        content = match.group(1)
-        return f'<em>{content}</em>'
-    
-    def convert_texttt(match):
-        content = match.group(1)
-        return f'<code>{content}</code>'
-    
-    # Match \textbf{...} with proper brace counting
-    def find_and_replace_command(html, command, converter):
-        result = []
-        i = 0
-        pattern = f'\\{command}{{'
-        
-        while i < len(html):
-            pos = html.find(pattern, i)
-            if pos == -1:
-                result.append(html[i:])
-                break
-            
-            # Add text before the command
-            result.append(html[i:pos])
-            
-            # Find the matching closing brace
-            brace_count = 1
-            j = pos + len(pattern)
-            start = j
-            
-            while j < len(html) and brace_count > 0:
-                if html[j] == '{':
-                    brace_count += 1
-                elif html[j] == '}':
-                    brace_count -= 1
-                j += 1
-            
-            if brace_count == 0:
-                content = html[start:j-1]
-                result.append(converter(content))
-                i = j
-            else:
-                # Unmatched braces, keep original
-                result.append(pattern)
-                i = pos + len(pattern)
-        
-        return ''.join(result)
-    
-    html = find_and_replace_command(html, 'textbf', lambda c: f'<strong>{c}</strong>')
-    html = find_and_replace_command(html, 'textit', lambda c: f'<em>{c}</em>')
-    html = find_and_replace_command(html, 'texttt', lambda c: f'<code>{c}</code>')
-    
-    # Convert equations (preserve LaTeX for MathJax)
-    # Display equations - use $$ delimiters which MathJax handles better
-    html = re.sub(r'\\begin\{equation\}(.*?)\\end\{equation\}', r'<div class="equation">\n$$\1$$\n</div>', html, flags=re.DOTALL)
-    html = re.sub(r'\\begin\{align\}(.*?)\\end\{align\}', r'<div class="equation">\n$$\\begin{align}\1\\end{align}$$\n</div>', html, flags=re.DOTALL)
-    html = re.sub(r'\\begin\{align\*\}(.*?)\\end\{align\*\}', r'<div class="equation">\n$$\\begin{align*}\1\\end{align*}$$\n</div>', html, flags=re.DOTALL)
-    
-    # Convert lstlisting to code blocks
-    html = re.sub(r'\\begin\{lstlisting\}.*?\n(.*?)\\end\{lstlisting\}', r'<pre><code>\1</code></pre>', html, flags=re.DOTALL)
-    
-    # Convert verbatim to code blocks
-    html = re.sub(r'\\begin\{verbatim\}(.*?)\\end\{verbatim\}', r'<pre><code>\1</code></pre>', html, flags=re.DOTALL)
-    
-    # Convert algorithm environment
-    html = re.sub(r'\\begin\{algorithm\}.*?\\caption\{([^}]+)\}.*?\\label\{[^}]+\}', r'<div class="algorithm"><div class="algorithm-title">Algorithm: \1</div>', html, flags=re.DOTALL)
-    html = re.sub(r'\\end\{algorithm\}', r'</div>', html)
-    
-    # Remove remaining LaTeX commands that don't need conversion
-    html = re.sub(r'\\label\{[^}]+\}', '', html)
-    html = re.sub(r'\\ref\{[^}]+\}', '[ref]', html)
-    html = re.sub(r'\\cite\{[^}]+\}', '[citation]', html)
-    html = re.sub(r'\\addcontentsline\{[^}]+\}\{[^}]+\}\{[^}]+\}', '', html)
-    
-    # Protect pre/code blocks from paragraph processing by replacing newlines with placeholders
-    pre_blocks = []
-    def save_pre_block(match):
-        pre_blocks.append(match.group(0))
-        return f'___PRE_BLOCK_{len(pre_blocks)-1}___'
-    
-    html = re.sub(r'<pre><code>.*?</code></pre>', save_pre_block, html, flags=re.DOTALL)
-    
-    # Clean up paragraphs - but don't wrap block elements
-    # Split by double newlines
-    parts = re.split(r'\n\n+', html)
-    
-    # Only wrap text parts in <p> tags, not block elements
-    wrapped_parts = []
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        # Check if it's a block element (starts with <h, <div, <ul, <ol, <pre, <table, <figure) or a placeholder
-        if re.match(r'^\s*<(h[1-6]|div|ul|ol|pre|table|blockquote|figure)', part) or '___PRE_BLOCK_' in part:
-            wrapped_parts.append(part)
-        else:
-            wrapped_parts.append(f'<p>{part}</p>')
-    
-    html = '\n\n'.join(wrapped_parts)
-    
-    # Restore pre/code blocks
-    for i, block in enumerate(pre_blocks):
-        html = html.replace(f'___PRE_BLOCK_{i}___', block)
-    
-    # Clean up empty paragraphs
-    html = re.sub(r'<p>\s*</p>', '', html)
-    
-    # Fix any remaining nested p tags
-    html = re.sub(r'<p>\s*(<h[1-6]>)', r'\1', html)
-    html = re.sub(r'(</h[1-6]>)\s*</p>', r'\1', html)
-    html = re.sub(r'<p>\s*(<div)', r'\1', html)
-    html = re.sub(r'(</div>)\s*</p>', r'\1', html)
-    html = re.sub(r'<p>\s*(<ul>|<ol>)', r'\1', html)
-    html = re.sub(r'(</ul>|</ol>)\s*</p>', r'\1', html)
-    html = re.sub(r'<p>\s*(<figure)', r'\1', html)
-    html = re.sub(r'(</figure>)\s*</p>', r'\1', html)
-    
     return html
 
-def create_chapter_html(chapter_file, chapter_title, prev_chapter=None, next_chapter=None, output_dirs=None):
-    """Create HTML file for a chapter"""
+# MathJax skips everything inside this class except the MATH_CLASS elements
+# the converter put the math in, instead of searching every text node for $
+MATH_IGNORE_CLASS = 'tex-ignore'
+
+# Macros of the book's preamble, for MathJax and for build-time rendering
+MATHJAX_MACROS = {
+    'R': r'{\mathbb{R}}', 'N': r'{\mathbb{N}}', 'Z': r'{\mathbb{Z}}', 'C': r'{\mathbb{C}}',
+    **{f'v{c}': r'{\mathbf{%s}}' % c for c in string.ascii_lowercase},   # vectors: \vx
+    **{f'm{c}': r'{\mathbf{%s}}' % c for c in string.ascii_uppercase},   # matrices: \mW
+    'transpose': r'{^\top}',
+    'norm': [r'\left\|#1\right\|', 1],
+    'abs': [r'\left|#1\right|', 1],
+}
+
+def mathjax_head_html():
+    """MathJax configuration and loader for the <head> of a chapter page"""
+    macros = ',\n'.join(f"                {name}: {json.dumps(value)}" for name, value in MATHJAX_MACROS.items())
+    return f"""<!-- MathJax Configuration (must come before loading MathJax) -->
+    <script>
+    window.MathJax = {{
+        tex: {{
+            inlineMath: [['$', '$'], ['\\\\(', '\\\\)']],
+            displayMath: [['$$', '$$'], ['\\\\[', '\\\\]']],
+            processEscapes: true,
+            processEnvironments: true,
+            tags: 'ams',
+            macros: {{
+{macros}
+            }}
+        }},
+        options: {{
+            ignoreHtmlClass: '{MATH_IGNORE_CLASS}',
+            processHtmlClass: '{MATH_CLASS}'
+        }},
+        startup: {{
+            pageReady: () => {{
+                console.log('MathJax loaded and ready');
+                return MathJax.startup.defaultPageReady();
+            }}
+        }}
+    }};
+    </script>
+    <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
+    <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>"""
+
+# Fetches a solution or proof from the chapter's fragments file the first time
+# its stub is opened; the reader app (deeptech-app.js) does the same itself
+FRAGMENT_LOADER_SCRIPT = """
+    <script>
+    document.addEventListener('toggle', function (event) {
+        const stub = event.target;
+        if (!stub.open || !stub.dataset || !stub.dataset.fragment || stub.dataset.loaded) return;
+        stub.dataset.loaded = 'true';
+        window.chapterFragments = window.chapterFragments || fetch('%s')
+            .then(response => response.text())
+            .then(html => new DOMParser().parseFromString(html, 'text/html'));
+        window.chapterFragments.then(doc => {
+            const fragment = doc.getElementById(stub.dataset.fragment);
+            if (!fragment) return;
+            stub.insertAdjacentHTML('beforeend', fragment.innerHTML);
+            stub.classList.add('%s');
+            if (window.MathJax && window.MathJax.typesetPromise) window.MathJax.typesetPromise([stub]);
+        }).catch(() => {
+            delete stub.dataset.loaded;
+            window.chapterFragments = null;
+        });
+    }, true);
+    </script>"""
+
+def fragments_html(chapter_title, fragments):
+    """The fragments file of a chapter: one <div id=...> per solution or proof"""
+    body = '\n'.join(f'<div id="{fragment_id}">{html}</div>' for fragment_id, html in fragments)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="robots" content="noindex">
+    <title>{chapter_title} - Solutions and proofs</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+def publish_fragments(chapter_file, chapter_title, fragments, output_dirs):
+    """Write the chapter's fragments file, or remove a stale one when there are none"""
+    paths = [output_dir / f"{chapter_file}.fragments.html" for output_dir in output_dirs]
+    if fragments:
+        publish_output(fragments_html(chapter_title, fragments), paths)
+        print(f"   ✓ {len(fragments)} solution/proof fragment(s) moved to {chapter_file}.fragments.html")
+        return
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+# Per-chapter section fragments live in <output dir>/sections/<chapter>/
+SECTIONS_DIR_NAME = "sections"
+
+# Block tags a top-level <h2> can't be inside of
+_SECTION_SPLIT_RE = re.compile(r'<(/?)(div|ul|ol|table|figure|details|pre|blockquote)\b|^<h2>', re.MULTILINE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_HEADING_RE = re.compile(r'<h([12])>(.*?)</h\1>', re.DOTALL)
+
+def split_sections(html_content):
+    """Split chapter HTML before each top-level <h2>; return [(title, html)].
+    
+    The first part is what comes before the first section (the chapter
+    heading and introduction); it can be empty. Headings nested in a box are
+    left where they are.
+    """
+    starts = [0]
+    depth = 0
+    for m in _SECTION_SPLIT_RE.finditer(html_content):
+        if m.group(2):
+            depth += -1 if m.group(1) else 1
+        elif depth <= 0 and m.start() > 0:
+            starts.append(m.start())
+    starts.append(len(html_content))
+    sections = []
+    for start, end in zip(starts, starts[1:]):
+        html = html_content[start:end].strip()
+        heading = _HEADING_RE.search(html)
+        title = _TAG_RE.sub('', heading.group(2)).strip() if heading else ''
+        sections.append((title, html))
+    return sections
+
+def publish_sections(chapter_file, chapter_title, html_content, output_dirs):
+    """Write the chapter's section fragments and their index.json to every output dir.
+    
+    The index lists each section's id, title, file and size, so a reader can
+    fetch the first section right away and the rest as they are needed.
+    Fragments left over from a longer version of the chapter are removed.
+    """
+    index = {'chapter': chapter_file, 'title': chapter_title, 'sections': []}
+    files = {}
+    for number, (title, html) in enumerate(split_sections(html_content)):
+        data = html.encode('utf-8')
+        name = f"{number:02d}.html"
+        files[name] = data
+        index['sections'].append({'id': f'section-{number}', 'title': title, 'file': name, 'bytes': len(data)})
+    files['index.json'] = json.dumps(index, indent=2, ensure_ascii=False) + '\n'
+    
+    section_dirs = [output_dir / SECTIONS_DIR_NAME / chapter_file for output_dir in output_dirs]
+    for name, data in files.items():
+        publish_output(data, [section_dir / name for section_dir in section_dirs])
+    for section_dir in section_dirs:
+        for path in section_dir.iterdir():
+            if path.name not in files:
+                path.unlink()
+    print(f"   ✓ {len(index['sections'])} section fragment(s) in {SECTIONS_DIR_NAME}/{chapter_file}/")
+
+def create_chapter_html(chapter_file, chapter_title, prev_chapter=None, next_chapter=None, output_dirs=None,
+                        rendered_diagrams=None, latex_content=None, lazy=(), math_renderer=None):
+    """Create HTML file for a chapter (reads the .tex unless latex_content is given).
+
+    lazy names the environments ('solution', 'proof') moved out to
+    <chapter>.fragments.html and fetched only when a reader opens one.
+    With a math_renderer (see math_prerender.py) the math is rendered to
+    static markup here; the page only loads MathJax if some is left over.
+    """
     if output_dirs is None:
         output_dirs = [Path("output")]
     
-    # Use absolute path from project root
-    project_root = Path(__file__).parent.parent
-    latex_path = project_root / "chapters" / f"{chapter_file}.tex"
-    
-    latex_content = read_latex_file(latex_path)
+    if latex_content is None:
+        # Use absolute path from project root
+        project_root = Path(__file__).parent.parent
+        latex_content = read_latex_file(project_root / "chapters" / f"{chapter_file}.tex")
     
     if not latex_content:
         return
     
     # Process TikZ diagrams before converting to HTML
-    latex_content = process_tikz_diagrams(latex_content, chapter_file, output_dirs)
-    
-    html_content = convert_latex_to_html(latex_content)
+    latex_content = process_tikz_diagrams(latex_content, chapter_file, output_dirs, rendered_diagrams)
+    
+    fragments = []
+    html_content = convert_latex_to_html(latex_content, fragments, lazy)
+    
+    if math_renderer:
+        parts, math_css, stats = prerender_math([html_content] + [body for _, body in fragments],
+                                                math_renderer, MATHJAX_MACROS)
+        html_content = parts[0]
+        fragments = [(fragment_id, body) for (fragment_id, _), body in zip(fragments, parts[1:])]
+        # In the content rather than the <head>, so the reader app and the first section get it too
+        if math_css:
+            html_content = f'<style>{math_css}</style>\n{html_content}'
+        print(f"   ✓ Math: {stats['expressions']} expression(s), {stats['cached']} cached, "
+              f"{stats['rendered']} rendered, {stats['failed'] + stats['numbered']} left to MathJax "
+              f"({stats['numbered']} numbered)")
+    
+    publish_fragments(chapter_file, chapter_title, fragments, output_dirs)
+    publish_sections(chapter_file, chapter_title, html_content, output_dirs)
+    fragment_loader = FRAGMENT_LOADER_SCRIPT % (f"{chapter_file}.fragments.html", MATH_IGNORE_CLASS) if fragments else ""
+    
+    needs_mathjax = not math_renderer or any(has_marked_math(html)
+                                             for html in [html_content] + [body for _, body in fragments])
+    mathjax_head = mathjax_head_html() if needs_mathjax else ""
     
     # Navigation
     nav_html = '<div class="chapter-nav">\n'
@@ -773,89 +990,9 @@ def create_chapter_html(chapter_file, chapter_title, prev_chapter=None, next_cha
     <title>{chapter_title} - Deep Learning and Transformers</title>
     <link rel="stylesheet" href="../../styles.css">
     
-    <!-- MathJax Configuration (must come before loading MathJax) -->
-    <script>
-    window.MathJax = {{
-        tex: {{
-            inlineMath: [['$', '$'], ['\\\\(', '\\\\)']],
-            displayMath: [['$$', '$$'], ['\\\\[', '\\\\]']],
-            processEscapes: true,
-            processEnvironments: true,
-            tags: 'ams',
-            macros: {{
-                R: '{{\\\\mathbb{{R}}}}',
-                N: '{{\\\\mathbb{{N}}}}',
-                Z: '{{\\\\mathbb{{Z}}}}',
-                C: '{{\\\\mathbb{{C}}}}',
-                va: '{{\\\\mathbf{{a}}}}',
-                vb: '{{\\\\mathbf{{b}}}}',
-                vc: '{{\\\\mathbf{{c}}}}',
-                vd: '{{\\\\mathbf{{d}}}}',
-                ve: '{{\\\\mathbf{{e}}}}',
-                vf: '{{\\\\mathbf{{f}}}}',
-                vg: '{{\\\\mathbf{{g}}}}',
-                vh: '{{\\\\mathbf{{h}}}}',
-                vi: '{{\\\\mathbf{{i}}}}',
-                vj: '{{\\\\mathbf{{j}}}}',
-                vk: '{{\\\\mathbf{{k}}}}',
-                vl: '{{\\\\mathbf{{l}}}}',
-                vm: '{{\\\\mathbf{{m}}}}',
-                vn: '{{\\\\mathbf{{n}}}}',
-                vo: '{{\\\\mathbf{{o}}}}',
-                vp: '{{\\\\mathbf{{p}}}}',
-                vq: '{{\\\\mathbf{{q}}}}',
-                vr: '{{\\\\mathbf{{r}}}}',
-                vs: '{{\\\\mathbf{{s}}}}',
-                vt: '{{\\\\mathbf{{t}}}}',
-                vu: '{{\\\\mathbf{{u}}}}',
-                vv: '{{\\\\mathbf{{v}}}}',
-                vw: '{{\\\\mathbf{{w}}}}',
-                vx: '{{\\\\mathbf{{x}}}}',
-                vy: '{{\\\\mathbf{{y}}}}',
-                vz: '{{\\\\mathbf{{z}}}}',
-                mA: '{{\\\\mathbf{{A}}}}',
-                mB: '{{\\\\mathbf{{B}}}}',
-                mC: '{{\\\\mathbf{{C}}}}',
-                mD: '{{\\\\mathbf{{D}}}}',
-                mE: '{{\\\\mathbf{{E}}}}',
-                mF: '{{\\\\mathbf{{F}}}}',
-                mG: '{{\\\\mathbf{{G}}}}',
-                mH: '{{\\\\mathbf{{H}}}}',
-                mI: '{{\\\\mathbf{{I}}}}',
-                mJ: '{{\\\\mathbf{{J}}}}',
-                mK: '{{\\\\mathbf{{K}}}}',
-                mL: '{{\\\\mathbf{{L}}}}',
-                mM: '{{\\\\mathbf{{M}}}}',
-                mN: '{{\\\\mathbf{{N}}}}',
-                mO: '{{\\\\mathbf{{O}}}}',
-                mP: '{{\\\\mathbf{{P}}}}',
-                mQ: '{{\\\\mathbf{{Q}}}}',
-                mR: '{{\\\\mathbf{{R}}}}',
-                mS: '{{\\\\mathbf{{S}}}}',
-                mT: '{{\\\\mathbf{{T}}}}',
-                mU: '{{\\\\mathbf{{U}}}}',
-                mV: '{{\\\\mathbf{{V}}}}',
-                mW: '{{\\\\mathbf{{W}}}}',
-                mX: '{{\\\\mathbf{{X}}}}',
-                mY: '{{\\\\mathbf{{Y}}}}',
-                mZ: '{{\\\\mathbf{{Z}}}}',
-                transpose: '{{^\\\\top}}',
-                norm: ['\\\\left\\\\|#1\\\\right\\\\|', 1],
-                abs: ['\\\\left|#1\\\\right|', 1]
-            }}
-        }},
-        startup: {{
-            pageReady: () => {{
-                console.log('MathJax loaded and ready');
-                return MathJax.startup.defaultPageReady();
-            }}
-        }}
-    }};
-    </script>
-    <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
-    <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
+    {mathjax_head}{fragment_loader}
 </head>
-<body>
+<body class="{MATH_IGNORE_CLASS}">
     <nav>
         <a href="../../deeptech.html">🏠 Home</a>
         <a href="preface.html">Preface</a>
@@ -912,14 +1049,74 @@ def create_chapter_html(chapter_file, chapter_title, prev_chapter=None, next_cha
 """
     
     # Write HTML file to all output directories
-    for output_dir in output_dirs:
-        output_path = output_dir / f"{chapter_file}.html"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_html)
+    written = publish_output(full_html, [output_dir / f"{chapter_file}.html" for output_dir in output_dirs])
     
-    print(f"   ✓ {chapter_file}.html")
+    print(f"   ✓ {chapter_file}.html" + ("" if written else " (unchanged)"))
+
+def convert_chapter_job(job):
+    """Convert one chapter in a worker process.
+    
+    job holds the create_chapter_html arguments. The chapter's log is captured
+    and returned instead of printed, so the parent can print logs in chapter
+    order. Returns (chapter_file, error, log, tool runs); error is None on
+    success, and tool runs are the tool_runner records the chapter added.
+    """
+    chapter_file = job[0]
+    first_run = len(tool_runs())
+    log = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(log):
+        try:
+            create_chapter_html(*job)
+        except Exception:
+            error = traceback.format_exc()
+    return chapter_file, error, log.getvalue(), tool_runs()[first_run:]
+
+def convert_chapters(jobs_list, jobs=1, on_success=None):
+    """Convert chapters on a process pool, printing each log in input order.
+    
+    A chapter that raises is reported and skipped; the others still run.
+    on_success(chapter_file) is called for every chapter that converted.
+    Returns the list of chapter files that failed.
+    """
+    jobs = max(1, min(jobs, len(jobs_list)))
+    started = time.perf_counter()
+    failed = []
+    
+    if jobs == 1:
+        results = map(convert_chapter_job, jobs_list)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        futures = [pool.submit(convert_chapter_job, job) for job in jobs_list]
+        results = (future_result(future, job[0]) for future, job in zip(futures, jobs_list))
+    
+    try:
+        for chapter_file, error, log, runs in results:
+            # A worker's tool runs were recorded in its own process
+            if pool is not None:
+                add_tool_runs(runs)
+            print(log, end='')
+            if error:
+                failed.append(chapter_file)
+                last_line = error.strip().splitlines()[-1]
+                print(f"   ✗ {chapter_file}.html failed: {last_line}")
+            elif on_success:
+                on_success(chapter_file)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    
+    print(f"   ✓ Converted {len(jobs_list) - len(failed)}/{len(jobs_list)} chapter(s) "
+          f"on {jobs} worker(s) in {time.perf_counter() - started:.1f}s")
+    return failed
+
+def future_result(future, chapter_file):
+    """Result of a convert_chapter_job future, turning a dead worker into a chapter error"""
+    try:
+        return future.result()
+    except Exception:
+        return chapter_file, traceback.format_exc(), "", []
 
 def create_index_html(output_dirs=None):
     """Create main index page"""
@@ -1017,13 +1214,38 @@ def create_index_html(output_dirs=None):
 </html>
 """
     
-    for base_dir in output_dirs:
-        output_path = base_dir / "index.html"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
+    publish_output(html, [base_dir / "index.html" for base_dir in output_dirs])
     
     print(f"Created: index.html")
 
+def _braced_argument(text, start):
+    """Content and end of the {...} group opening at text[start], or None if it doesn't close"""
+    depth = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i], i + 1
+        i += 1
+    return None
+
+def _algorithm_command(line, name):
+    """(argument, text after it) of the first \\name{...} in line, or None"""
+    start = line.find(f'\\{name}{{')
+    if start == -1:
+        return None
+    argument = _braced_argument(line, start + len(name) + 1)
+    if argument is None:
+        return None
+    return argument[0], line[argument[1]:]
+
 def convert_algorithm_content(content):
     """Convert LaTeX algorithm pseudocode to properly formatted HTML."""
     
@@ -1032,84 +1254,71 @@ def convert_algorithm_content(content):
     result = []
     indent_level = 0
     
+    # Block openers: \For{condition}{ and so on (arguments may hold nested braces).
+    # algorithmic's \For{condition} ... \EndFor is accepted too.
+    openers = [('For', 'for', 'do'), ('While', 'while', 'do'), ('If', 'if', 'then')]
+    closers = ('\\EndFor', '\\EndWhile', '\\EndIf')
+    
     for line in lines:
         line = line.strip()
         if not line:
             continue
         
-        # Handle \KwIn
-        if line.startswith('\\KwIn{'):
-            match = re.match(r'\\KwIn\{(.+)\}', line)
+        # Handle \KwIn / \KwOut
+        if line.startswith('\\KwIn{') or line.startswith('\\KwOut{'):
+            label = 'Input' if line.startswith('\\KwIn{') else 'Output'
+            match = _algorithm_command(line, 'KwIn' if label == 'Input' else 'KwOut')
             if match:
-                result.append(f'<div class="algorithm-line"><strong>Input:</strong> {match.group(1)}</div>')
+                result.append(f'<div class="algorithm-line"><strong>{label}:</strong> {match[0]}</div>')
                 continue
         
-        # Handle \KwOut
-        if line.startswith('\\KwOut{'):
-            match = re.match(r'\\KwOut\{(.+)\}', line)
-            if match:
-                result.append(f'<div class="algorithm-line"><strong>Output:</strong> {match.group(1)}</div>')
-                continue
-        
-        # Handle \For{...}{ - check for this pattern anywhere in the line
-        if '\\For{' in line:
-            match = re.search(r'\\For\{([^}]+)\}\{', line)
-            if match:
-                condition = match.group(1)
+        # Handle \For{...}{, \While{...}{ and \If{...}{
+        opened = False
+        for name, keyword, closing in openers:
+            match = _algorithm_command(line, name)
+            if match and (match[1].startswith('{') or (line.startswith(f'\\{name}{{') and not match[1].strip())):
                 # Replace \KwTo with 'to'
-                condition = condition.replace('\\KwTo', 'to')
-                result.append(f'<div class="algorithm-line"><strong>for</strong> {condition} <strong>do</strong></div>')
-                result.append('<div class="algorithm-indent">')
-                indent_level += 1
-                continue
-        
-        # Handle \While{...}{
-        if '\\While{' in line:
-            match = re.search(r'\\While\{([^}]+)\}\{', line)
-            if match:
-                condition = match.group(1)
-                result.append(f'<div class="algorithm-line"><strong>while</strong> {condition} <strong>do</strong></div>')
+                condition = match[0].replace('\\KwTo', 'to')
+                result.append(f'<div class="algorithm-line"><strong>{keyword}</strong> {condition} '
+                              f'<strong>{closing}</strong></div>')
                 result.append('<div class="algorithm-indent">')
                 indent_level += 1
-                continue
+                opened = True
+                break
+        if opened:
+            continue
         
-        # Handle \If{...}{
-        if '\\If{' in line:
-            match = re.search(r'\\If\{([^}]+)\}\{', line)
-            if match:
-                condition = match.group(1)
-                result.append(f'<div class="algorithm-line"><strong>if</strong> {condition} <strong>then</strong></div>')
-                result.append('<div class="algorithm-indent">')
-                indent_level += 1
-                continue
+        # algorithmic's environment lines carry nothing to show
+        if line.startswith('\\begin{algorithmic}') or line == '\\end{algorithmic}':
+            continue
+        if line.startswith('\\State '):
+            line = line[len('\\State '):].strip()
         
         # Handle closing braces
-        if line == '}':
+        if line == '}' or line in closers:
             if indent_level > 0:
                 result.append('</div>')
                 indent_level -= 1
             continue
         
         # Handle \Return{...}
-        if '\\Return{' in line:
-            match = re.search(r'\\Return\{([^}]+)\}', line)
-            if match:
-                result.append(f'<div class="algorithm-line"><strong>return</strong> {match.group(1)}</div>')
-                continue
+        match = _algorithm_command(line, 'Return')
+        if match:
+            result.append(f'<div class="algorithm-line"><strong>return</strong> {match[0]}</div>')
+            continue
         
         # Handle regular lines with \\ at the end
         if line.endswith('\\\\'):
             line = line[:-2].strip()
         
         # Handle comments
-        if '\\tcp{' in line:
-            match = re.search(r'\\tcp\{([^}]+)\}', line)
-            if match:
-                result.append(f'<div class="algorithm-line"><span class="algorithm-comment">// {match.group(1)}</span></div>')
-                continue
+        match = _algorithm_command(line, 'tcp')
+        if match:
+            result.append(f'<div class="algorithm-line"><span class="algorithm-comment">// {match[0]}</span></div>')
+            continue
         
-        # Regular line - skip if it's just a leftover LaTeX command
-        if line and not line.startswith('\\'):
+        # Anything else, including commands no rule above knows, is kept as text
+        if line:
             result.append(f'<div class="algorithm-line">{line}</div>')
     
     # Close any remaining indent blocks
@@ -1119,40 +1328,62 @@ def convert_algorithm_content(content):
     
     return '\n'.join(result)
 
+# An algorithm block as emitted by latex_parser: title div, then the raw body
+ALGORITHM_BLOCK_RE = re.compile(
+    r'(<div class="algorithm"><div class="algorithm-title">)(.*?)(</div>)\s*(.*?)\s*(</div>)', re.DOTALL)
+
+def fix_algorithm_blocks(html):
+    """Format the pseudocode of every algorithm block in an HTML string.
+    
+    Blocks that are already formatted are left alone, so this can be run
+    again over pages from an earlier build.
+    """
+    def replace_algorithm(match):
+        opening, title, title_close, body, closing = match.groups()
+        if body.startswith('<div class="algorithm-'):
+            return match.group(0)
+        return f'{opening}{title}{title_close}\n{convert_algorithm_content(body)}\n{closing}'
+    
+    return ALGORITHM_BLOCK_RE.sub(replace_algorithm, html)
+
 def fix_algorithms_in_dir(output_dir):
-    """Fix algorithm formatting in all generated HTML files in a directory."""
+    """Fix algorithm formatting in existing HTML files in a directory.
+    
+    The converter already does this in memory; this is for re-processing
+    pages written by an older build. Returns the number of files fixed.
+    """
     output_dir = Path(output_dir)
     
     if not output_dir.exists():
-        return
+        print(f"Directory {output_dir} not found, skipping...")
+        return 0
     
+    fixed = 0
     for filepath in sorted(output_dir.glob("chapter*.html")):
         with open(filepath, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        original_content = content
-        
-        # Find all algorithm blocks
-        pattern = r'(<div class="algorithm"><div class="algorithm-title">)([^<]+)(</div>)\s*(.*?)\s*(</div>)'
-        
-        def replace_algorithm(match):
-            opening = match.group(1)
-            title = match.group(2)
-            title_close = match.group(3)
-            body = match.group(4)
-            closing = match.group(5)
-            
-            # Convert the body
-            converted_body = convert_algorithm_content(body)
-            
-            return f'{opening}{title}{title_close}\n{converted_body}\n{closing}'
-        
-        content = re.sub(pattern, replace_algorithm, content, flags=re.DOTALL)
-        
-        if content != original_content:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
+        new_content = fix_algorithm_blocks(content)
+        if new_content != content:
+            publish_output(new_content, [filepath])
             print(f"  ✓ Fixed algorithms in {filepath.name}")
+            fixed += 1
+    return fixed
+
+def fix_algorithms_main(argv=None):
+    """Entry point of the standalone fix_algorithms scripts"""
+    parser = argparse.ArgumentParser(description="Fix algorithm formatting in existing chapter HTML files")
+    parser.add_argument('directories', nargs='*', type=Path,
+                        help="directories to process (default: the converter's output directories)")
+    args = parser.parse_args(argv)
+    
+    total_fixed = 0
+    for directory in args.directories or default_output_dirs():
+        print(f"\nProcessing {directory}...")
+        total_fixed += fix_algorithms_in_dir(directory)
+    
+    print(f"\n✓ Complete! Fixed {total_fixed} files.")
+    return 0
 
 def update_app_js_chapters(chapters_list, output_paths):
     """Update app.js files with the current chapter list"""
@@ -1281,8 +1512,150 @@ def update_server_js_chapters(chapters_list, server_js_path):
     else:
         print(f"   ⚠ No changes needed in {server_js_path.name}")
 
-def main():
+# Build manifest: what each chapter page was last built from
+BUILD_MANIFEST_FILE = Path(__file__).parent / ".build_manifest.json"
+
+# Code that turns LaTeX into chapter HTML
+CONVERTER_FILES = [Path(__file__), Path(__file__).parent / "latex_parser.py",
+                   Path(__file__).parent / "math_prerender.py"]
+
+# Manifest fields and how a change in each is reported
+REBUILD_REASONS = {
+    'source': "source changed",
+    'code': "converter code changed",
+    'neighbours': "neighbour titles changed",
+    'tikz': "TikZ toolchain changed",
+    'options': "build options changed",
+    'math': "math renderer changed",
+}
+
+def _sha256_text(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def converter_code_hash():
+    """Hash of the converter sources, page template included; any edit invalidates every chapter"""
+    return _sha256_text(*(path.read_text(encoding='utf-8') for path in CONVERTER_FILES))
+
+def chapter_build_inputs(latex_content, prev_chapter, next_chapter, lazy=(), math_renderer=None):
+    """Everything a chapter page depends on, as a dict of hashes for the manifest"""
+    inputs = {
+        'source': _sha256_text(latex_content),
+        'code': converter_code_hash(),
+        'neighbours': _sha256_text(json.dumps([prev_chapter, next_chapter])),
+        'tikz': '',
+        'options': _sha256_text(json.dumps(sorted(lazy))),
+        'math': _sha256_text(math_renderer, renderer_version(math_renderer)) if math_renderer else '',
+    }
+    # Whether diagrams become SVGs or stay LaTeX depends on the tools found
+    if '\\begin{tikzpicture}' in latex_content:
+        inputs['tikz'] = _sha256_text(json.dumps(detect_tikz_toolchain(), sort_keys=True))
+    return inputs
+
+def chapter_diagram_files(chapter_file, latex_content, failures):
+    """(SVG files a chapter page links to, how many of its diagrams are recorded as failing)"""
+    toolchain = detect_tikz_toolchain()
+    if toolchain is None:
+        # The diagrams stay LaTeX, so there are no files to expect
+        return [], 0
+    svg_files = []
+    failed = 0
+    for tikz_code, diagram_hash in extract_tikz_diagrams(latex_content, chapter_file):
+        if tikz_cache_key(tikz_code, toolchain) in failures:
+            failed += 1
+        else:
+            svg_files.append(f"{chapter_file}_{diagram_hash}.svg")
+    return svg_files, failed
+
+def load_build_manifest():
+    """Return {chapter_file: inputs} from the last build, or {}"""
+    try:
+        with open(BUILD_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_build_manifest(manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=BUILD_MANIFEST_FILE.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, BUILD_MANIFEST_FILE)
+
+def chapter_rebuild_reasons(chapter_file, inputs, previous, output_dirs, diagram_files=()):
+    """Why a chapter needs rebuilding; an empty list means it is up to date.
+    
+    diagram_files are the SVGs the page links to, expected in each diagrams/.
+    """
+    if previous is None:
+        return ["not built before"]
+    reasons = [reason for key, reason in REBUILD_REASONS.items() if previous.get(key) != inputs[key]]
+    if any(not (output_dir / f"{chapter_file}.html").exists()
+           or not (output_dir / SECTIONS_DIR_NAME / chapter_file / "index.json").exists()
+           or not all((output_dir / "diagrams" / svg_file).exists() for svg_file in diagram_files)
+           for output_dir in output_dirs):
+        reasons.append("output missing")
+    return reasons
+
+def default_output_dirs():
+    """Directories every deep tech chapter page is published to"""
+    project_root = Path(__file__).parent.parent
+    return [
+        project_root / "chapters",                    # Root chapters (deployed to Vercel)
+        project_root / "nodejs-version" / "public" / "chapters" / "deeptech",  # Node.js version - deep tech book
+        project_root / "docs" / "chapters",           # GitHub Pages
+    ]
+
+def preflight_check(sources, known_environments):
+    """Print the pre-flight problems of {path: source}; return False if there are errors"""
+    errors, warnings = check_sources(sources, known_environments)
+    for message in warnings:
+        print(f"   ⚠ {message}")
+    for message in errors:
+        print(f"   ✗ {message}")
+    if errors:
+        print(f"   ✗ {len(errors)} error(s) in the LaTeX sources - nothing was built (--no-preflight to build anyway)")
+        return False
+    print(f"   ✓ {len(sources)} file(s) checked, {len(warnings)} warning(s)")
+    return True
+
+def add_tikz_render_args(parser):
+    """Add the TikZ render and pre-flight options shared by both book converters"""
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="number of parallel workers for TikZ rendering and chapter conversion "
+                             "(default: CPU count)")
+    parser.add_argument('--batch', action='store_true',
+                        help="compile uncached TikZ diagrams several per pdflatex run")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="retry TikZ diagrams recorded as failing in a previous build")
+    parser.add_argument('--no-preflight', action='store_true',
+                        help="don't check the LaTeX sources for unbalanced braces and environments first")
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Convert the LaTeX textbook chapters to HTML")
+    add_tikz_render_args(parser)
+    parser.add_argument('--leadership', action='store_true',
+                        help="also convert the leadership book, sharing the TikZ render queue")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every chapter, ignoring the build manifest")
+    parser.add_argument('--lazy', action='append', default=[], choices=sorted(LAZY_ENVIRONMENTS),
+                        help="move this environment (solution, or proofs longer than "
+                             f"{LAZY_PROOF_MIN_CHARS} characters) out of the page into "
+                             "<chapter>.fragments.html, loaded when a reader opens it; repeatable")
+    parser.add_argument('--prerender-math', metavar='RENDERER',
+                        help="render the math to static markup at build time with a local renderer: "
+                             f"{' or '.join(MATH_RENDERERS)}, or a command speaking the "
+                             "math_prerender.py protocol; results are cached in .math_cache/")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main conversion function"""
+    args = parse_args(argv)
+    
     print("=" * 70)
     print("Converting LaTeX textbook chapters to HTML")
     print("=" * 70)
@@ -1290,12 +1663,7 @@ def main():
     # Get project root (parent of html-build)
     project_root = Path(__file__).parent.parent
     
-    # Define all output directories
-    output_dirs = [
-        project_root / "chapters",                    # Root chapters (deployed to Vercel)
-        project_root / "nodejs-version" / "public" / "chapters" / "deeptech",  # Node.js version - deep tech book
-        project_root / "docs" / "chapters",           # GitHub Pages
-    ]
+    output_dirs = default_output_dirs()
     
     print(f"\n📂 Output directories:")
     for output_dir in output_dirs:
@@ -1305,29 +1673,110 @@ def main():
     for output_dir in output_dirs:
         output_dir.mkdir(parents=True, exist_ok=True)
     
-    print(f"\n📝 Converting {len(CHAPTERS)} chapters...")
-    
-    # Convert each chapter to all output directories
+    chapter_sources = {}
+    for chapter_file, _ in CHAPTERS:
+        latex_content = read_latex_file(project_root / "chapters" / f"{chapter_file}.tex")
+        if latex_content:
+            chapter_sources[chapter_file] = latex_content
+    
+    if args.leadership:
+        import convert_leadership_final
+        leadership_sources = convert_leadership_final.collect_tikz_sources()
+    
+    # Catch broken sources before any pdflatex or pdf2svg run
+    if not args.no_preflight:
+        print(f"\n🔎 Pre-flight check of the LaTeX sources...")
+        ok = preflight_check({f"chapters/{chapter_file}.tex": latex_content
+                              for chapter_file, latex_content in chapter_sources.items()},
+                             CONVERTED_ENVIRONMENTS)
+        if args.leadership:
+            ok = convert_leadership_final.preflight_leadership(leadership_sources) and ok
+        if not ok:
+            return 1
+    
+    if args.prerender_math:
+        print(f"\n🧮 Math renderer: {args.prerender_math}")
+        version = renderer_version(args.prerender_math)
+        if version:
+            print(f"   ✓ {version}")
+        else:
+            print(f"   ⚠ Can't run it (for the built-in ones: node and `npm install mathjax-full`); "
+                  f"math is left to MathJax")
+            args.prerender_math = None
+    
+    # Work out which chapters changed since the last build
+    print(f"\n🔍 Checking build manifest...")
+    manifest = {} if args.force else load_build_manifest()
+    tikz_failures = load_tikz_failures()
+    chapter_inputs = {}
+    to_build = []
     for i, (chapter_file, chapter_title) in enumerate(CHAPTERS):
         prev_chapter = CHAPTERS[i-1] if i > 0 else None
         next_chapter = CHAPTERS[i+1] if i < len(CHAPTERS)-1 else None
-        create_chapter_html(chapter_file, chapter_title, prev_chapter, next_chapter, output_dirs)
+        if chapter_file not in chapter_sources:
+            # create_chapter_html reports the missing file
+            to_build.append(i)
+            continue
+        inputs = chapter_build_inputs(chapter_sources[chapter_file], prev_chapter, next_chapter, args.lazy,
+                                      args.prerender_math)
+        chapter_inputs[chapter_file] = inputs
+        diagram_files, failed_diagrams = chapter_diagram_files(chapter_file, chapter_sources[chapter_file],
+                                                               tikz_failures)
+        reasons = ["--force"] if args.force else chapter_rebuild_reasons(
+            chapter_file, inputs, manifest.get(chapter_file), output_dirs, diagram_files)
+        # Failed diagrams are only retried for chapters that get rebuilt
+        if args.retry_failed and failed_diagrams and not args.force:
+            reasons.append(f"{failed_diagrams} failed diagram(s) to retry")
+        if reasons:
+            print(f"   → {chapter_file}: {', '.join(reasons)}")
+            to_build.append(i)
+    print(f"   ✓ {len(CHAPTERS) - len(to_build)} unchanged chapter(s) skipped, {len(to_build)} to rebuild")
+    
+    # Render the TikZ diagrams of every chapter to rebuild up front on one worker pool
+    print(f"\n🎨 Rendering TikZ diagrams ({args.jobs} worker(s))...")
+    tikz_sources = [(CHAPTERS[i][0], chapter_sources[CHAPTERS[i][0]], output_dirs)
+                    for i in to_build if CHAPTERS[i][0] in chapter_sources]
+    if args.leadership:
+        tikz_sources.extend(leadership_sources)
+    rendered_diagrams = render_tikz_diagrams(tikz_sources, jobs=args.jobs, batch=args.batch,
+                                             retry_failed=args.retry_failed)
+    
+    print(f"\n📝 Converting {len(to_build)} of {len(CHAPTERS)} chapters...")
+    
+    # Convert each changed chapter to all output directories on a process pool;
+    # a worker only gets its own chapter's diagrams
+    chapter_jobs = []
+    for i in to_build:
+        chapter_file, chapter_title = CHAPTERS[i]
+        prev_chapter = CHAPTERS[i-1] if i > 0 else None
+        next_chapter = CHAPTERS[i+1] if i < len(CHAPTERS)-1 else None
+        chapter_diagrams = {key: svg for key, svg in rendered_diagrams.items() if key[0] == chapter_file}
+        chapter_jobs.append((chapter_file, chapter_title, prev_chapter, next_chapter, output_dirs,
+                             chapter_diagrams, chapter_sources.get(chapter_file), args.lazy,
+                             args.prerender_math))
     
-    # Fix algorithm formatting in all directories
-    print("\n🔧 Fixing algorithm formatting...")
-    for output_dir in output_dirs:
-        fix_algorithms_in_dir(output_dir)
+    def record_built(chapter_file):
+        if chapter_file in chapter_inputs:
+            manifest[chapter_file] = chapter_inputs[chapter_file]
+            save_build_manifest(manifest)
+    
+    failed_chapters = convert_chapters(chapter_jobs, jobs=args.jobs, on_success=record_built)
+    
+    if args.leadership:
+        print(f"\n📝 Converting leadership book...")
+        convert_leadership_final.convert_chapters(rendered_diagrams, leadership_sources)
+    
+    report_tool_usage()
     
     # Copy TEX files to docs for reference
     print("\n📄 Copying TEX source files to docs...")
     docs_chapters = project_root / "docs" / "chapters"
     chapters_source = project_root / "chapters"
     
-    import shutil
-    for tex_file in chapters_source.glob("*.tex"):
-        dest = docs_chapters / tex_file.name
-        shutil.copy2(tex_file, dest)
-    print(f"   ✓ Copied {len(list(chapters_source.glob('*.tex')))} TEX files")
+    tex_files = sorted(chapters_source.glob("*.tex"))
+    copied = sum(publish_output(tex_file.read_bytes(), [docs_chapters / tex_file.name])
+                 for tex_file in tex_files)
+    print(f"   ✓ Copied {copied} TEX files ({len(tex_files) - copied} unchanged)")
     
     # Update app.js files with chapter list
     print("\n🔄 Updating app.js files with chapter list...")
@@ -1346,7 +1795,8 @@ def main():
     print("✅ Conversion complete!")
     print("=" * 70)
     print(f"\n📊 Summary:")
-    print(f"   • Chapters converted: {len(CHAPTERS)}")
+    print(f"   • Chapters converted: {len(to_build) - len(failed_chapters)} "
+          f"({len(CHAPTERS) - len(to_build)} unchanged, {len(failed_chapters)} failed)")
     print(f"   • Output locations: {len(output_dirs)}")
     print(f"   • App.js files updated: {len(app_js_paths)}")
     print(f"   • Server.js updated: 1")
@@ -1363,6 +1813,11 @@ def main():
     print(f"   3. Commit: git add chapters/ app.js nodejs-version/ docs/")
     print(f"   4. Push: git push")
     print()
+    
+    if failed_chapters:
+        print(f"❌ {len(failed_chapters)} chapter(s) failed: {', '.join(failed_chapters)}")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,760 @@
+#!/usr/bin/env python3
+"""
+Single-pass LaTeX lexer, parser and HTML emitter for the chapter converter.
+
+The lexer walks the chapter once and produces tokens; math, verbatim-like
+environments and TikZ pictures come out as single opaque tokens, so nothing
+inside them is rewritten by accident. The parser builds a small document
+tree from those tokens, and HtmlEmitter turns the tree into HTML using the
+same elements and classes as the old regex passes in convert_latex_to_html.
+Anything the emitter does not know is written back out as LaTeX source.
+
+Where the output differs from the old passes it is on purpose:
+  - list items and paragraphs are closed (</li>, </p>), and tags balance
+  - listing and verbatim bodies are HTML-escaped, and % lines in code are kept
+  - math is left exactly as written for MathJax (no <strong>/<code> inside it),
+    in an element of class MATH_CLASS so MathJax needn't search the text for it
+  - \item[label] becomes a bold label, as for \item with a space
+  - an \end{...} without a \begin is dropped instead of closing a random <div>
+"""
+
+import re
+from html import escape
+
+# ── Document tree ───────────────────────────────────────────────────────
+
+class Text:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+class Par:
+    """A blank line (paragraph break)"""
+    __slots__ = ()
+
+PAR = Par()
+
+class Math:
+    """Inline or display math, kept as source including its delimiters"""
+    __slots__ = ('source', 'display')
+
+    def __init__(self, source, display):
+        self.source = source
+        self.display = display
+
+class Tikz:
+    """A %%%TIKZ_SVG:...%%% placeholder left by process_tikz_diagrams"""
+    __slots__ = ('filename',)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+class Group:
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = children
+
+class Command:
+    __slots__ = ('name', 'opt', 'args')
+
+    def __init__(self, name, opt=None, args=()):
+        self.name = name
+        self.opt = opt
+        self.args = args
+
+class Env:
+    __slots__ = ('name', 'opt', 'args', 'children')
+
+    def __init__(self, name, opt, args, children):
+        self.name = name
+        self.opt = opt
+        self.args = args
+        self.children = children
+
+class StrayEnd:
+    """An \\end{...} with no matching \\begin"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+class RawEnv:
+    """An environment whose body is not parsed (math, code, TikZ)"""
+    __slots__ = ('name', 'header', 'body')
+
+    def __init__(self, name, header, body):
+        self.name = name
+        self.header = header
+        self.body = body
+
+# ── Lexer ───────────────────────────────────────────────────────────────
+
+# One alternative per token kind, tried in order at each position. Plain text
+# comes first since it is by far the most common token; paragraph breaks are
+# split out of it afterwards. A command whose only argument is plain text is
+# taken as a single token. Math, verbatim-like environments and TikZ pictures
+# are matched whole, so their contents are never tokenized; like TeX, math
+# never runs across a paragraph break, so a stray $ stays plain text. The
+# alternatives inside the math loops each consume a single character and
+# start with different characters, so an unclosed $ fails in linear time.
+_TOKEN_RE = re.compile(r'''
+    (?P<text>[^\\{}$%\[\]]+)
+  | (?P<simple>\\(?P<sname>(?:chapter|section|subsection|subsubsection)\*?|textbf|textit|texttt|label|ref)\{(?P<sarg>[^{}\\$%]*)\})
+  | (?P<tikz>%%%TIKZ_SVG:(?P<tikzfile>[^%]+)%%%)
+  | (?P<comment>%[^\n]*)
+  | (?P<dmath>\$\$(?:[^$\n]|\$(?!\$)|\n(?![ \t]*\n))*\$\$)
+  | (?P<imath>\$(?=[^$])(?:[^$\\\n]|\\[^\n]|\n(?![ \t]*\n))*\$)
+  | (?P<raw>(?P<rbegin>\\begin\{(?P<rname>equation|align\*?|verbatim|lstlisting|tikzpicture)\})(?P<rbody>[\s\S]*?)\\end\{(?P=rname)\})
+  | (?P<begin>\\begin\{(?P<bname>[^}]+)\})
+  | (?P<end>\\end\{(?P<ename>[^}]+)\})
+  | (?P<bmath>\\\[[\s\S]*?\\\])
+  | (?P<pmath>\\\([\s\S]*?\\\))
+  | (?P<cmd>\\(?P<cname>[a-zA-Z@]+\*?|[\s\S]))
+  | (?P<bgroup>\{)
+  | (?P<egroup>\})
+  | (?P<lbrack>\[)
+  | (?P<rbrack>\])
+  | (?P<other>[\s\S])
+''', re.VERBOSE)
+
+_PAR_RE = re.compile(r'\n[ \t]*\n\s*')
+
+BGROUP, EGROUP, LBRACK, RBRACK = ('bgroup', None), ('egroup', None), ('lbrack', None), ('rbrack', None)
+
+def tokenize(source):
+    """Split LaTeX source into tokens in one left-to-right scan.
+
+    Leaves of the document tree (text, math, raw environments, ...) come out
+    as nodes ready for the parser; everything else as a (kind, value) tuple.
+    """
+    tokens = []
+    append = tokens.append
+    for m in _TOKEN_RE.finditer(source):
+        kind = m.lastgroup
+        if kind == 'text':
+            text = m.group()
+            if '\n' in text and _PAR_RE.search(text):
+                for i, piece in enumerate(_PAR_RE.split(text)):
+                    if i:
+                        append(PAR)
+                    if piece:
+                        append(Text(piece))
+            else:
+                append(Text(text))
+        elif kind == 'cmd':
+            append(('cmd', m.group('cname')))
+        elif kind == 'simple':
+            append(Command(m.group('sname'), None, [[Text(m.group('sarg'))]]))
+        elif kind == 'begin':
+            append(('begin', m.group('bname')))
+        elif kind == 'end':
+            append(('end', m.group('ename')))
+        elif kind == 'dmath' or kind == 'bmath':
+            append(Math(m.group(), True))
+        elif kind == 'imath' or kind == 'pmath':
+            append(Math(m.group(), False))
+        elif kind == 'raw':
+            append(RawEnv(m.group('rname'), m.group('rbegin'), m.group('rbody')))
+        elif kind == 'tikz':
+            append(Tikz(m.group('tikzfile')))
+        elif kind == 'other':
+            append(Text(m.group()))
+        elif kind != 'comment':
+            append((kind, None))
+    return tokens
+
+# ── Parser ──────────────────────────────────────────────────────────────
+
+# Commands whose arguments are parsed: name -> (takes optional arg, number of mandatory args)
+COMMAND_ARGS = {
+    'chapter': (True, 1), 'chapter*': (True, 1),
+    'section': (True, 1), 'section*': (True, 1),
+    'subsection': (True, 1), 'subsection*': (True, 1),
+    'subsubsection': (True, 1), 'subsubsection*': (True, 1),
+    'textbf': (False, 1), 'textit': (False, 1), 'texttt': (False, 1),
+    'label': (False, 1), 'ref': (False, 1), 'cite': (True, 1),
+    'caption': (True, 1), 'addcontentsline': (False, 3),
+    'item': (True, 0),
+}
+
+# Environments whose arguments are parsed: name -> (takes optional arg, number of mandatory args)
+ENVIRONMENT_ARGS = {
+    'tabular': (False, 1),
+    'figure': (True, 0), 'table': (True, 0), 'algorithm': (True, 0),
+    'definition': (True, 0), 'theorem': (True, 0), 'lemma': (True, 0),
+    'corollary': (True, 0), 'proposition': (True, 0), 'example': (True, 0),
+    'exercise': (True, 0), 'solution': (True, 0), 'proof': (True, 0),
+    'itemize': (True, 0), 'enumerate': (True, 0),
+}
+
+class Parser:
+    """Build a document tree from tokens; unbalanced input is closed implicitly"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.open_envs = []
+        self.group_depth = 0
+
+    def parse(self):
+        nodes = self.parse_nodes(None)
+        # Anything left over is a stray closer at top level
+        while self.pos < len(self.tokens):
+            nodes.append(self.stray_token(self.tokens[self.pos]))
+            self.pos += 1
+            nodes.extend(self.parse_nodes(None))
+        return nodes
+
+    def stray_token(self, token):
+        kind, value = token
+        if kind == 'egroup':
+            return Text('}')
+        if kind == 'rbrack':
+            return Text(']')
+        return StrayEnd(value)
+
+    def parse_nodes(self, closer):
+        """Parse until closer: None (end of input), '}', ']' or an environment name"""
+        nodes = []
+        append = nodes.append
+        tokens = self.tokens
+        count = len(tokens)
+        pos = self.pos
+        while pos < count:
+            token = tokens[pos]
+            if type(token) is not tuple:
+                append(token)
+                pos += 1
+                continue
+            kind, value = token
+            if kind == 'cmd':
+                self.pos = pos + 1
+                append(self.parse_command(value))
+                pos = self.pos
+                continue
+            elif kind == 'bgroup':
+                self.pos = pos + 1
+                self.group_depth += 1
+                children = self.parse_nodes('}')
+                self.group_depth -= 1
+                pos = self.pos
+                if pos < count and tokens[pos] == EGROUP:
+                    pos += 1
+                append(Group(children))
+                continue
+            elif kind == 'egroup':
+                if closer == '}' or self.group_depth > 0:
+                    break
+                append(Text('}'))
+            elif kind == 'rbrack':
+                if closer == ']':
+                    break
+                append(Text(']'))
+            elif kind == 'lbrack':
+                append(Text('['))
+            elif kind == 'begin':
+                self.pos = pos + 1
+                append(self.parse_environment(value))
+                pos = self.pos
+                continue
+            elif kind == 'end':
+                if value == closer or value in self.open_envs:
+                    break
+                append(StrayEnd(value))
+            pos += 1
+        self.pos = pos
+        return nodes
+
+    def parse_optional(self):
+        """Parse [..] right at the current position, or return None"""
+        if self.pos < len(self.tokens) and self.tokens[self.pos] == LBRACK:
+            start = self.pos
+            self.pos += 1
+            nodes = self.parse_nodes(']')
+            if self.pos < len(self.tokens) and self.tokens[self.pos] == RBRACK:
+                self.pos += 1
+                return nodes
+            self.pos = start
+        return None
+
+    def parse_mandatory(self):
+        """Parse a {..} argument, skipping leading spaces; return None if there is none"""
+        pos = self.pos
+        tokens = self.tokens
+        while pos < len(tokens) and type(tokens[pos]) is Text and not tokens[pos].text.strip():
+            pos += 1
+        if pos < len(tokens) and tokens[pos] == BGROUP:
+            self.pos = pos + 1
+            self.group_depth += 1
+            children = self.parse_nodes('}')
+            self.group_depth -= 1
+            if self.pos < len(tokens) and tokens[self.pos] == EGROUP:
+                self.pos += 1
+            return children
+        return None
+
+    def parse_arguments(self, spec):
+        """Parse (optional, mandatory...) arguments; return None if they are not all present"""
+        start = self.pos
+        takes_optional, mandatory = spec
+        opt = self.parse_optional() if takes_optional else None
+        args = []
+        for _ in range(mandatory):
+            arg = self.parse_mandatory()
+            if arg is None:
+                self.pos = start
+                return None
+            args.append(arg)
+        return opt, args
+
+    def parse_command(self, name):
+        spec = COMMAND_ARGS.get(name)
+        if spec is None:
+            return Command(name)
+        parsed = self.parse_arguments(spec)
+        if parsed is None:
+            return Command(name)
+        return Command(name, parsed[0], parsed[1])
+
+    def parse_environment(self, name):
+        opt, args = None, []
+        spec = ENVIRONMENT_ARGS.get(name)
+        if spec is not None:
+            parsed = self.parse_arguments(spec)
+            if parsed is not None:
+                opt, args = parsed
+        self.open_envs.append(name)
+        children = self.parse_nodes(name)
+        self.open_envs.pop()
+        if self.pos < len(self.tokens) and self.tokens[self.pos] == ('end', name):
+            self.pos += 1
+        return Env(name, opt, args, children)
+
+def parse_latex(source):
+    """Parse LaTeX source into a list of document tree nodes"""
+    return Parser(tokenize(source)).parse()
+
+# ── HTML emitter ────────────────────────────────────────────────────────
+
+HEADING_LEVELS = {'chapter': 1, 'section': 2, 'subsection': 3, 'subsubsection': 4}
+
+THEOREM_ENVIRONMENTS = {
+    'definition': 'Definition', 'theorem': 'Theorem', 'lemma': 'Lemma',
+    'corollary': 'Corollary', 'proposition': 'Proposition', 'example': 'Example',
+}
+
+BOX_ENVIRONMENTS = {'keypoint', 'implementation', 'caution'}
+
+BLOCK_ENVIRONMENTS = (set(THEOREM_ENVIRONMENTS) | BOX_ENVIRONMENTS | {
+    'figure', 'table', 'tabular', 'exercise', 'solution', 'proof',
+    'itemize', 'enumerate', 'center', 'algorithm',
+})
+
+BLOCK_RAW_ENVIRONMENTS = {'equation', 'align', 'align*', 'verbatim', 'lstlisting'}
+
+TABLE_RULES = {'toprule', 'midrule', 'bottomrule', 'hline'}
+
+# Every piece of math the converter finds is in an element of this class;
+# the pages tell MathJax to typeset inside these elements and nowhere else
+MATH_CLASS = 'tex-math'
+
+# Environments that can be moved out of the page into a fragment loaded on demand
+LAZY_ENVIRONMENTS = {'solution', 'proof'}
+
+# Proofs shorter than this (in HTML characters) stay in the page even when lazy
+LAZY_PROOF_MIN_CHARS = 1500
+
+# Paragraphs that already start with a block element are not wrapped in <p>
+_BLOCK_HTML_RE = re.compile(r'\s*<(h[1-6]|div|ul|ol|pre|table|blockquote|figure)')
+_COMMENT_RE = re.compile(r'(?<!\\)%.*$', re.MULTILINE)
+_MATH_LABEL_RE = re.compile(r'\\label\{[^}]+\}')
+
+def clean_math(source):
+    """Drop comments and labels from math; everything else is left for MathJax"""
+    if '%' in source:
+        source = _COMMENT_RE.sub('', source)
+    if '\\label' in source:
+        source = _MATH_LABEL_RE.sub('', source)
+    return source
+
+def math_html(source):
+    """Inline or display math, with its delimiters, marked for MathJax"""
+    return f'<span class="{MATH_CLASS}">{clean_math(source)}</span>'
+
+def find_command(nodes, name):
+    """Depth-first search for the first command called name"""
+    for node in nodes:
+        cls = type(node)
+        if cls is Command:
+            if node.name == name:
+                return node
+            for arg in node.args:
+                found = find_command(arg, name)
+                if found:
+                    return found
+        elif cls is Group or cls is Env:
+            found = find_command(node.children, name)
+            if found:
+                return found
+    return None
+
+def find_environment(nodes, name):
+    """Depth-first search for the first environment called name"""
+    for node in nodes:
+        cls = type(node)
+        if cls is Env:
+            if node.name == name:
+                return node
+            found = find_environment(node.children, name)
+            if found:
+                return found
+        elif cls is Group:
+            found = find_environment(node.children, name)
+            if found:
+                return found
+    return None
+
+class HtmlEmitter:
+    """Turn a document tree into chapter HTML.
+
+    Environments named in lazy ('solution', 'proof') are not written into the
+    page: their body goes to self.fragments as (fragment id, html) and the page
+    gets a collapsed <details> stub, titled as the box would be, whose
+    data-fragment names it.
+    """
+
+    def __init__(self, lazy=()):
+        self.label_map = {}
+        self.exercise_num = 0
+        self.tables_found = 0
+        self.tables_converted = 0
+        self.lazy = set(lazy)
+        self.fragments = []
+
+    def emit_document(self, nodes):
+        # Number exercises up front so solutions can refer to them
+        self.number_exercises(nodes, [0])
+        return self.emit_flow(nodes)
+
+    def number_exercises(self, nodes, counter):
+        for node in nodes:
+            cls = type(node)
+            if cls is Env:
+                if node.name == 'exercise':
+                    counter[0] += 1
+                    label = find_command(node.children, 'label')
+                    if label and label.args:
+                        self.label_map[self.plain_text(label.args[0])] = counter[0]
+                self.number_exercises(node.children, counter)
+            elif cls is Group:
+                self.number_exercises(node.children, counter)
+
+    def plain_text(self, nodes):
+        return ''.join(node.text for node in nodes if type(node) is Text).strip()
+
+    # ── Flow and inline content ──
+
+    def is_block(self, node):
+        cls = type(node)
+        if cls is Env:
+            return node.name in BLOCK_ENVIRONMENTS
+        if cls is RawEnv:
+            return node.name in BLOCK_RAW_ENVIRONMENTS
+        if cls is Command:
+            return node.name.rstrip('*') in HEADING_LEVELS and node.args != ()
+        return cls is Tikz
+
+    def emit_flow(self, nodes, wrap_first=True):
+        """Emit paragraphs and blocks; inline runs become <p> paragraphs.
+
+        With wrap_first=False the leading run is left unwrapped, so that it
+        follows the heading of a theorem-like box on the same line.
+        """
+        out = []
+        run = []
+
+        def flush():
+            text = ''.join(run).strip()
+            run.clear()
+            if text:
+                if (wrap_first or out) and not _BLOCK_HTML_RE.match(text):
+                    text = f'<p>{text}</p>'
+                out.append(text)
+
+        def walk(nodes):
+            for node in nodes:
+                cls = type(node)
+                if cls is Text:
+                    run.append(node.text)
+                elif cls is Math:
+                    run.append(math_html(node.source))
+                elif cls is Par:
+                    flush()
+                elif cls is Env and node.name not in BLOCK_ENVIRONMENTS:
+                    # Unknown environments stay as LaTeX, but their paragraphs
+                    # are still laid out like the surrounding text
+                    run.append(self.begin_source(node))
+                    walk(node.children)
+                    run.append('\\end{' + node.name + '}')
+                elif self.is_block(node):
+                    flush()
+                    html = self.emit_node(node).strip()
+                    if html:
+                        out.append(html)
+                else:
+                    run.append(self.emit_node(node))
+
+        walk(nodes)
+        flush()
+        return '\n\n'.join(out)
+
+    def emit_inline(self, nodes):
+        if len(nodes) == 1 and type(nodes[0]) is Text:
+            return nodes[0].text
+        return ''.join([self.emit_node(node) for node in nodes])
+
+    def emit_node(self, node):
+        cls = type(node)
+        if cls is Text:
+            return node.text
+        if cls is Math:
+            return math_html(node.source)
+        if cls is Command:
+            return self.emit_command(node)
+        if cls is Group:
+            return '{' + self.emit_inline(node.children) + '}'
+        if cls is Env:
+            return self.emit_environment(node)
+        if cls is RawEnv:
+            return self.emit_raw_environment(node)
+        if cls is Par:
+            return '\n\n'
+        if cls is StrayEnd:
+            # Converted environments have nothing left to close
+            return '' if node.name in BLOCK_ENVIRONMENTS else '\\end{' + node.name + '}'
+        if cls is Tikz:
+            return f'<div class="tikz-diagram"><img src="../diagrams/{node.filename}" alt="TikZ Diagram" /></div>'
+        return ''
+
+    def emit_raw_command(self, node):
+        """Write a command back out as LaTeX (with its arguments converted)"""
+        html = '\\' + node.name
+        if node.opt is not None:
+            html += '[' + self.emit_inline(node.opt) + ']'
+        for arg in node.args:
+            html += '{' + self.emit_inline(arg) + '}'
+        return html
+
+    # ── Commands ──
+
+    def emit_command(self, node):
+        name = node.name
+        if not node.args and name != 'item':
+            return '\\' + name
+        base = name.rstrip('*')
+        if base in HEADING_LEVELS:
+            level = HEADING_LEVELS[base]
+            return f'<h{level}>{self.emit_inline(node.args[0])}</h{level}>'
+        if name == 'textbf':
+            return f'<strong>{self.emit_inline(node.args[0])}</strong>'
+        if name == 'textit':
+            return f'<em>{self.emit_inline(node.args[0])}</em>'
+        if name == 'texttt':
+            return f'<code>{self.emit_inline(node.args[0])}</code>'
+        if name == 'label' or name == 'addcontentsline':
+            return ''
+        if name == 'ref':
+            return '[ref]'
+        if name == 'cite':
+            return '[citation]'
+        if name == 'item':
+            # \item outside a list
+            return '<li>'
+        return self.emit_raw_command(node)
+
+    # ── Environments ──
+
+    def emit_environment(self, node):
+        name = node.name
+        if name in THEOREM_ENVIRONMENTS:
+            body = self.emit_flow(node.children, wrap_first=False)
+            return f'<div class="{name}"><strong>{THEOREM_ENVIRONMENTS[name]}:</strong> {body}</div>'
+        if name == 'exercise':
+            self.exercise_num += 1
+            body = self.emit_flow(node.children, wrap_first=False)
+            return (f'<div class="exercise" id="exercise-{self.exercise_num}">'
+                    f'<strong>Exercise {self.exercise_num}:</strong> {body}</div>')
+        if name == 'solution':
+            return self.emit_solution(node)
+        if name == 'proof':
+            body = self.emit_flow(node.children, wrap_first=False)
+            title = f'Proof ({self.emit_inline(node.opt)})' if node.opt else 'Proof'
+            if 'proof' in self.lazy and len(body) >= LAZY_PROOF_MIN_CHARS:
+                return self.emit_lazy('proof', title, body)
+            return f'<div class="proof"><strong>{title}:</strong> {body}</div>'
+        if name in BOX_ENVIRONMENTS:
+            return f'<div class="{name}">{self.emit_flow(node.children, wrap_first=False)}</div>'
+        if name == 'center':
+            return f'<div style="text-align: center;">{self.emit_flow(node.children, wrap_first=False)}</div>'
+        if name == 'itemize':
+            return self.emit_list(node, 'ul')
+        if name == 'enumerate':
+            return self.emit_list(node, 'ol')
+        if name == 'figure':
+            return self.emit_figure(node)
+        if name == 'table':
+            self.tables_found += 1
+            tabular = find_environment(node.children, 'tabular')
+            if tabular is not None and tabular.args:
+                self.tables_converted += 1
+                return self.emit_tabular(tabular)
+        elif name == 'tabular' and node.args:
+            return self.emit_tabular(node)
+        elif name == 'algorithm':
+            return self.emit_algorithm(node)
+        return self.emit_raw_environment_source(node)
+
+    def begin_source(self, node):
+        """Write an environment's \\begin (and arguments) back out as LaTeX"""
+        html = '\\begin{' + node.name + '}'
+        if node.opt is not None:
+            html += '[' + self.emit_inline(node.opt) + ']'
+        for arg in node.args:
+            html += '{' + self.emit_inline(arg) + '}'
+        return html
+
+    def emit_raw_environment_source(self, node):
+        """Write an unknown environment back out as LaTeX (with its body converted)"""
+        return self.begin_source(node) + self.emit_inline(node.children) + '\\end{' + node.name + '}'
+
+    def emit_solution(self, node):
+        body = self.emit_flow(node.children, wrap_first=False)
+        title = 'Solution'
+        ref = find_command(node.opt or [], 'ref')
+        if ref is not None and ref.args:
+            label = self.plain_text(ref.args[0])
+            if label in self.label_map:
+                title = f'Solution to Exercise {self.label_map[label]}'
+        if 'solution' in self.lazy:
+            return self.emit_lazy('solution', title, body)
+        return f'<div class="solution"><strong>{title}:</strong> {body}</div>'
+
+    def emit_lazy(self, name, title, body):
+        """Move a solution or proof into self.fragments and return its stub"""
+        fragment_id = f'{name}-{len(self.fragments) + 1}'
+        self.fragments.append((fragment_id, body))
+        return (f'<details class="{name} lazy-fragment" data-fragment="{fragment_id}">'
+                f'<summary><strong>{title}</strong></summary></details>')
+
+    def emit_list(self, node, tag):
+        lead = []
+        items = []
+        for child in node.children:
+            if type(child) is Command and child.name == 'item':
+                items.append((child.opt, []))
+            elif items:
+                items[-1][1].append(child)
+            else:
+                lead.append(child)
+
+        html = [f'<{tag}>']
+        leading = self.emit_inline(lead).strip()
+        if leading:
+            html.append(leading)
+        for opt, body in items:
+            label = f'<strong>{self.emit_inline(opt)}</strong> ' if opt is not None else ''
+            html.append(f'<li>{label}{self.emit_flow(body, wrap_first=False)}</li>')
+        html.append(f'</{tag}>')
+        return '\n'.join(html)
+
+    def emit_figure(self, node):
+        caption = ''
+        content = []
+        for child in node.children:
+            if type(child) is Command:
+                if child.name == 'caption' and child.args and not caption:
+                    caption = self.emit_inline(child.args[0])
+                    continue
+                if child.name == 'centering' or (child.name == 'label' and child.args):
+                    continue
+            content.append(child)
+        body = self.emit_inline(content).strip()
+        if caption:
+            return f'<figure>\n{body}\n<figcaption>{caption}</figcaption>\n</figure>'
+        return f'<figure>\n{body}\n</figure>'
+
+    def emit_tabular(self, node):
+        rows = []
+        cells = [[]]
+        for child in node.children:
+            cls = type(child)
+            if cls is Text:
+                # Alignment tabs are left in the text by the lexer
+                first, *rest = child.text.split('&')
+                cells[-1].append(first)
+                cells.extend([cell] for cell in rest)
+            elif cls is Command and child.name == '\\':
+                rows.append(cells)
+                cells = [[]]
+            elif cls is Command and child.name in TABLE_RULES:
+                continue
+            else:
+                cells[-1].append(self.emit_node(child))
+        rows.append(cells)
+
+        html_rows = []
+        for row in rows:
+            html_cells = [''.join(cell).strip() for cell in row]
+            if len(html_cells) == 1 and not html_cells[0]:
+                continue
+            tag = 'th' if not html_rows else 'td'
+            html_rows.append('<tr>' + ''.join(f'<{tag}>{cell}</{tag}>' for cell in html_cells) + '</tr>')
+
+        return '\n<table>\n' + '\n'.join(html_rows) + '\n</table>\n'
+
+    def emit_algorithm(self, node):
+        title = None
+        start = 0
+        for i, child in enumerate(node.children):
+            if type(child) is Command and child.args:
+                if child.name == 'caption' and title is None:
+                    title = self.emit_inline(child.args[0])
+                    start = i + 1
+                elif child.name == 'label' and title is not None:
+                    start = i + 1
+                    break
+        title_html = f'Algorithm: {title}' if title is not None else 'Algorithm'
+        body = self.emit_inline(node.children[start:])
+        return f'<div class="algorithm"><div class="algorithm-title">{title_html}</div>{body}</div>'
+
+    def emit_raw_environment(self, node):
+        name = node.name
+        if name == 'equation':
+            return f'<div class="equation {MATH_CLASS}">\n$${clean_math(node.body)}$$\n</div>'
+        if name == 'align' or name == 'align*':
+            return (f'<div class="equation {MATH_CLASS}">\n$$\\begin{{{name}}}{clean_math(node.body)}'
+                    f'\\end{{{name}}}$$\n</div>')
+        if name == 'lstlisting':
+            # The rest of the \begin line holds the listing options
+            newline = node.body.find('\n')
+            code = node.body[newline + 1:] if newline != -1 else ''
+            return f'<pre><code>{escape(code, quote=False)}</code></pre>'
+        if name == 'verbatim':
+            return f'<pre><code>{escape(node.body, quote=False)}</code></pre>'
+        # TikZ that could not be rendered is left as source, minus its comments
+        return node.header + _COMMENT_RE.sub('', node.body) + '\\end{' + name + '}'
+
+def latex_to_html(source, fragments=None, lazy=()):
+    """Convert LaTeX source to HTML.
+
+    Returns (html, table environments found, table environments converted).
+    The environments in lazy are appended to the fragments list as
+    (fragment id, html) and left in the page as collapsed stubs.
+    """
+    emitter = HtmlEmitter(lazy)
+    html = emitter.emit_document(parse_latex(source))
+    if fragments is not None:
+        fragments.extend(emitter.fragments)
+    return html, emitter.tables_found, emitter.tables_converted
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Pre-flight check for chapter sources, run before any pdflatex or pdf2svg job.
+
+One left-to-right scan per file checks that braces balance, that every
+\\begin{...} is closed by the matching \\end{...}, and (for the HTML build)
+that environments are ones the converter knows. Problems are reported as
+file:line messages in well under a second for the whole book, instead of
+after minutes of pdflatex passes whose output nobody sees.
+
+Usage:  python latex_preflight.py [--no-environments] [FILE ...]
+        (default: chapters/*.tex and leadership-book/chapters/*.tex)
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from latex_parser import BLOCK_ENVIRONMENTS, BLOCK_RAW_ENVIRONMENTS
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Environments latex_parser turns into HTML; anything else is written out as LaTeX
+CONVERTED_ENVIRONMENTS = BLOCK_ENVIRONMENTS | BLOCK_RAW_ENVIRONMENTS | {'tikzpicture'}
+
+# The leadership converter also rewrites tcolorbox before handing over to latex_parser
+LEADERSHIP_ENVIRONMENTS = CONVERTED_ENVIRONMENTS | {'tcolorbox'}
+
+# Only ever used inside math, which MathJax renders as written
+MATH_ENVIRONMENTS = {
+    'matrix', 'pmatrix', 'bmatrix', 'Bmatrix', 'vmatrix', 'Vmatrix', 'smallmatrix',
+    'cases', 'array', 'aligned', 'gathered', 'split',
+}
+
+# Whatever is nested in these comes out as one block (math, a diagram, an
+# algorithm listing), so the environments inside them are not checked
+OPAQUE_ENVIRONMENTS = {'tikzpicture', 'algorithm', 'equation', 'equation*', 'align', 'align*'}
+
+# Bodies that are not LaTeX at all: skipped up to their \end
+VERBATIM_ENVIRONMENTS = {'verbatim', 'lstlisting'}
+
+# The lookahead lets the scan skip plain text without trying every alternative
+_TOKEN_RE = re.compile(r'''
+    (?=[\\{}%])
+    (?:
+    (?P<verb>\\(?:verb\*?|lstinline)(?P<delim>[^a-zA-Z\s*{[]).*?(?P=delim))
+  | (?P<escaped>\\[\\{}%$&\#_])
+  | (?P<begin>\\begin\s*\{(?P<bname>[^}]*)\})
+  | (?P<end>\\end\s*\{(?P<ename>[^}]*)\})
+  | (?P<comment>%[^\n]*)
+  | (?P<open>\{)
+  | (?P<close>\})
+    )
+''', re.VERBOSE)
+
+def check_source(source, known_environments=None):
+    """Return [(line, 'error' | 'warning', message)] for one file's source.
+
+    known_environments is the set the converter handles; None skips that
+    check (the PDF build doesn't care which converter knows what).
+    """
+    problems = []
+
+    # Only needed for the (few) problems reported, so counted on demand
+    def line_of(pos):
+        return source.count('\n', 0, pos) + 1
+
+    # One stack for both: ('{', pos) and (environment name, pos)
+    stack = []
+    pos = 0
+    while True:
+        m = _TOKEN_RE.search(source, pos)
+        if not m:
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'open':
+            stack.append(('{', m.start()))
+        elif kind == 'close':
+            if stack and stack[-1][0] == '{':
+                stack.pop()
+            elif stack:
+                problems.append((line_of(m.start()), 'error',
+                                 f"'}}' closes nothing inside \\begin{{{stack[-1][0]}}} "
+                                 f"(line {line_of(stack[-1][1])})"))
+            else:
+                problems.append((line_of(m.start()), 'error', "'}' without a matching '{'"))
+        elif kind == 'begin':
+            name = m.group('bname')
+            if (known_environments is not None and name not in known_environments
+                    and name not in MATH_ENVIRONMENTS
+                    and not any(open_name in OPAQUE_ENVIRONMENTS for open_name, _ in stack)):
+                problems.append((line_of(m.start()), 'warning',
+                                 f"environment '{name}' is not converted to HTML"))
+            if name in VERBATIM_ENVIRONMENTS:
+                # Braces and \begin inside a listing are just text
+                closing = source.find(f'\\end{{{name}}}', pos)
+                if closing < 0:
+                    problems.append((line_of(m.start()), 'error', f"\\begin{{{name}}} is never closed"))
+                    break
+                pos = closing + len(f'\\end{{{name}}}')
+            else:
+                stack.append((name, m.start()))
+        elif kind == 'end':
+            name = m.group('ename')
+            if not any(open_name == name for open_name, _ in stack):
+                problems.append((line_of(m.start()), 'error', f"\\end{{{name}}} without a matching \\begin"))
+                continue
+            # Whatever is still open inside the environment was never closed
+            while stack[-1][0] != name:
+                open_name, open_pos = stack.pop()
+                what = "'{'" if open_name == '{' else f"\\begin{{{open_name}}}"
+                problems.append((line_of(open_pos), 'error',
+                                 f"{what} is not closed before \\end{{{name}}} (line {line_of(m.start())})"))
+            stack.pop()
+    for open_name, open_pos in stack:
+        what = "'{'" if open_name == '{' else f"\\begin{{{open_name}}}"
+        problems.append((line_of(open_pos), 'error', f"{what} is never closed"))
+    return sorted(problems)
+
+def check_sources(sources, known_environments=None):
+    """Check {path: source}; return (errors, warnings) as "path:line: message" strings"""
+    errors = []
+    warnings = []
+    for path, source in sources.items():
+        for line, severity, message in check_source(source, known_environments):
+            (errors if severity == 'error' else warnings).append(f"{path}:{line}: {message}")
+    return errors, warnings
+
+def default_sources():
+    """[(path, known environments, source)] for both books' chapters"""
+    sources = []
+    for pattern, known in (("chapters/*.tex", CONVERTED_ENVIRONMENTS),
+                           ("leadership-book/chapters/*.tex", LEADERSHIP_ENVIRONMENTS)):
+        for path in sorted(PROJECT_ROOT.glob(pattern)):
+            sources.append((path.relative_to(PROJECT_ROOT), known, path.read_text(encoding='utf-8')))
+    return sources
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check LaTeX chapters before building")
+    parser.add_argument('files', nargs='*', type=Path,
+                        help="files to check (default: both books' chapters)")
+    parser.add_argument('--no-environments', action='store_true',
+                        help="only check braces and \\begin/\\end pairing")
+    args = parser.parse_args(argv)
+
+    if args.files:
+        sources = [(path, CONVERTED_ENVIRONMENTS, path.read_text(encoding='utf-8')) for path in args.files]
+    else:
+        sources = default_sources()
+    errors = []
+    warnings = []
+    for path, known, source in sources:
+        file_errors, file_warnings = check_sources({path: source}, None if args.no_environments else known)
+        errors += file_errors
+        warnings += file_warnings
+
+    for message in errors:
+        print(f"{message} (error)")
+    for message in warnings:
+        print(f"{message} (warning)")
+    print(f"{len(sources)} file(s) checked: {len(errors)} error(s), {len(warnings)} warning(s)")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Optional build-time math rendering for the chapter pages.
+
+The converter puts every expression it finds in a MATH_CLASS element. With
+a renderer, those are replaced by static markup (SVG or MathML) when the
+pages are built, so the reader's browser has nothing left to typeset.
+
+A renderer is any local command that reads
+    {"macros": {...}, "items": [{"tex": "...", "display": false}, ...]}
+as JSON on stdin and writes
+    {"results": [{"html": "..."} or {"error": "..."}, ...], "css": "..."}
+on stdout, one result per item. It also answers --version.
+mathjax_render.js (Node with mathjax-full) is the built-in one.
+
+Results are cached in .math_cache/ under a hash of the renderer, its version,
+the macro table and the expression. An expression that appears all over
+the book (\\mW_Q, d_{model}) is rendered once. Expressions the renderer
+rejects keep their MathJax markup and are typeset in the browser as before.
+
+Numbered math (align, \\tag, \\eqref, ...) is never prerendered: its numbers
+come from a counter that runs across the page (tags: 'ams' in the browser
+config), which an expression rendered on its own can't know.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+from pathlib import Path
+
+from latex_parser import MATH_CLASS
+from tool_runner import run_tool
+
+MATH_CACHE_DIR = Path(__file__).parent / ".math_cache"
+
+# Built-in renderers; anything else is taken as a command line
+MATH_RENDERERS = {
+    'mathjax-svg': ['node', str(Path(__file__).parent / "mathjax_render.js"), '--format', 'svg'],
+    'mathjax-mml': ['node', str(Path(__file__).parent / "mathjax_render.js"), '--format', 'mathml'],
+}
+
+# Prerendered math gets this class instead of MATH_CLASS, so MathJax skips it
+RENDERED_CLASS = 'math-rendered'
+
+# A single renderer run (a whole chapter's uncached expressions)
+RENDER_TIMEOUT = 600
+
+_MARKED_MATH_RE = re.compile(
+    rf'<span class="{MATH_CLASS}">(?P<inline>.*?)</span>'
+    rf'|<div class="equation {MATH_CLASS}">\n(?P<block>.*?)\n</div>', re.DOTALL)
+_HAS_MARKED_MATH_RE = re.compile(rf'class="[^"]*\b{MATH_CLASS}\b')
+
+# Math whose output depends on the page's equation counter
+_NUMBERED_MATH_RE = re.compile(
+    r'\\begin\{(?:equation|align|alignat|flalign|gather|multline|eqnarray)\}|\\tag\b|\\(?:eq)?ref\b')
+
+# Delimiters the converter leaves on math, longest first
+_DELIMITERS = [('$$', '$$', True), ('\\[', '\\]', True), ('$', '$', False), ('\\(', '\\)', False)]
+
+def renderer_command(renderer):
+    """Command line of a built-in renderer name or a custom command"""
+    return list(MATH_RENDERERS.get(renderer) or shlex.split(renderer))
+
+@functools.lru_cache(maxsize=None)
+def renderer_version(renderer):
+    """The renderer's --version output, or None if it can't be run.
+    
+    For the built-in renderers a hash of mathjax_render.js is added, so
+    editing the script invalidates what it rendered before.
+    """
+    try:
+        result = run_tool(renderer_command(renderer) + ['--version'], tags={'stage': 'math-detect'},
+                          capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    version = result.stdout.strip() or 'unknown'
+    if renderer in MATH_RENDERERS:
+        script = Path(MATH_RENDERERS[renderer][1]).read_bytes()
+        version += f" (script {hashlib.sha256(script).hexdigest()[:12]})"
+    return version
+
+def has_marked_math(html):
+    """True if html still has math for MathJax to typeset"""
+    return _HAS_MARKED_MATH_RE.search(html) is not None
+
+def is_numbered(tex):
+    """True if tex has numbered environments, \\tag or references to equation numbers"""
+    return _NUMBERED_MATH_RE.search(tex) is not None
+
+def split_delimiters(source):
+    """(tex, display) of math written with its delimiters, or None"""
+    for opening, closing, display in _DELIMITERS:
+        if (source.startswith(opening) and source.endswith(closing)
+                and len(source) >= len(opening) + len(closing)):
+            return source[len(opening):len(source) - len(closing)], display
+    return None
+
+def math_cache_key(renderer, version, macros, tex, display):
+    h = hashlib.sha256()
+    for part in (renderer, version, json.dumps(macros, sort_keys=True), 'display' if display else 'inline', tex):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _write_atomic(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _renderer_css_path(renderer, version):
+    """Where the stylesheet a renderer's markup needs is kept"""
+    return MATH_CACHE_DIR / f"{math_cache_key(renderer, version, {}, '', False)}.css"
+
+def render_expressions(renderer, items, macros):
+    """Run the renderer once over [(tex, display)]; return ([html or None], css).
+
+    Returns (None, '') if the renderer itself fails (crash, bad output).
+    """
+    request = json.dumps({'macros': macros, 'items': [{'tex': tex, 'display': display} for tex, display in items]})
+    try:
+        result = run_tool(renderer_command(renderer), tags={'stage': 'math', 'expressions': len(items)},
+                          input=request, capture_output=True, text=True, timeout=RENDER_TIMEOUT)
+        response = json.loads(result.stdout) if result.returncode == 0 else None
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        response = None
+    if not response or len(response.get('results', [])) != len(items):
+        return None, ''
+    return [r.get('html') for r in response['results']], response.get('css', '')
+
+def prerender_math(parts, renderer, macros):
+    """Replace the marked math in each HTML string of parts with static markup.
+
+    Uncached expressions of all parts are rendered in one renderer run.
+    Returns (new parts, css for the rendered markup, stats); stats counts
+    'expressions' (distinct), 'cached', 'rendered', 'failed' and 'numbered'
+    (left to MathJax, see is_numbered).
+    """
+    version = renderer_version(renderer)
+    stats = {'expressions': 0, 'cached': 0, 'rendered': 0, 'failed': 0, 'numbered': 0}
+    if version is None:
+        return list(parts), '', stats
+
+    # Distinct expressions, and where each one's result is cached
+    keys = {}
+    numbered = set()
+    for part in parts:
+        for m in _MARKED_MATH_RE.finditer(part):
+            math = split_delimiters(m.group('inline') if m.group('inline') is not None else m.group('block'))
+            if not math:
+                continue
+            if is_numbered(math[0]):
+                numbered.add(math)
+            elif math not in keys:
+                keys[math] = math_cache_key(renderer, version, macros, *math)
+    stats['expressions'] = len(keys) + len(numbered)
+    stats['numbered'] = len(numbered)
+
+    markup = {}
+    todo = []
+    for math, key in keys.items():
+        if (MATH_CACHE_DIR / f"{key}.html").exists():
+            markup[math] = (MATH_CACHE_DIR / f"{key}.html").read_text(encoding='utf-8')
+            stats['cached'] += 1
+        elif (MATH_CACHE_DIR / f"{key}.failed").exists():
+            stats['failed'] += 1
+        else:
+            todo.append(math)
+
+    css_path = _renderer_css_path(renderer, version)
+    if todo:
+        results, css = render_expressions(renderer, todo, macros)
+        if results is None:
+            # Left to MathJax this time, not recorded as failing
+            stats['failed'] += len(todo)
+            results = []
+        for math, html in zip(todo, results):
+            if html:
+                markup[math] = html
+                _write_atomic(MATH_CACHE_DIR / f"{keys[math]}.html", html)
+                stats['rendered'] += 1
+            else:
+                # Kept for MathJax; not retried until the renderer or macros change
+                _write_atomic(MATH_CACHE_DIR / f"{keys[math]}.failed", '')
+                stats['failed'] += 1
+        if css:
+            _write_atomic(css_path, css)
+    css = css_path.read_text(encoding='utf-8') if markup and css_path.exists() else ''
+
+    def replace(m):
+        inline = m.group('inline')
+        math = split_delimiters(inline if inline is not None else m.group('block'))
+        if math not in markup:
+            return m.group(0)
+        if inline is None:
+            return f'<div class="equation {RENDERED_CLASS}">\n{markup[math]}\n</div>'
+        return f'<span class="{RENDERED_CLASS}">{markup[math]}</span>'
+
+    return [_MARKED_MATH_RE.sub(replace, part) for part in parts], css, stats
@@ -0,0 +1,68 @@
+#!/usr/bin/env node
+/*
+ * Render TeX to static SVG or MathML with mathjax-full, for math_prerender.py.
+ *
+ * Reads {"macros": {...}, "items": [{"tex": "...", "display": false}, ...]} as
+ * JSON on stdin and writes {"results": [{"html": ...} | {"error": ...}], "css": ...}
+ * to stdout, one result per item. "css" is the stylesheet the SVG markup needs.
+ *
+ * Needs mathjax-full:  npm install mathjax-full   (in html-build/ or globally)
+ *
+ * Usage:  node mathjax_render.js --format svg|mathml < request.json
+ *         node mathjax_render.js --version
+ */
+
+const { mathjax } = require('mathjax-full/js/mathjax.js');
+const { TeX } = require('mathjax-full/js/input/tex.js');
+const { SVG } = require('mathjax-full/js/output/svg.js');
+const { liteAdaptor } = require('mathjax-full/js/adaptors/liteAdaptor.js');
+const { RegisterHTMLHandler } = require('mathjax-full/js/handlers/html.js');
+const { AllPackages } = require('mathjax-full/js/input/tex/AllPackages.js');
+const { SerializedMmlVisitor } = require('mathjax-full/js/core/MmlTree/SerializedMmlVisitor.js');
+const { STATE } = require('mathjax-full/js/core/MathItem.js');
+
+const args = process.argv.slice(2);
+if (args.includes('--version')) {
+    console.log(`mathjax-full ${mathjax.version}`);
+    process.exit(0);
+}
+const format = args.includes('--format') ? args[args.indexOf('--format') + 1] : 'svg';
+if (format !== 'svg' && format !== 'mathml') {
+    console.error(`Unknown format: ${format} (svg or mathml)`);
+    process.exit(2);
+}
+
+let input = '';
+process.stdin.setEncoding('utf8');
+process.stdin.on('data', chunk => { input += chunk; });
+process.stdin.on('end', () => {
+    const request = JSON.parse(input);
+    const adaptor = liteAdaptor();
+    RegisterHTMLHandler(adaptor);
+
+    // Errors are thrown instead of rendered as red text, so the item is left to MathJax.
+    // Numbered math never gets here (math_prerender.py leaves it to the browser),
+    // so equation tags are not needed.
+    const tex = new TeX({
+        packages: AllPackages,
+        macros: request.macros || {},
+        formatError: (jax, error) => { throw error; }
+    });
+    const svg = format === 'svg' ? new SVG({ fontCache: 'none' }) : null;
+    const doc = mathjax.document('', svg ? { InputJax: tex, OutputJax: svg } : { InputJax: tex });
+    const visitor = new SerializedMmlVisitor();
+
+    const results = request.items.map(item => {
+        try {
+            if (svg) {
+                const node = doc.convert(item.tex, { display: item.display, em: 16, ex: 8, containerWidth: 1280 });
+                return { html: adaptor.outerHTML(node) };
+            }
+            return { html: visitor.visitTree(doc.convert(item.tex, { display: item.display, end: STATE.CONVERT })) };
+        } catch (error) {
+            return { error: String(error.message || error) };
+        }
+    });
+    const css = svg ? adaptor.textContent(svg.styleSheet(doc)) : '';
+    process.stdout.write(JSON.stringify({ results, css }));
+});
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Regression checks for the single-pass LaTeX converter (latex_parser.py)
+
+Run with:  python test_latex_parser.py   (or python -m pytest)
+"""
+
+import re
+import time
+import unittest
+from pathlib import Path
+
+from convert_to_html import fix_algorithm_blocks
+from latex_parser import Math, latex_to_html, tokenize
+
+CHAPTERS_DIR = Path(__file__).parent.parent / "chapters"
+
+# The line from chapter25 that used to make the math regexes backtrack
+CHAPTER25_LINE = (
+    "A support team receives 50,000 tickets monthly across 12 categories "
+    "(Billing, Technical, Account Access, etc.). Manual triage takes 2--3 "
+    "minutes per ticket, costing $\\approx\\$30,000/month in labor.\n\n"
+    "\\textbf{Solution:} Fine-tune BERT on 10,000 historical tickets.\n"
+)
+
+# chapter22's pruning loop, whose \For condition has nested braces
+CHAPTER22_ALGORITHM = r"""\begin{algorithm}[H]
+\caption{Iterative Magnitude Pruning}
+\label{alg:iterative_pruning}
+\textbf{Input:} Model, sparsity target $s_{\text{target}}$
+
+\For{sparsity $s = 0$ \KwTo $s_{\text{target}}$ by steps}{
+    Train model to convergence \\
+    Prune $\Delta s$ lowest-magnitude weights \\
+    Fine-tune model
+}
+\end{algorithm}
+"""
+
+def convert(source):
+    return latex_to_html(source)[0]
+
+class UnterminatedMathTest(unittest.TestCase):
+    """A $ or $$ that is never closed must not make tokenizing blow up"""
+
+    def assertFast(self, source, limit=1.0):
+        start = time.perf_counter()
+        tokens = tokenize(source)
+        self.assertLess(time.perf_counter() - start, limit)
+        return tokens
+
+    def test_unterminated_display_math(self):
+        self.assertFast('$$ x' + ' a' * 12 + ' $ b')
+        self.assertFast('$$ x' + ' a' * 50000 + ' $ b')
+
+    def test_unterminated_inline_math(self):
+        self.assertFast('$ x' + ' a' * 50000)
+        self.assertFast('a $' * 50000)
+
+    def test_chapter25_line(self):
+        tokens = self.assertFast(CHAPTER25_LINE * 200)
+        self.assertFalse(any(type(token) is Math for token in tokens))
+        html = convert(CHAPTER25_LINE)
+        self.assertIn('<strong>Solution:</strong>', html)
+        self.assertEqual(html.count('<p>'), 2)
+
+    def test_math_does_not_cross_paragraphs(self):
+        html = convert('costs $5 today\n\nand $x$ tomorrow')
+        self.assertIn('<p>costs $5 today</p>', html)
+        self.assertIn('<p>and <span class="tex-math">$x$</span> tomorrow</p>', html)
+
+class ConstructsTest(unittest.TestCase):
+    def test_math_kept_verbatim(self):
+        html = convert('Let $\\textbf{x} % comment\n= 1$ hold.')
+        self.assertIn('<span class="tex-math">$\\textbf{x} \n= 1$</span>', html)
+
+    def test_math_marked_and_dollars_in_code_left_alone(self):
+        html = convert('Cost \\$5, $a$ and\n\n\\begin{equation}b\\end{equation}\n\n'
+                       '\\begin{verbatim}\necho $HOME $PATH\n\\end{verbatim}')
+        self.assertEqual(html.count('class="tex-math"'), 1)
+        self.assertIn('<div class="equation tex-math">', html)
+        self.assertIn('<pre><code>\necho $HOME $PATH\n</code></pre>', html)
+
+    def test_listing_escaped_and_percent_kept(self):
+        html = convert('\\begin{lstlisting}[language=Python]\nprint("%d" % (a<b))\n\\end{lstlisting}')
+        self.assertEqual(html, '<pre><code>print("%d" % (a&lt;b))\n</code></pre>')
+
+    def test_lists_close_items(self):
+        html = convert('\\begin{itemize}\n\\item One\n\\item[Two] more\n\\end{itemize}')
+        self.assertEqual(html, '<ul>\n<li>One</li>\n<li><strong>Two</strong> more</li>\n</ul>')
+
+    def test_stray_end_of_converted_environment_dropped(self):
+        html = convert('Text.\n\\end{solution}\n\nMore.')
+        self.assertNotIn('\\end{solution}', html)
+        self.assertNotIn('</div>', html)
+
+    def test_solution_numbering(self):
+        html = convert('\\begin{exercise}\\label{ex:a} Q\\end{exercise}\n\n'
+                       '\\begin{solution}[\\ref{ex:a}] A\\end{solution}')
+        self.assertIn('<strong>Exercise 1:</strong>', html)
+        self.assertIn('<strong>Solution to Exercise 1:</strong>', html)
+
+    def test_lazy_solutions(self):
+        fragments = []
+        html, _, _ = latex_to_html('\\begin{exercise}\\label{ex:a} Q\\end{exercise}\n\n'
+                                   '\\begin{solution}[\\ref{ex:a}] $x$\\end{solution}\n\n'
+                                   '\\begin{proof} short\\end{proof}',
+                                   fragments, lazy=('solution', 'proof'))
+        self.assertIn('<details class="solution lazy-fragment" data-fragment="solution-1">'
+                      '<summary><strong>Solution to Exercise 1</strong></summary></details>', html)
+        self.assertNotIn('$x$', html)
+        self.assertEqual(fragments, [('solution-1', '<span class="tex-math">$x$</span>')])
+        # Short proofs stay in the page
+        self.assertIn('<div class="proof"><strong>Proof:</strong> short</div>', html)
+
+    def test_table(self):
+        html, found, converted = latex_to_html(
+            '\\begin{table}[h]\\centering\\begin{tabular}{cl}\\toprule\n'
+            'A & B \\\\\n\\midrule\n$x$ & y \\\\\n\\bottomrule\\end{tabular}'
+            '\\caption{C}\\end{table}')
+        self.assertEqual((found, converted), (1, 1))
+        self.assertIn('<tr><th>A</th><th>B</th></tr>\n<tr><td><span class="tex-math">$x$</span></td><td>y</td></tr>',
+                      html)
+
+class AlgorithmTest(unittest.TestCase):
+    def test_nested_braces_in_loop_header(self):
+        html = fix_algorithm_blocks(convert(CHAPTER22_ALGORITHM))
+        self.assertIn('<div class="algorithm-line"><strong>for</strong> sparsity <span class="tex-math">$s = 0$</span> '
+                      'to <span class="tex-math">$s_{\\text{target}}$</span> by steps <strong>do</strong></div>\n'
+                      '<div class="algorithm-indent">\n'
+                      '<div class="algorithm-line">Train model to convergence</div>', html)
+        self.assertIn('<div class="algorithm-line">Fine-tune model</div>\n</div>\n</div>', html)
+
+    def test_return_with_nested_braces(self):
+        html = fix_algorithm_blocks(convert('\\begin{algorithm}\n\\Return{$\\vw^{(T)}$}\n\\end{algorithm}'))
+        self.assertIn('<strong>return</strong> <span class="tex-math">$\\vw^{(T)}$</span>', html)
+
+    def test_unknown_commands_kept(self):
+        html = fix_algorithm_blocks(convert('\\begin{algorithm}\n\\Repeat{done}\n\\end{algorithm}'))
+        self.assertIn('<div class="algorithm-line">\\Repeat{done}</div>', html)
+
+class RealChaptersTest(unittest.TestCase):
+    """Structural before/after checks against every chapter in the book"""
+
+    def test_chapters(self):
+        chapters = sorted(CHAPTERS_DIR.glob("*.tex"))
+        if not chapters:
+            self.skipTest("no chapters found")
+        for path in chapters:
+            with self.subTest(chapter=path.name):
+                source = path.read_text(encoding='utf-8')
+                start = time.perf_counter()
+                html = convert(source)
+                self.assertLess(time.perf_counter() - start, 1.0)
+
+                # Every opened block is closed
+                for tag in ('div', 'p', 'li', 'ul', 'ol', 'table', 'pre', 'figure'):
+                    self.assertEqual(html.count(f'<{tag}>') + html.count(f'<{tag} '),
+                                     html.count(f'</{tag}>'), tag)
+
+                # Nothing the converter handles is left behind as LaTeX
+                for env in ('itemize', 'enumerate', 'exercise', 'solution', 'lstlisting', 'equation'):
+                    self.assertNotIn(f'\\begin{{{env}}}', html)
+
+                # One heading per sectioning command, one code block per listing
+                sections = len(re.findall(r'\\section\*?[\[{]', source))
+                self.assertEqual(html.count('<h2>'), sections)
+                listings = source.count('\\begin{lstlisting}') + source.count('\\begin{verbatim}')
+                self.assertEqual(html.count('<pre><code>'), listings)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Checks for the LaTeX pre-flight pass (latex_preflight.py)
+
+Run with:  python test_latex_preflight.py   (or python -m pytest)
+"""
+
+import time
+import unittest
+from pathlib import Path
+
+from latex_preflight import CONVERTED_ENVIRONMENTS, check_source
+
+CHAPTERS_DIR = Path(__file__).parent.parent / "chapters"
+
+def errors(source, known=None):
+    return [(line, message) for line, severity, message in check_source(source, known) if severity == 'error']
+
+class PreflightTest(unittest.TestCase):
+    def test_balanced_source(self):
+        source = ('\\begin{itemize}\n\\item \\textbf{a} $\\{x\\}$ 50\\%\n\\end{itemize}\n'
+                  '\\verb|{| \\lstinline|}| % {\n')
+        self.assertEqual(errors(source), [])
+
+    def test_unclosed_brace(self):
+        self.assertEqual(errors('one\n\\textbf{two\n'), [(2, "'{' is never closed")])
+
+    def test_extra_brace(self):
+        self.assertEqual(errors('$1{,}000{,}}000$'), [(1, "'}' without a matching '{'")])
+
+    def test_mismatched_environments(self):
+        problems = errors('\\begin{solution}\n\\begin{itemize}\n\\end{solution}\n')
+        self.assertEqual(problems, [(2, "\\begin{itemize} is not closed before \\end{solution} (line 3)")])
+        self.assertEqual(errors('text\n\\end{solution}\n'), [(2, "\\end{solution} without a matching \\begin")])
+
+    def test_listing_bodies_are_not_checked(self):
+        self.assertEqual(errors('\\begin{lstlisting}\nd = {\\end{itemize}\n\\end{lstlisting}\n'), [])
+        self.assertEqual(errors('\\begin{verbatim}\n{\n'), [(1, "\\begin{verbatim} is never closed")])
+
+    def test_unknown_environments(self):
+        source = '\\begin{quote}$\\begin{bmatrix}1\\end{bmatrix}$\\end{quote}\n'
+        problems = check_source(source, CONVERTED_ENVIRONMENTS)
+        self.assertEqual(problems, [(1, 'warning', "environment 'quote' is not converted to HTML")])
+
+    def test_chapters(self):
+        chapters = sorted(CHAPTERS_DIR.glob("*.tex"))
+        if not chapters:
+            self.skipTest("no chapters found")
+        start = time.perf_counter()
+        for path in chapters:
+            with self.subTest(chapter=path.name):
+                self.assertEqual(errors(path.read_text(encoding='utf-8')), [])
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Checks for build-time math rendering (math_prerender.py)
+
+Uses a stand-in renderer written in Python, so neither Node nor
+mathjax-full is needed.
+
+Run with:  python test_math_prerender.py   (or python -m pytest)
+"""
+
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import math_prerender
+from latex_parser import latex_to_html
+from math_prerender import has_marked_math, prerender_math, split_delimiters
+
+# Renders TeX as <svg>TeX</svg>, rejects \bad, and logs each run
+FAKE_RENDERER = r'''
+import json, sys
+from pathlib import Path
+if '--version' in sys.argv:
+    print('fake 1.0')
+    sys.exit(0)
+request = json.load(sys.stdin)
+with open(Path(__file__).with_suffix('.log'), 'a') as log:
+    log.write(json.dumps([item['tex'] for item in request['items']]) + '\n')
+results = [{'error': 'Undefined control sequence'} if '\\bad' in item['tex']
+           else {'html': f"<svg>{item['tex']}</svg>"} for item in request['items']]
+json.dump({'results': results, 'css': 'svg { color: red }'}, sys.stdout)
+'''
+
+SOURCE = r'''Let $x^2$ and $\bad$ and $x^2$ again.
+\begin{equation}
+a = b
+\end{equation}
+'''
+
+class PrerenderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        script = self.tmp / "renderer.py"
+        script.write_text(FAKE_RENDERER)
+        self.log = self.tmp / "renderer.log"
+        self.renderer = f"{sys.executable} {script}"
+        self.original_cache = math_prerender.MATH_CACHE_DIR
+        math_prerender.MATH_CACHE_DIR = self.tmp / "cache"
+        self.addCleanup(setattr, math_prerender, 'MATH_CACHE_DIR', self.original_cache)
+
+    def runs(self):
+        return self.log.read_text().splitlines() if self.log.exists() else []
+
+    def test_split_delimiters(self):
+        self.assertEqual(split_delimiters('$x$'), ('x', False))
+        self.assertEqual(split_delimiters('$$\nx\n$$'), ('\nx\n', True))
+        self.assertEqual(split_delimiters('\\[x\\]'), ('x', True))
+        self.assertIsNone(split_delimiters('x'))
+
+    def test_renders_and_leaves_failures_to_mathjax(self):
+        html = latex_to_html(SOURCE)[0]
+        (page,), css, stats = prerender_math([html], self.renderer, {})
+        self.assertIn('<span class="math-rendered"><svg>x^2</svg></span>', page)
+        self.assertIn('<div class="equation math-rendered">\n<svg>\na = b\n</svg>\n</div>', page)
+        self.assertIn('<span class="tex-math">$\\bad$</span>', page)
+        self.assertEqual(css, 'svg { color: red }')
+        self.assertEqual(stats, {'expressions': 3, 'cached': 0, 'rendered': 2, 'failed': 1, 'numbered': 0})
+        self.assertTrue(has_marked_math(page))
+
+    def test_cache_is_reused_across_parts_and_builds(self):
+        html = latex_to_html(SOURCE)[0]
+        first, _, _ = prerender_math([html, '<span class="tex-math">$x^2$</span>'], self.renderer, {})
+        self.assertEqual(len(self.runs()), 1)
+        self.assertEqual(first[1], '<span class="math-rendered"><svg>x^2</svg></span>')
+
+        again, css, stats = prerender_math([html], self.renderer, {})
+        self.assertEqual(len(self.runs()), 1)
+        self.assertEqual(again[0], first[0])
+        self.assertEqual(css, 'svg { color: red }')
+        self.assertEqual(stats, {'expressions': 3, 'cached': 2, 'rendered': 0, 'failed': 1, 'numbered': 0})
+
+        # Other macros are another cache
+        prerender_math([html], self.renderer, {'R': '\\mathbb{R}'})
+        self.assertEqual(len(self.runs()), 2)
+
+    def test_numbered_math_left_to_mathjax(self):
+        html = latex_to_html('\\begin{align}\na &= b \\\\\nc &= d\n\\end{align}\n'
+                             '\\begin{align*}\ne &= f\n\\end{align*}\n'
+                             'By $\\eqref{eq:x}$ and $x \\tag{1}$.\n')[0]
+        (page,), _, stats = prerender_math([html], self.renderer, {})
+        self.assertIn('<div class="equation tex-math">\n$$\\begin{align}', page)
+        self.assertIn('<span class="tex-math">$\\eqref{eq:x}$</span>', page)
+        self.assertIn('<span class="tex-math">$x \\tag{1}$</span>', page)
+        # Unnumbered align* is rendered as usual
+        self.assertIn('<div class="equation math-rendered">\n<svg>\\begin{align*}', page)
+        self.assertEqual(stats, {'expressions': 4, 'cached': 0, 'rendered': 1, 'failed': 0, 'numbered': 3})
+        self.assertEqual(self.runs(), ['["\\\\begin{align*}\\ne &= f\\n\\\\end{align*}"]'])
+        self.assertTrue(has_marked_math(page))
+
+    def test_broken_renderer_is_not_cached(self):
+        broken = f"{sys.executable} -c \"import sys; sys.exit(0 if '--version' in sys.argv else 1)\""
+        html = latex_to_html(SOURCE)[0]
+        (page,), css, stats = prerender_math([html], broken, {})
+        self.assertEqual(page, html)
+        self.assertEqual(stats['failed'], 3)
+
+        (page,), _, stats = prerender_math([html], self.renderer, {})
+        self.assertEqual(stats['rendered'], 2)
+
+    def test_missing_renderer(self):
+        html = latex_to_html(SOURCE)[0]
+        (page,), css, stats = prerender_math([html], 'no-such-math-renderer', {})
+        self.assertEqual((page, css, stats['expressions']), (html, '', 0))
+
+if __name__ == '__main__':
+    unittest.main()
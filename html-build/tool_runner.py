@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+One way to run the external tools of the build (pdflatex, pdf2svg, convert,
+qpdf) that also records what each run cost.
+
+run_tool is a drop-in for subprocess.run: it waits for the child with
+os.wait4, so every run gets its own wall time, user/system CPU time and peak
+RSS even when several run at once on a thread pool. Each run is recorded
+with tags (stage, chapter, diagram hash, ...) for top_runs, usage_by_stage
+and write_usage_report. Records are per process: a worker process returns
+its tool_runs to the parent, which adds them with add_tool_runs.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_records = []
+_records_lock = threading.Lock()
+
+def _peak_rss_mb(usage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_tool(command, tags=None, cwd=None, env=None, timeout=None, capture_output=False,
+             stdout=None, stderr=None, text=False, check=False, input=None):
+    """subprocess.run for external tools, with resource accounting.
+
+    Accepts the subset of subprocess.run arguments the build uses and raises
+    the same exceptions (FileNotFoundError, TimeoutExpired, CalledProcessError).
+    The CompletedProcess has a .usage attribute: the record this run added.
+    """
+    if capture_output:
+        stdout = stderr = subprocess.PIPE
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=stdout, stderr=stderr, text=text,
+                               stdin=subprocess.PIPE if input is not None else None)
+
+    # Feed and drain the pipes on threads, so neither side blocks on a full pipe while we wait
+    output = {}
+    readers = []
+    if input is not None:
+        def feed():
+            # A child that exits without reading all its input is not an error
+            try:
+                process.stdin.write(input)
+            except BrokenPipeError:
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        writer = threading.Thread(target=feed)
+        writer.start()
+        readers.append(writer)
+    for name, stream in (('stdout', process.stdout), ('stderr', process.stderr)):
+        if stream is not None:
+            reader = threading.Thread(target=lambda n=name, s=stream: output.__setitem__(n, s.read()))
+            reader.start()
+            readers.append(reader)
+
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        process.wait()
+        usage = None
+    wall = time.perf_counter() - started
+    if timer:
+        timer.cancel()
+    for reader in readers:
+        reader.join()
+    for stream in (process.stdout, process.stderr):
+        if stream is not None:
+            stream.close()
+
+    record = {
+        'tool': os.path.basename(str(command[0])),
+        'tags': dict(tags or {}),
+        'wall_seconds': round(wall, 3),
+        'user_seconds': round(usage.ru_utime, 3) if usage else None,
+        'sys_seconds': round(usage.ru_stime, 3) if usage else None,
+        'peak_rss_mb': round(_peak_rss_mb(usage), 1) if usage else None,
+        'returncode': process.returncode,
+        'timed_out': timed_out.is_set(),
+    }
+    with _records_lock:
+        _records.append(record)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(command, timeout, output.get('stdout'), output.get('stderr'))
+    result = subprocess.CompletedProcess(command, process.returncode, output.get('stdout'), output.get('stderr'))
+    result.usage = record
+    if check:
+        result.check_returncode()
+    return result
+
+def cpu_seconds(record):
+    """User + system CPU time of a record, or None where it isn't known"""
+    if record['user_seconds'] is None:
+        return None
+    return record['user_seconds'] + record['sys_seconds']
+
+def tool_runs():
+    """Every record so far, in the order the runs finished"""
+    with _records_lock:
+        return list(_records)
+
+def add_tool_runs(records):
+    """Add records made in another process (a pool worker) to this one's"""
+    with _records_lock:
+        _records.extend(records)
+
+def top_runs(limit=10, key='cpu'):
+    """The most expensive runs by 'cpu', 'wall' or 'rss'"""
+    sort_keys = {
+        'cpu': lambda r: cpu_seconds(r) or 0.0,
+        'wall': lambda r: r['wall_seconds'],
+        'rss': lambda r: r['peak_rss_mb'] or 0.0,
+    }
+    return sorted(tool_runs(), key=sort_keys[key], reverse=True)[:limit]
+
+def usage_by_stage():
+    """{stage: {runs, wall_seconds, cpu_seconds, peak_rss_mb}} over all records"""
+    stages = {}
+    for record in tool_runs():
+        stage = stages.setdefault(record['tags'].get('stage', record['tool']),
+                                  {'runs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': 0.0})
+        stage['runs'] += 1
+        stage['wall_seconds'] += record['wall_seconds']
+        stage['cpu_seconds'] += cpu_seconds(record) or 0.0
+        stage['peak_rss_mb'] = max(stage['peak_rss_mb'], record['peak_rss_mb'] or 0.0)
+    return stages
+
+def describe_run(record):
+    """One-line description of a record, e.g. "pdflatex stage=tikz-svg diagram=3fa2..." """
+    # Stage first, whatever order the tags were given in
+    names = sorted(record['tags'], key=lambda name: name != 'stage')
+    tags = ' '.join(f"{name}={record['tags'][name]}" for name in names)
+    return f"{record['tool']} {tags}".strip()
+
+def format_run(record):
+    """Costs of a record, e.g. "12.3s wall, 11.9s CPU, 210 MB peak" """
+    cpu = cpu_seconds(record)
+    parts = [f"{record['wall_seconds']:.1f}s wall"]
+    if cpu is not None:
+        parts.append(f"{cpu:.1f}s CPU")
+    if record['peak_rss_mb'] is not None:
+        parts.append(f"{record['peak_rss_mb']:.0f} MB peak")
+    if record['timed_out']:
+        parts.append("timed out")
+    return ', '.join(parts)
+
+def write_usage_report(path):
+    """Write every record and the per-stage totals to a JSON file (atomically)"""
+    path = os.fspath(path)
+    report = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': usage_by_stage(),
+        'runs': tool_runs(),
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
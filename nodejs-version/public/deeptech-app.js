@@ -2,9 +2,27 @@
 const state = {
     chapters: [],
     currentChapterIndex: -1,
-    searchTerm: ''
+    searchTerm: '',
+    fragments: null,  // { chapterId, doc: Promise<Document> } for the open chapter
+    sectionObserver: null,
+    mathObserver: null,
+    mathBlocks: [],        // math-bearing blocks of the open chapter, as they were added
+    idleTypeset: false,    // an idle-time typeset batch is scheduled
+    mathJaxReady: false,   // set by MathJax's pageReady (see deeptech.html)
+    pendingMath: [],       // typeset requests made before MathJax was ready
+    typesetQueue: Promise.resolve()
 };
 
+// Sections fetched before the chapter is shown, enough to fill the first screen;
+// the others are fetched as they come within SECTION_PRELOAD_MARGIN of the view
+const INITIAL_SECTION_BYTES = 12000;
+const SECTION_PRELOAD_MARGIN = '1500px 0px';
+
+// Math is typeset a block at a time: blocks within MATH_PRELOAD_MARGIN of the
+// view as they get there, the others IDLE_TYPESET_BATCH at a time when idle
+const MATH_PRELOAD_MARGIN = '800px 0px';
+const IDLE_TYPESET_BATCH = 8;
+
 // DOM Elements
 const elements = {
     sidebar: document.getElementById('sidebar'),
@@ -107,6 +125,47 @@ function generateChapterToc() {
     });
 }
 
+// Fix relative image paths - convert ../diagrams/ to /chapters/diagrams/
+function fixDiagramPaths(root) {
+    root.querySelectorAll('img[src^="../diagrams/"]').forEach(img => {
+        img.setAttribute('src', img.getAttribute('src').replace('../diagrams/', '/chapters/diagrams/'));
+    });
+}
+
+// Fetch a chapter's solutions/proofs file once, the first time a stub is opened
+function loadFragments(chapterId) {
+    if (!state.fragments || state.fragments.chapterId !== chapterId) {
+        const doc = fetch(`/chapters/deeptech/${chapterId}.fragments.html`)
+            .then(response => {
+                if (!response.ok) throw new Error('Fragments not found');
+                return response.text();
+            })
+            .then(html => new DOMParser().parseFromString(html, 'text/html'));
+        state.fragments = { chapterId, doc };
+    }
+    return state.fragments.doc;
+}
+
+// Fill in a collapsed solution or proof when it is opened
+async function openFragment(stub) {
+    if (!stub.open || !stub.dataset.fragment || stub.dataset.loaded) return;
+    stub.dataset.loaded = 'true';
+    const chapterId = state.chapters[state.currentChapterIndex].id;
+    try {
+        const doc = await loadFragments(chapterId);
+        const fragment = doc.getElementById(stub.dataset.fragment);
+        if (!fragment) return;
+        fixDiagramPaths(fragment);
+        stub.insertAdjacentHTML('beforeend', fragment.innerHTML);
+        stub.dataset.typeset = 'true';
+        await typeset([stub]);
+    } catch (error) {
+        console.error('Failed to load solution:', error);
+        delete stub.dataset.loaded;
+        state.fragments = null;
+    }
+}
+
 // Load chapters from API
 async function loadChapters() {
     try {
@@ -260,6 +319,13 @@ function setupEventListeners() {
         }
     });
 
+    // Solutions and long proofs are fetched when opened ('toggle' doesn't bubble)
+    elements.chapterContent.addEventListener('toggle', (e) => {
+        if (e.target.classList && e.target.classList.contains('lazy-fragment')) {
+            openFragment(e.target);
+        }
+    }, true);
+
     // Theme toggle
     elements.themeToggle.addEventListener('click', toggleTheme);
 
@@ -297,69 +363,234 @@ function filterChapters() {
     });
 }
 
+// Fetch a chapter's section index (written by convert_to_html.py), or null
+// for chapters built without one
+async function fetchSectionIndex(chapterId, cacheBuster) {
+    try {
+        const response = await fetch(`/chapters/deeptech/sections/${chapterId}/index.json?v=${cacheBuster}`);
+        if (!response.ok) return null;
+        return (await response.json()).sections;
+    } catch (error) {
+        return null;
+    }
+}
+
+// The element whose scrolling brings chapter content into view (null: the window)
+function scrollRoot() {
+    const scroller = elements.chapterContent.parentElement;
+    return scroller.scrollHeight > scroller.clientHeight ? scroller : null;
+}
+
+// Typeset math in the given elements, one MathJax call at a time. Only the .tex-math
+// elements inside them are looked at (see the MathJax options in deeptech.html);
+// the class goes on each element because MathJax doesn't look at its ancestors.
+// Requests made while MathJax is still loading wait for its pageReady.
+function typeset(targets) {
+    targets.forEach(target => target.classList.add('tex-ignore'));
+    if (!state.mathJaxReady) {
+        state.pendingMath.push(...targets);
+        return Promise.resolve();
+    }
+    state.typesetQueue = state.typesetQueue
+        .then(() => window.MathJax.typesetPromise(targets))
+        .catch(err => console.error('MathJax error:', err));
+    return state.typesetQueue;
+}
+
+// Called from MathJax's pageReady (startup doesn't typeset the page itself)
+window.typesetPendingMath = function() {
+    state.mathJaxReady = true;
+    const pending = state.pendingMath.filter(target => target.isConnected);
+    state.pendingMath = [];
+    return pending.length ? typeset(pending) : Promise.resolve();
+};
+
+// Typeset the blocks that haven't been yet
+function typesetBlocks(blocks) {
+    const todo = blocks.filter(block => !block.dataset.typeset && block.isConnected);
+    todo.forEach(block => { block.dataset.typeset = 'true'; });
+    return todo.length ? typeset(todo) : Promise.resolve();
+}
+
+// Typeset the math-bearing blocks (those holding .tex-math elements written by
+// the converter) among root's children: the ones near the view first, as they
+// come into it, and the rest in idle time
+function watchMath(root) {
+    if (!state.mathObserver) {
+        state.mathObserver = new IntersectionObserver((entries, observer) => {
+            const visible = entries.filter(entry => entry.isIntersecting).map(entry => entry.target);
+            visible.forEach(block => observer.unobserve(block));
+            typesetBlocks(visible);
+        }, { root: scrollRoot(), rootMargin: MATH_PRELOAD_MARGIN });
+    }
+    Array.from(root.children)
+        .filter(block => block.classList.contains('tex-math') || block.querySelector('.tex-math'))
+        .forEach(block => {
+            state.mathBlocks.push(block);
+            state.mathObserver.observe(block);
+        });
+    scheduleIdleTypeset();
+}
+
+// Typeset a batch of off-screen blocks whenever the browser is idle, until none are left
+function scheduleIdleTypeset() {
+    if (state.idleTypeset) return;
+    state.idleTypeset = true;
+    const blocks = state.mathBlocks;
+    const whenIdle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+    whenIdle(async () => {
+        // A newer chapter has its own schedule
+        if (blocks !== state.mathBlocks) return;
+        if (state.mathJaxReady) {
+            const batch = blocks.filter(block => !block.dataset.typeset).slice(0, IDLE_TYPESET_BATCH);
+            batch.forEach(block => state.mathObserver.unobserve(block));
+            await typesetBlocks(batch);
+        }
+        if (blocks !== state.mathBlocks) return;
+        state.idleTypeset = false;
+        if (blocks.some(block => !block.dataset.typeset)) {
+            scheduleIdleTypeset();
+        }
+    });
+}
+
+// Stop typesetting the chapter that is being left
+function resetMath() {
+    if (state.mathObserver) {
+        state.mathObserver.disconnect();
+        state.mathObserver = null;
+    }
+    state.mathBlocks = [];
+    state.idleTypeset = false;
+}
+
+// Fill one section placeholder with its HTML and start typesetting it
+async function loadSection(chapterId, placeholder, section, cacheBuster) {
+    if (placeholder.dataset.loaded) return;
+    placeholder.dataset.loaded = 'true';
+    try {
+        const response = await fetch(`/chapters/deeptech/sections/${chapterId}/${section.file}?v=${cacheBuster}`);
+        if (!response.ok) throw new Error('Section not found');
+        const template = document.createElement('template');
+        template.innerHTML = await response.text();
+        fixDiagramPaths(template.content);
+        // The reader may have moved on to another chapter meanwhile
+        if (!placeholder.isConnected) return;
+        placeholder.replaceChildren(template.content);
+        placeholder.style.minHeight = '';
+        generateChapterToc();
+        watchMath(placeholder);
+    } catch (error) {
+        console.error('Failed to load section:', error);
+        delete placeholder.dataset.loaded;
+    }
+}
+
+// Show a chapter section by section: one placeholder per section (holding its
+// heading, sized roughly by its byte count), the first ones filled right away
+// and the rest as the reader scrolls towards them
+async function renderSections(chapterId, sections, cacheBuster) {
+    elements.chapterContent.replaceChildren(...sections.map((section, i) => {
+        const placeholder = document.createElement('section');
+        placeholder.className = 'chapter-section';
+        placeholder.id = section.id;
+        placeholder.style.minHeight = `${Math.round(section.bytes / 5)}px`;
+        if (section.title && i > 0) {
+            const heading = document.createElement('h2');
+            heading.textContent = section.title;
+            placeholder.appendChild(heading);
+        }
+        return placeholder;
+    }));
+    const placeholders = Array.from(elements.chapterContent.children);
+    
+    let initialBytes = 0;
+    let initial = 0;
+    while (initial < sections.length && (initial === 0 || initialBytes < INITIAL_SECTION_BYTES)) {
+        initialBytes += sections[initial].bytes;
+        initial++;
+    }
+    const firstSections = placeholders.slice(0, initial)
+        .map((placeholder, i) => loadSection(chapterId, placeholder, sections[i], cacheBuster));
+    
+    state.sectionObserver = new IntersectionObserver((entries, observer) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                const i = placeholders.indexOf(entry.target);
+                loadSection(chapterId, entry.target, sections[i], cacheBuster);
+            }
+        });
+    }, {
+        root: scrollRoot(),
+        rootMargin: SECTION_PRELOAD_MARGIN
+    });
+    placeholders.slice(initial).forEach(placeholder => state.sectionObserver.observe(placeholder));
+    
+    await Promise.all(firstSections);
+}
+
 // Load chapter content
 async function loadChapter(chapterId, index) {
     try {
         // Show loading state
         showLoading();
+        if (state.sectionObserver) {
+            state.sectionObserver.disconnect();
+            state.sectionObserver = null;
+        }
+        resetMath();
         elements.chapterContent.innerHTML = '<div class="loading">Loading chapter...</div>';
         
-        // Fetch chapter content with cache-busting parameter
+        // Update state
+        state.currentChapterIndex = index;
+        
+        // Update URL
+        history.pushState({ chapterId, index }, '', `#${chapterId}`);
+        
+        // Update active chapter in sidebar
+        updateActiveChapter(chapterId);
+        
+        // Update navigation buttons
+        updateNavigationButtons();
+        
+        // Long chapters come in sections when the build wrote a section index
         const cacheBuster = Date.now();
+        const sections = await fetchSectionIndex(chapterId, cacheBuster);
+        if (state.currentChapterIndex !== index) return;
+        if (sections) {
+            elements.chapterContent.parentElement.scrollTop = 0;
+            await renderSections(chapterId, sections, cacheBuster);
+            hideLoading();
+            return;
+        }
+        
+        // Otherwise fetch the whole chapter page
         const response = await fetch(`/chapters/deeptech/${chapterId}.html?v=${cacheBuster}`);
         if (!response.ok) throw new Error('Chapter not found');
         
         const html = await response.text();
+        if (state.currentChapterIndex !== index) return;
         
         // Extract content from HTML
         const parser = new DOMParser();
         const doc = parser.parseFromString(html, 'text/html');
         const mainContent = doc.querySelector('main') || doc.body;
         
-        // Fix relative image paths - convert ../diagrams/ to /chapters/diagrams/
-        const images = mainContent.querySelectorAll('img[src^="../diagrams/"]');
-        images.forEach(img => {
-            const oldSrc = img.getAttribute('src');
-            const newSrc = oldSrc.replace('../diagrams/', '/chapters/diagrams/');
-            img.setAttribute('src', newSrc);
-        });
+        fixDiagramPaths(mainContent);
         
         // Update content
         elements.chapterContent.innerHTML = mainContent.innerHTML;
         
-        // Update state
-        state.currentChapterIndex = index;
-        
-        // Update URL
-        history.pushState({ chapterId, index }, '', `#${chapterId}`);
-        
-        // Update active chapter in sidebar
-        updateActiveChapter(chapterId);
-        
-        // Update navigation buttons
-        updateNavigationButtons();
-        
         // Scroll to top
         elements.chapterContent.parentElement.scrollTop = 0;
         
         // Generate chapter TOC
         generateChapterToc();
         
-        // Wait a bit for DOM to settle, then render math
-        setTimeout(() => {
-            if (window.MathJax && window.MathJax.typesetPromise) {
-                window.MathJax.typesetPromise([elements.chapterContent]).then(() => {
-                    console.log('MathJax rendering complete');
-                    hideLoading();
-                }).catch(err => {
-                    console.error('MathJax error:', err);
-                    hideLoading();
-                });
-            } else {
-                console.warn('MathJax not ready yet');
-                hideLoading();
-            }
-        }, 100);
+        // The chapter can be read now; math is typeset from the top screen down
+        hideLoading();
+        watchMath(elements.chapterContent);
         
     } catch (error) {
         console.error('Failed to load chapter:', error);